@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+End to end accept/merge/tally throughput benchmark.
+
+Run with '--help' for usage information.
+"""
+
+# Standard imports
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Project imports
+from vtp.core.ballot import Ballot
+from vtp.core.common import Globals
+from vtp.ops.accept_ballot_operation import AcceptBallotOperation
+from vtp.ops.cast_ballot_operation import CastBallotOperation
+from vtp.ops.merge_contests_operation import MergeContestsOperation
+from vtp.ops.operation import Operation
+from vtp.ops.setup_vtp_demo_operation import SetupVtpDemoOperation
+from vtp.ops.tally_contests_operation import TallyContestsOperation
+
+# The git commands that are timed as the commit and push phases
+GIT_PHASES = {
+    "add": "commit",
+    "checkout": "commit",
+    "commit": "commit",
+    "fast-import": "commit",
+    "push": "push",
+}
+
+
+def parse_arguments():
+    """Parse arguments from a command line"""
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="""
+Will stand up a local bare ElectionData remote plus N scanner clones
+and a server clone (via setup-vtp-demo in a scratch directory), then
+drive cast-ballot/accept-ballot in N parallel scanner processes at a
+configurable rate while the server clone periodically runs
+merge-contests.  After the scanners finish, the remaining contests are
+flushed and tallied.
+
+Reports the accepted ballots per second, the latency percentiles of
+the accept, commit, push, merge, and tally phases, and the growth of
+the bare remote.  Note - the bare remote is cloned from the origin of
+the --election_data workspace, just as setup-vtp-demo does.
+""",
+    )
+    parser.add_argument(
+        "-e",
+        "--election_data",
+        dest="election_data_dir",
+        default=".",
+        help="the ElectionData workspace to clone (default is the current directory)",
+    )
+    parser.add_argument(
+        "--location",
+        default="",
+        help="an empty directory to set up in (default is a new temporary directory)",
+    )
+    parser.add_argument(
+        "--scanners",
+        type=int,
+        default=2,
+        help="the number of scanner processes (default 2)",
+    )
+    parser.add_argument(
+        "--ballots",
+        type=int,
+        default=20,
+        help="the number of ballots each scanner accepts (default 20)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.0,
+        help="the ballots per second per scanner (default 0 - as fast as possible)",
+    )
+    parser.add_argument(
+        "--merge_interval",
+        type=float,
+        default=5.0,
+        help="the seconds between the server merge passes (default 5)",
+    )
+    parser.add_argument(
+        "--minimum_cast_cache",
+        type=int,
+        default=10,
+        help="the minimum_cast_cache of the server merge passes (default 10)",
+    )
+    parser.add_argument(
+        "--fast_import",
+        action="store_true",
+        help="accept the ballots via git fast-import",
+    )
+    parser.add_argument(
+        "--atomic_push",
+        action="store_true",
+        help="push each ballot's branches in one atomic push",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=1,
+        help="the random seed of the cast ballots (default 1)",
+    )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="do not delete the --location directory afterwards",
+    )
+    return parser.parse_args()
+
+
+def timed(operation_class):
+    """
+    Return a subclass of operation_class whose shell_out records the
+    seconds spent in the GIT_PHASES git commands into self.phases.
+    """
+
+    # pylint: disable=too-few-public-methods
+    class TimedOperation(operation_class):
+        """An operation_class that times its git commands"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.phases = {}
+
+        def shell_out(self, argv: list, *args, **kwargs):
+            """Time and run the shell command"""
+            phase = GIT_PHASES.get(argv[1]) if argv[0] == "git" else None
+            start = time.perf_counter()
+            try:
+                return super().shell_out(argv, *args, **kwargs)
+            finally:
+                if phase:
+                    self.phases[phase] = (
+                        self.phases.get(phase, 0.0) + time.perf_counter() - start
+                    )
+
+    return TimedOperation
+
+
+def get_blank_ballots(workspace: str) -> list:
+    """Return the blank ballots of the workspace (see scanner_mockup)"""
+    blank_ballots = []
+    for dirpath, _, files in os.walk(workspace):
+        for filename in files:
+            if filename.endswith(",ballot.json") and dirpath.endswith(
+                "blank-ballots/json"
+            ):
+                blank_ballots.append(os.path.join(dirpath, filename))
+    if not blank_ballots:
+        raise ValueError(f"found no blank ballots in {workspace}")
+    return sorted(blank_ballots)
+
+
+def setup_job(election_data_dir: str, location: str, scanners: int) -> str:
+    """
+    Run setup-vtp-demo and return the path of the bare remote.  Note -
+    the CWD and the git environment variables are process wide, so
+    this runs in its own process as do the scanners.
+    """
+    setup = SetupVtpDemoOperation(election_data_dir=election_data_dir, verbosity=2)
+    setup.run(scanners=scanners, location=location)
+    return setup.tabulation_local_upstream_absdir
+
+
+def scanner_job(workspace: str, scanner: int, args) -> dict:
+    """
+    The ProcessPoolExecutor worker of one scanner - casts and accepts
+    args.ballots ballots in its own workspace and returns the per
+    ballot phase latencies.
+    """
+    random.seed(args.seed + scanner)
+    blank_ballots = get_blank_ballots(workspace)
+    latencies = {"accept": [], "commit": [], "push": []}
+    interval = 1.0 / args.rate if args.rate else 0.0
+    start = time.perf_counter()
+    for count in range(args.ballots):
+        # Pace the scanner
+        delay = start + count * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        blank_ballot = random.choice(blank_ballots)
+        CastBallotOperation(
+            election_data_dir=workspace, verbosity=0, stdout_printing=False
+        ).run(blank_ballot=blank_ballot, demo_mode=True)
+        accept_ballot = timed(AcceptBallotOperation)(
+            election_data_dir=workspace, verbosity=0, stdout_printing=False
+        )
+        accept_start = time.perf_counter()
+        accept_ballot.run(
+            cast_ballot=Ballot.get_cast_from_blank(blank_ballot),
+            fast_import=args.fast_import,
+            atomic_push=args.atomic_push,
+        )
+        latencies["accept"].append(time.perf_counter() - accept_start)
+        for phase in ["commit", "push"]:
+            latencies[phase].append(accept_ballot.phases.get(phase, 0.0))
+    latencies["seconds"] = time.perf_counter() - start
+    return latencies
+
+
+def run_merge(workspace: str, **kwargs) -> float:
+    """Run one (remote) merge-contests pass and return its seconds"""
+    start = time.perf_counter()
+    MergeContestsOperation(
+        election_data_dir=workspace, verbosity=0, stdout_printing=False
+    ).run(remote=True, **kwargs)
+    return time.perf_counter() - start
+
+
+def get_repo_size(operation: Operation, bare_repo: str) -> dict:
+    """Return the object count, KiB on disk, and ref count of a repo"""
+    with operation.changed_cwd(bare_repo):
+        counts = dict(
+            line.split(": ")
+            for line in operation.shell_out(
+                ["git", "count-objects", "-v"],
+                incoming_printlevel=5,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.splitlines()
+        )
+        refs = operation.shell_out(
+            ["git", "for-each-ref", "--format=%(refname)"],
+            incoming_printlevel=5,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.splitlines()
+    return {
+        "objects": int(counts["count"]) + int(counts["in-pack"]),
+        "kib": int(counts["size"]) + int(counts["size-pack"]),
+        "refs": len(refs),
+    }
+
+
+def percentiles(values: list) -> str:
+    """Return the p50/p90/p99/max of a list of seconds as a string"""
+    if not values:
+        return "-"
+    if len(values) == 1:
+        cuts = values * 99
+    else:
+        cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return (
+        f"{cuts[49]:8.3f} {cuts[89]:8.3f} {cuts[98]:8.3f} {max(values):8.3f}"
+        f"   (n={len(values)})"
+    )
+
+
+# pylint: disable=too-many-locals
+def main():
+    """Entry point of the end to end benchmark"""
+    args = parse_arguments()
+    election_data_dir = os.path.realpath(args.election_data_dir)
+    location = args.location if args.location else tempfile.mkdtemp(prefix="vtp-")
+    location = os.path.realpath(location)
+    # The setup and the scanners run in their own processes - see
+    # setup_job
+    mp_context = multiprocessing.get_context("spawn")
+    operation = Operation(election_data_dir=location)
+    try:
+        # Stand up the bare remote and the client workspaces
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+            bare_repo = executor.submit(
+                setup_job, election_data_dir, location, args.scanners
+            ).result()
+        clients = os.path.join(location, Globals.get("MOCK_CLIENT_DIRNAME"))
+        workspace_name = os.path.basename(bare_repo).removesuffix(".git")
+        scanners = [
+            os.path.join(clients, f"scanner.{count:02d}", workspace_name)
+            for count in range(args.scanners)
+        ]
+        server = os.path.join(clients, "server", workspace_name)
+        size_before = get_repo_size(operation, bare_repo)
+
+        # Run the scanners while the server merges
+        merges = []
+        start = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=args.scanners, mp_context=mp_context
+        ) as executor:
+            futures = [
+                executor.submit(scanner_job, workspace, count, args)
+                for count, workspace in enumerate(scanners)
+            ]
+            while not all(future.done() for future in futures):
+                time.sleep(args.merge_interval)
+                merges.append(
+                    run_merge(server, minimum_cast_cache=args.minimum_cast_cache)
+                )
+            results = [future.result() for future in futures]
+        accept_seconds = time.perf_counter() - start
+        flush_seconds = run_merge(server, flush=True)
+        tally_start = time.perf_counter()
+        TallyContestsOperation(
+            election_data_dir=server, verbosity=0, stdout_printing=False
+        ).run()
+        tally_seconds = time.perf_counter() - tally_start
+        size_after = get_repo_size(operation, bare_repo)
+    finally:
+        if not args.keep and not args.location:
+            shutil.rmtree(location, ignore_errors=True)
+
+    # Report
+    ballots = args.scanners * args.ballots
+    print(
+        f"{ballots} ballots from {args.scanners} scanners in {accept_seconds:.2f}s "
+        f"= {ballots / accept_seconds:.2f} ballots/s"
+    )
+    print(f"{'phase':<8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}   (seconds)")
+    for phase in ["accept", "commit", "push"]:
+        print(
+            f"{phase:<8} "
+            + percentiles([value for result in results for value in result[phase]])
+        )
+    print(f"{'merge':<8} " + percentiles(merges))
+    print(f"{'flush':<8} " + percentiles([flush_seconds]))
+    print(f"{'tally':<8} " + percentiles([tally_seconds]))
+    for name in ["objects", "kib", "refs"]:
+        growth = size_after[name] - size_before[name]
+        print(
+            f"remote {name:<8} {size_before[name]:>9} -> {size_after[name]:>9} "
+            f"({growth / ballots:.1f} per ballot)"
+        )
+    if args.keep or args.location:
+        print(f"The workspaces are in {location}")
+
+
+# If called directly via this file
+if __name__ == "__main__":
+    main()
+
+# EOF
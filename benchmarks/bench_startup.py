@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+CLI startup benchmark - the import time of the vtp.cli entry points.
+
+Run with '--help' for usage information.  Nominally run via 'make
+benchmark'.
+"""
+
+# Standard imports
+import argparse
+import pkgutil
+import statistics
+import subprocess
+import sys
+import time
+
+# Project imports
+import vtp.cli
+
+# The (slow to import) third party modules that the CLI entry points
+# should only import lazily, when actually needed
+HEAVY_MODULES = ["deepdiff", "networkx", "pyinputplus", "qrcode", "yaml"]
+
+# What the child python prints - the heavy modules it ended up importing
+CHILD_SCRIPT = """
+import sys
+import {module}
+print(",".join(sorted(set(sys.modules) & set({heavy}))))
+"""
+
+
+def parse_arguments():
+    """Parse arguments from a command line"""
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="""
+Will time, in fresh python processes, the import of each vtp.cli entry
+point module (which is what every '<command> --help' pays before
+argparse runs) and report the median and minimum over --repeat runs
+less the startup time of a bare python interpreter.  Also reports
+which of the heavy third party modules (deepdiff, networkx,
+pyinputplus, qrcode, yaml) each entry point imports - they should all
+be imported lazily.
+
+Exits non zero if any entry point imports a heavy module or if its
+median import time exceeds --budget milliseconds.
+""",
+    )
+    parser.add_argument(
+        "--commands",
+        default="",
+        help="comma separated list of vtp.cli modules (default all of them)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=7,
+        help="the number of timed runs per entry point (default 7)",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=150.0,
+        help="the median import time budget in milliseconds (default 150)",
+    )
+    parsed_args = parser.parse_args()
+    if parsed_args.commands:
+        parsed_args.commands = parsed_args.commands.split(",")
+    else:
+        parsed_args.commands = [
+            module.name
+            for module in pkgutil.iter_modules(vtp.cli.__path__)
+            if not module.name.startswith("_")
+        ]
+    if parsed_args.repeat < 1:
+        raise ValueError("--repeat must be at least 1")
+    return parsed_args
+
+
+def time_child(script: str) -> tuple:
+    """Run script in a fresh python and return (seconds, stdout)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return time.perf_counter() - start, result.stdout.strip()
+
+
+def main():
+    """Entry point of the startup benchmark"""
+    args = parse_arguments()
+    # The bare interpreter startup, subtracted from each measurement
+    baseline = min(time_child("pass")[0] for _ in range(args.repeat))
+    print(f"python startup {baseline * 1000:.1f} ms (subtracted below)")
+    print(f"{'command':<28} {'median ms':>9} {'min ms':>7}  heavy imports")
+    failed = False
+    for command in args.commands:
+        script = CHILD_SCRIPT.format(module=f"vtp.cli.{command}", heavy=HEAVY_MODULES)
+        # Warm the byte code cache first
+        time_child(script)
+        runs = [time_child(script) for _ in range(args.repeat)]
+        seconds = [run[0] - baseline for run in runs]
+        heavy = runs[-1][1]
+        median = statistics.median(seconds) * 1000
+        over = median > args.budget
+        failed = failed or over or bool(heavy)
+        print(
+            f"{command:<28} {median:>9.1f} {min(seconds) * 1000:>7.1f}  "
+            f"{heavy or '-'}{'  OVER BUDGET' if over else ''}"
+        )
+    if failed:
+        sys.exit(1)
+
+
+# If called directly via this file
+if __name__ == "__main__":
+    main()
+
+# EOF
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Tally benchmarks - synthetic CVR batches straight into Tally.tallyho.
+
+Run with '--help' for usage information.  Nominally run via 'make
+benchmark'.
+"""
+
+# Standard imports
+import argparse
+import gc
+import os
+import random
+import time
+import tracemalloc
+
+# Project imports
+from vtp.core.tally import Tally
+from vtp.ops.operation import Operation
+
+# The synthetic contests - see gen_contest_batch
+SCENARIOS = ["plurality", "multi-plurality", "rcv", "rcv-exhausted", "rcv-ties"]
+
+
+def parse_arguments():
+    """Parse arguments from a command line"""
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="""
+Will generate synthetic CVR batches, in the same {"digest", "contestCVR"}
+form that tally-contests reads from git, and time Tally.tallyho on
+them.  Reports the ballots per second and the (tracemalloc) peak
+memory allocated while tallying for each scenario and size.  Since no
+git is involved this isolates the performance of vtp.core.tally.
+
+The scenarios are:
+  plurality       - a single selection plurality contest
+  multi-plurality - a plurality contest with max_selections of 3
+  rcv             - a RCV contest with rankings of random depth
+  rcv-exhausted   - a RCV contest where --exhausted_rate of the ballots
+                    only rank one choice (and so exhaust after a round)
+  rcv-ties        - a RCV contest engineered to have a last place tie
+""",
+    )
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"comma separated list of scenarios (default {','.join(SCENARIOS)})",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000,1000000",
+        help="comma separated list of ballot counts (default 10000,100000,1000000)",
+    )
+    parser.add_argument(
+        "--choices",
+        type=int,
+        default=8,
+        help="the number of choices per contest (default 8)",
+    )
+    parser.add_argument(
+        "--exhausted_rate",
+        type=float,
+        default=0.3,
+        help="the fraction of rcv-exhausted ballots that rank only one choice",
+    )
+    parser.add_argument(
+        "--blank_rate",
+        type=float,
+        default=0.02,
+        help="the fraction of blank ballots in every scenario (default 0.02)",
+    )
+    parser.add_argument(
+        "--rcv_engine",
+        choices=["classic", "encoded"],
+        default="classic",
+        help="the Tally RCV engine to benchmark (default classic)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=1,
+        help="the random seed of the generators (default 1)",
+    )
+    parser.add_argument(
+        "--no_memory",
+        action="store_true",
+        help="skip the (slower) tracemalloc peak memory pass",
+    )
+    parsed_args = parser.parse_args()
+    parsed_args.scenarios = parsed_args.scenarios.split(",")
+    for scenario in parsed_args.scenarios:
+        if scenario not in SCENARIOS:
+            raise ValueError(f"unknown scenario ({scenario}) - see --help")
+    parsed_args.sizes = [int(size) for size in parsed_args.sizes.split(",")]
+    if parsed_args.choices < 3:
+        raise ValueError("--choices must be at least 3")
+    return parsed_args
+
+
+def gen_contest(scenario: str, choices: int) -> dict:
+    """Return the (blank) contestCVR of a scenario"""
+    rcv = scenario.startswith("rcv")
+    return {
+        "choices": [{"name": f"Choice {offset}"} for offset in range(choices)],
+        "contest_name": f"Benchmark {scenario}",
+        "contest_type": "candidate",
+        "election_upstream_remote": "https://github.com/TrustTheVote-Project/",
+        "ggo": ".",
+        "max_selections": (
+            choices if rcv else (3 if scenario == "multi-plurality" else 1)
+        ),
+        "selection": [],
+        "tally": "rcv" if rcv else "plurality",
+        "uid": "0000",
+        "win_by": "0.5",
+    }
+
+
+# pylint: disable=too-many-arguments
+def gen_selection(
+    scenario: str, contest: dict, rng: random.Random, args, ballot: int, ties: list
+) -> list:
+    """Return the random selection of the ballot'th synthetic ballot"""
+    choices = len(contest["choices"])
+    if scenario == "rcv-ties":
+        # The first choices cycle through the ties pattern (and there
+        # are no blanks) so that the round 0 counts tie exactly
+        first = ties[ballot % len(ties)]
+        rest = [offset for offset in range(choices) if offset != first]
+        picks = [first] + rng.sample(rest, rng.randint(0, choices - 1))
+        return [f"{pick}: {contest['choices'][pick]['name']}" for pick in picks]
+    if rng.random() < args.blank_rate:
+        return []
+    # A linear preference bias so that the RCV contests take several rounds
+    weights = [choices - offset for offset in range(choices)]
+    if scenario == "plurality":
+        picks = rng.choices(range(choices), weights)
+    elif scenario == "multi-plurality":
+        picks = list(dict.fromkeys(rng.choices(range(choices), weights, k=3)))
+    elif scenario == "rcv-exhausted" and rng.random() < args.exhausted_rate:
+        picks = rng.choices(range(choices), weights)
+    else:
+        picks = rng.sample(range(choices), rng.randint(1, choices))
+    return [f"{pick}: {contest['choices'][pick]['name']}" for pick in picks]
+
+
+def gen_contest_batch(scenario: str, size: int, args) -> list:
+    """
+    Return a contest batch of size synthetic CVRs - a list of
+    {"digest": ..., "contestCVR": ...} dictionaries as returned by
+    Operation.cvr_parse_git_log_output with grouped_by_uid.
+    """
+    rng = random.Random(args.seed)
+    contest = gen_contest(scenario, args.choices)
+    # The rcv-ties first choice pattern - the last two choices get the
+    # same (lowest) number of first choice votes
+    ties = [
+        offset
+        for offset in range(args.choices)
+        for _ in range(max(args.choices - offset, 2))
+    ]
+    return [
+        {
+            "digest": f"{rng.getrandbits(160):040x}",
+            "contestCVR": dict(
+                contest,
+                selection=gen_selection(scenario, contest, rng, args, ballot, ties),
+            ),
+        }
+        for ballot in range(size)
+    ]
+
+
+def run_tally(contest_batch: list, operation: Operation, rcv_engine: str) -> Tally:
+    """Tally (and drop the printed output of) a contest batch"""
+    the_tally = Tally(contest_batch[0], operation, rcv_engine=rcv_engine)
+    the_tally.tallyho(contest_batch, [])
+    operation.output_sink.clear()
+    return the_tally
+
+
+def main():
+    """Entry point of the tally benchmarks"""
+    args = parse_arguments()
+    operation = Operation(election_data_dir=os.getcwd(), stdout_printing=False)
+    print(
+        f"{'scenario':<16} {'ballots':>9} {'rounds':>6} {'seconds':>8} "
+        f"{'ballots/s':>10} {'peak MiB':>9}"
+    )
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            # The tally modifies the RCV selections, so generate a
+            # fresh batch for each pass
+            contest_batch = gen_contest_batch(scenario, size, args)
+            gc.collect()
+            start = time.perf_counter()
+            the_tally = run_tally(contest_batch, operation, args.rcv_engine)
+            seconds = time.perf_counter() - start
+            peak = "-"
+            if not args.no_memory:
+                contest_batch = gen_contest_batch(scenario, size, args)
+                gc.collect()
+                tracemalloc.start()
+                run_tally(contest_batch, operation, args.rcv_engine)
+                peak = f"{tracemalloc.get_traced_memory()[1] / 2**20:.1f}"
+                tracemalloc.stop()
+            del contest_batch
+            print(
+                f"{scenario:<16} {size:>9} {len(the_tally.get('rcv_round')) - 1:>6} "
+                f"{seconds:>8.2f} {size / seconds:>10.0f} {peak:>9}"
+            )
+
+
+# If called directly via this file
+if __name__ == "__main__":
+    main()
+
+# EOF
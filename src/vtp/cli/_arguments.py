@@ -117,6 +117,22 @@ class Arguments:
             help="will printonly and not write to disk (def=True)",
         )
 
+    @staticmethod
+    def add_profile(parser):
+        """Add the (opt-in) instrumentation profile options"""
+        parser.add_argument(
+            "--profile",
+            choices=["json", "table", "prometheus"],
+            default="",
+            help="time the operation and write its profile in this format",
+        )
+        parser.add_argument(
+            "--profile_file",
+            default="",
+            help="write the --profile to this file instead of to STDERR "
+            "(e.g. a node_exporter textfile collector .prom file)",
+        )
+
     @staticmethod
     def add_verbosity(parser, verbosity=Globals.get("DEFAULT_VERBOSITY")):
         """Add verbosity option"""
@@ -61,7 +61,20 @@ Either the location of the ballot_file or the associated address is required.
         action="store_true",
         help="when set will capture and version the ballot receipts",
     )
+    parser.add_argument(
+        "--fast_import",
+        action="store_true",
+        help="create the contest (and receipt) commits via git fast-import "
+        "without touching the working tree",
+    )
+    parser.add_argument(
+        "--atomic_push",
+        action="store_true",
+        help="push all of the ballot's branches with a single atomic push "
+        "(implies --fast_import)",
+    )
     Arguments.add_merge_contests(parser)
+    Arguments.add_profile(parser)
     Arguments.add_verbosity(parser)
     Arguments.add_printonly(parser)
     return parser.parse_args()
@@ -88,12 +101,17 @@ def main():
         verbosity=parsed_args.verbosity,
         printonly=parsed_args.printonly,
     )
+    if parsed_args.profile:
+        abo.enable_instrumentation()
     abo.run(
         an_address=an_address,
         cast_ballot=parsed_args.cast_ballot,
         merge_contests=parsed_args.merge_contests,
         version_receipts=parsed_args.version_receipts,
+        fast_import=parsed_args.fast_import,
+        atomic_push=parsed_args.atomic_push,
     )
+    abo.write_instrumentation(parsed_args.profile, parsed_args.profile_file)
 
 
 # If called directly via this file
@@ -67,6 +67,14 @@ branch.
         action="store_true",
         help="will merge remote branches instead of local branches",
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=0,
+        help="merge the contest branches this many at a time with one push "
+        "of main per batch (default 0 - one push per branch)",
+    )
+    Arguments.add_profile(parser)
     Arguments.add_verbosity(parser)
     Arguments.add_printonly(parser)
     return parser.parse_args()
@@ -85,12 +93,16 @@ def main():
         verbosity=parsed_args.verbosity,
         printonly=parsed_args.printonly,
     )
+    if parsed_args.profile:
+        mco.enable_instrumentation()
     mco.run(
         branch=parsed_args.branch,
         flush=parsed_args.flush,
         remote=parsed_args.remote,
         minimum_cast_cache=parsed_args.minimum_cast_cache,
+        batch_size=parsed_args.batch_size,
     )
+    mco.write_instrumentation(parsed_args.profile, parsed_args.profile_file)
 
 
 # If called directly via this file
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Command line script to run the long running CVR contest merge service.
+
+Run with '--help' for usage information.
+"""
+
+# Standard imports
+import argparse
+import signal
+import threading
+
+# Project imports
+from vtp.core.common import Globals
+from vtp.ops.merge_daemon_operation import MergeDaemonOperation
+
+# Local imports
+from ._arguments import Arguments
+
+
+def parse_arguments():
+    """Parse arguments from a command line or from the constructor"""
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="""
+Will run a long running merge service on a VTP server node which
+merges the pending (remote) CVR contest branches into the main git
+branch as soon as a contest has more than the minimum_cast_cache
+pending branches.
+
+By default the daemon polls the remote CVR refs (a single 'git
+ls-remote') every --poll_interval seconds and only pulls and merges
+when they changed.  Alternatively, with --fifo, the daemon waits for
+the post-receive hook of the remote to write to the FIFO.  If the
+remote is a local (bare) repo, --install_hook will create the FIFO
+and install the hook.
+
+The ElectionData configuration and the pending branch index are kept
+in memory.  The queue depth (per contest and total) and the merge
+latency (how long a CVR branch was pending) metrics are printed each
+merge pass and, with --metrics_file, written there as JSON.
+
+The daemon runs until interrupted (SIGINT or SIGTERM), finishing the
+current merge pass first.  Supplying -f will then flush all remaining
+contests to the main branch.
+""",
+    )
+    Arguments.add_election_data_dir(parser)
+    Arguments.add_minimum_cast_cache(parser)
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=0,
+        help="merge the contest branches this many at a time with one push "
+        "of main per batch (default 0 - one push per branch)",
+    )
+    parser.add_argument(
+        "--fifo",
+        default="",
+        help="wait on this FIFO (written by the remote post-receive hook) "
+        "instead of polling the remote",
+    )
+    parser.add_argument(
+        "--install_hook",
+        action="store_true",
+        help="create the --fifo and install the post-receive hook in the "
+        "(local) origin remote",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=Globals.get("MERGE_DAEMON_POLL_INTERVAL"),
+        help="the seconds between checks of the remote "
+        f"(default {Globals.get('MERGE_DAEMON_POLL_INTERVAL')})",
+    )
+    parser.add_argument(
+        "--metrics_file",
+        default="",
+        help="write the queue depth and merge latency metrics as JSON to this file",
+    )
+    parser.add_argument(
+        "-f",
+        "--flush",
+        action="store_true",
+        help="will flush the remaining unmerged contest branches on exit",
+    )
+    Arguments.add_verbosity(parser)
+    Arguments.add_printonly(parser)
+    parsed_args = parser.parse_args()
+    if parsed_args.install_hook and not parsed_args.fifo:
+        raise ValueError("--install_hook requires --fifo")
+    return parsed_args
+
+
+# pylint: disable=duplicate-code
+def main():
+    """Entry point for 'merge-daemon'."""
+
+    # Parse args
+    parsed_args = parse_arguments()
+
+    # Stop (after the current merge pass) on SIGINT or SIGTERM
+    stop_event = threading.Event()
+    for signum in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(signum, lambda *_: stop_event.set())
+
+    # do it
+    mdo = MergeDaemonOperation(
+        election_data_dir=parsed_args.election_data_dir,
+        verbosity=parsed_args.verbosity,
+        printonly=parsed_args.printonly,
+    )
+    mdo.run(
+        minimum_cast_cache=parsed_args.minimum_cast_cache,
+        batch_size=parsed_args.batch_size,
+        fifo=parsed_args.fifo,
+        install_hook=parsed_args.install_hook,
+        poll_interval=parsed_args.poll_interval,
+        metrics_file=parsed_args.metrics_file,
+        flush_on_exit=parsed_args.flush,
+        stop_event=stop_event,
+    )
+
+
+# If called directly via this file
+if __name__ == "__main__":
+    main()
@@ -49,10 +49,13 @@ configured).
 When "-d scanner" is supplied, run_mock_election.py will randomly
 cast and scan ballots.
 
-When "-d server" is supplied, run_mock_election.py will
-synchronously run the merge_contests.py program which will once
-every 10 seconds.  Note that nominally 100 contgests need to have
-been pushed for merge_contests.py to merge in a contest into the
+When "-d server" is supplied, run_mock_election.py will run the
+merge-daemon which merges as soon as contests are pushed, for
+--iterations daemon wake-ups.  The daemon wakes up each time contests
+are pushed and otherwise every poll interval (a second by default),
+so an idle server exits after roughly --iterations seconds.  Note
+that nominally 100 contgests need to
+have been pushed for merge_contests.py to merge in a contest into the
 main branch without the --flush_mode option.
 
 If "-d both" is supplied, run_mock_election.py will run a single
@@ -60,6 +63,12 @@ scanner N iterations while also calling the server function.  If
 --flush_mode is set to 1 or 2, run_mock_election.py will then
 flush the ballot cache before printing the tallies and exiting.
 
+If "-d both" and "--scanners N" are supplied, run_mock_election.py
+will instead run N scanners in parallel processes, each in its own
+setup-vtp-demo mock-clients/scanner.NN workspace, while a server
+process merges in the mock-clients/server workspace until all the
+scanners are done.  The aggregate stats are printed at the end.
+
 By default run_mock_election.py will loop over all available blank
 ballots found withint the ElectionData tree.  However, either a
 specific blank ballot or an address can be specified to limit the
@@ -96,7 +105,7 @@ mock to a single ballot N times.
         "--iterations",
         type=int,
         default=10,
-        help="the number of blank ballots to cast or merges-to-main to perform (def=10)",
+        help="the number of blank ballots to cast or merge daemon wake-ups to run (def=10)",
     )
     parser.add_argument(
         "-u",
@@ -105,6 +114,12 @@ mock to a single ballot N times.
         default=0,
         help="if supplied, will run for that number of minutes - overrides iterations",
     )
+    parser.add_argument(
+        "--scanners",
+        type=int,
+        default=0,
+        help="with '-d both', the number of parallel mock scanners to run",
+    )
     Arguments.add_verbosity(parser)
     Arguments.add_printonly(parser)
     parsed_args = parser.parse_args()
@@ -152,6 +167,7 @@ def main():
         flush_mode=parsed_args.flush_mode,
         iterations=parsed_args.iterations,
         duration=parsed_args.duration,
+        scanners=parsed_args.scanners,
     )
 
 
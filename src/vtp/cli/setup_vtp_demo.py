@@ -60,6 +60,14 @@ storage idiom.
 If the --guid_client_store option is set, instead of setting up the
 demo this script will create a new GUID based FASTapi clone and return
 the GUID.
+
+With --guid_clone_mode shared, the GUID based clones are created with
+'git clone --shared' and so borrow the objects of the tabulation
+server bare repo instead of copying them, which keeps the time and
+disk space of a new clone independent of the size of the election.
+With --guid_pool_size N, N GUID based clones are pre-provisioned (in
+setup mode) and a --guid_client_store invocation hands out one of them
+by renaming it and then refills the pool.
 """,
     )
     Arguments.add_election_data_dir(parser)
@@ -76,6 +84,18 @@ the GUID.
         action="store_true",
         help="if set will create a single GUID based ballot-store and return the GUID",
     )
+    parser.add_argument(
+        "--guid_clone_mode",
+        choices=["full", "shared"],
+        default="full",
+        help="how the GUID based ballot-stores are cloned (def=full)",
+    )
+    parser.add_argument(
+        "--guid_pool_size",
+        type=int,
+        default=0,
+        help="the number of pre-provisioned GUID based ballot-stores (def=0)",
+    )
     parser.add_argument(
         "-l",
         "--location",
@@ -126,6 +146,8 @@ def main():
         scanners=parsed_args.scanners,
         guid_client_store=parsed_args.guid_client_store,
         location=parsed_args.location,
+        guid_clone_mode=parsed_args.guid_clone_mode,
+        guid_pool_size=parsed_args.guid_pool_size,
     )
     if parsed_args.guid_client_store:
         print(guid)
@@ -68,6 +68,32 @@ tallying across git submodules/repos.
         default="",
         help="a comma separated list of contests checks to track",
     )
+    parser.add_argument(
+        "-r",
+        "--rebuild_cvr_index",
+        action="store_true",
+        help="rebuild the on disk CVR index from the entire main branch history",
+    )
+    parser.add_argument(
+        "-s",
+        "--streaming",
+        action="store_true",
+        help="only count the contests merged since the last streaming tally",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="tally the contests in this many processes (default 1, not with -s)",
+    )
+    parser.add_argument(
+        "--rcv_engine",
+        choices=["classic", "encoded"],
+        default="classic",
+        help="how to run the RCV rounds - 'encoded' only visits the recast ballots",
+    )
+    Arguments.add_profile(parser)
     Arguments.add_output_style(parser)
     Arguments.add_verbosity(parser)
     parsed_args = parser.parse_args()
@@ -99,10 +125,17 @@ def main():
         verbosity=parsed_args.verbosity,
         printonly=False,
     )
+    if parsed_args.profile:
+        tco.enable_instrumentation()
     tco.run(
         contest_uid=parsed_args.contest_uid,
         track_contests=parsed_args.track_contests,
+        rebuild_cvr_index=parsed_args.rebuild_cvr_index,
+        streaming=parsed_args.streaming,
+        jobs=parsed_args.jobs,
+        rcv_engine=parsed_args.rcv_engine,
     )
+    tco.write_instrumentation(parsed_args.profile, parsed_args.profile_file)
 
 
 # If called directly via this file
@@ -201,28 +201,22 @@ class Address:
         will assume that the list is correct and will set the
         active_ggos field to that.
         """
-        footsteps = set()
         addr_hits = []
 
         def walk_descendants(node_of_interest):
-            """Will find all descendantss of this node"""
-            # pylint: disable=too-many-nested-blocks
-            if "unique-ballots" in config.node(node_of_interest)["address_map"]:
-                for entry in config.node(node_of_interest)["address_map"][
-                    "unique-ballots"
-                ]:
-                    for addr in entry["addresses"]:
-                        if self.match(addr):
-                            # add the ggos in order if not already present
-                            for ggo in entry["ggos"]:
-                                if ggo not in self.active_ggos:
-                                    self.active_ggos.append(ggo)
-                            addr_hits.append(node_of_interest)
-            footsteps.add(node_of_interest)
-            for child in config.descendants(node_of_interest):
-                if child in footsteps:
-                    continue
-                walk_descendants(child)
+            """Will find the address_map hits of this node and all
+            its descendants.  Rather than matching every address regex
+            of every descendant, the (per election) AddressIndex only
+            matches the ones that can match this address.
+            """
+            for node, ggos in config.get_address_index().lookup(
+                node_of_interest, self.address["number"], self.address["street"]
+            ):
+                # add the ggos in order if not already present
+                for ggo in ggos:
+                    if ggo not in self.active_ggos:
+                        self.active_ggos.append(ggo)
+                addr_hits.append(node)
 
         # Note - the root GGO always contributes
         self.active_ggos.append(".")
@@ -0,0 +1,162 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""An in memory index of the address_map unique-ballots addresses"""
+
+# standard imports
+import re
+import threading
+
+
+class AddressIndex:
+    """
+    A class to map a number and street address onto the matching
+    unique-ballots entries of the address_map.yaml files without
+    regex matching the address against every address pattern of
+    every address_map file below the leaf node of the address.
+
+    The index is built once per (shared) ElectionConfigTree - see
+    ElectionConfig.get_address_index - and holds, per leaf node (the
+    town), the compiled address patterns of the leaf node and all of
+    its descendants.  The patterns are grouped by their literal
+    prefix, which is all that can match an address (the patterns are
+    re.match'ed against '<number> <street>'), so that a lookup only
+    regex matches the patterns whose literal prefix is a prefix of the
+    address.  The patterns without a literal prefix, nominally
+    '.*<street>', are instead filtered on their first literal
+    substring.
+
+    A lookup returns the same matches as walking the DAG and calling
+    Address.match on every pattern, and the matches are in a
+    deterministic order (a depth first walk of the leaf node and its
+    descendants).
+    """
+
+    # The regex characters that end a literal prefix
+    _meta_chars = set(".^$*+?{}[]\\|()")
+
+    @staticmethod
+    def literal_prefix(pattern: str):
+        """
+        Return the (literal, floating) tuple of an address pattern
+        where literal is the literal string that every address matched
+        by the pattern starts with, or if floating is True, contains.
+        An empty literal means that the pattern cannot be indexed and
+        needs to be matched against every address.
+        """
+        # Alternations and inline flags can change the meaning of the
+        # literal part of the pattern - do not try to be clever
+        if "|" in pattern or "(?" in pattern:
+            return "", False
+        # re.match is already anchored at the start of the address
+        pos = 1 if pattern.startswith("^") else 0
+        floating = pattern.startswith(".*", pos)
+        if floating:
+            pos += 2
+        literal = ""
+        while pos < len(pattern) and pattern[pos] not in AddressIndex._meta_chars:
+            literal += pattern[pos]
+            pos += 1
+        # The character before a '*', '?', or '{' quantifier is optional
+        if literal and pos < len(pattern) and pattern[pos] in "*?{":
+            literal = literal[:-1]
+        return literal, floating
+
+    def __init__(self, digraph):
+        """
+        An empty index of the GGO DAG (the DiGraph of the
+        ElectionConfigTree) - the leaf nodes are indexed on their first
+        lookup.
+        """
+        self.digraph = digraph
+        # leaf node -> the indexed patterns of the leaf node - see index_leaf_node
+        self.leaf_nodes = {}
+        self.lock = threading.Lock()
+
+    def index_leaf_node(self, leaf_node: str) -> dict:
+        """
+        Compile and group the address patterns of the leaf node and
+        its descendants.  Each indexed pattern is an (order, regex,
+        node, ggos) tuple where order is the walk order of the pattern.
+        Returns a dictionary with the following keys:
+
+        prefixed - a prefix length -> prefix -> list of patterns map
+        lengths - the sorted prefix lengths of prefixed
+        floating - a list of (substring, pattern) tuples for the patterns
+            without a literal prefix
+        """
+        # pylint: disable=import-outside-toplevel
+        import networkx
+
+        prefixed = {}
+        floating = []
+        order = 0
+        for node in networkx.dfs_preorder_nodes(self.digraph, leaf_node):
+            address_map = self.digraph.nodes[node]["address_map"]
+            for entry in address_map.get("unique-ballots", []):
+                for addr in entry["addresses"]:
+                    indexed = (order, re.compile(addr), node, entry["ggos"])
+                    order += 1
+                    literal, is_floating = AddressIndex.literal_prefix(addr)
+                    if is_floating or not literal:
+                        floating.append((literal, indexed))
+                    else:
+                        prefixed.setdefault(len(literal), {}).setdefault(
+                            literal, []
+                        ).append(indexed)
+        return {
+            "prefixed": prefixed,
+            "lengths": sorted(prefixed),
+            "floating": floating,
+        }
+
+    def lookup(self, leaf_node: str, number: str, street: str) -> list:
+        """
+        Return the ordered list of (node, ggos) tuples, one per
+        address_map address pattern below leaf_node that matches the
+        number and street, where ggos is the unique-ballots ggos list
+        of the pattern.
+        """
+        # Same as Address.match - an address without a number and
+        # street matches nothing
+        if number == "" and street == "":
+            return []
+        leaf_index = self.leaf_nodes.get(leaf_node)
+        if leaf_index is None:
+            with self.lock:
+                leaf_index = self.leaf_nodes.get(leaf_node)
+                if leaf_index is None:
+                    leaf_index = self.index_leaf_node(leaf_node)
+                    self.leaf_nodes[leaf_node] = leaf_index
+        address = number + " " + street
+        candidates = [
+            indexed
+            for length in leaf_index["lengths"]
+            for indexed in leaf_index["prefixed"][length].get(address[:length], [])
+        ]
+        candidates += [
+            indexed
+            for substring, indexed in leaf_index["floating"]
+            if substring in address
+        ]
+        candidates.sort(key=lambda indexed: indexed[0])
+        return [
+            (node, ggos) for _, regex, node, ggos in candidates if regex.match(address)
+        ]
+
+
+# EOF
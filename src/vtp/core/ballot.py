@@ -20,10 +20,11 @@
 import csv
 import json
 import os
+import pickle
+import threading
+from collections import OrderedDict
 from copy import deepcopy
 
-from deepdiff import DeepDiff
-
 # Local imports
 from .common import Globals
 from .contest import Contest
@@ -150,7 +151,8 @@ class Ballot:
         # 0) just for safety
         # Ballot.verify_ballot_outer_keys(self)
 
-        # Get the blank ballot
+        # Get the blank ballot - it is only compared against so it
+        # can be the (frozen) cached one
         the_bb = BlankBallot(self.operation_self)
         the_bb.read_a_blank_ballot(
             None,
@@ -159,6 +161,7 @@ class Ballot:
                 self.ballot_subdir,
                 self.ballot_filename,
             ),
+            frozen=True,
         )
 
         # ... and make a dict out of it
@@ -192,7 +195,11 @@ class Ballot:
         # ballot.  Since the blank ballot needs to be read in, it is
         # easier to add the selection node to that than to make a deep
         # copy of the cast ballot and remove the selection node from
-        # that.
+        # that.  Note - deepdiff is slow to import and only needed
+        # here, so import it lazily.
+        # pylint: disable=import-outside-toplevel
+        from deepdiff import DeepDiff
+
         result = DeepDiff(blank, cast_ballot)
         # import pdb; pdb.set_trace()
         if result:
@@ -341,16 +348,24 @@ class Ballot:
             )
         return ballot_file
 
+    @staticmethod
+    def gen_contest_payload(contest) -> str:
+        """Return the voter's contest CVR json payload as a string"""
+        # Prepend the dictionary with a CVR key
+        the_aggregate = {"contestCVR": contest.get("dict")}
+        return json.dumps(the_aggregate, sort_keys=True, indent=4, ensure_ascii=False)
+
+    @staticmethod
+    def gen_receipt_csv(lines: list) -> str:
+        """Return the voter's ballot receipt csv lines as a string"""
+        return "".join(f"{line}\n" for line in lines)
+
     def write_contest(self, contest, config):
         """Write out the voter's contest"""
         contest_file = Ballot.gen_contest_location(config, self.ballot_subdir)
-        # Prepend the dictionary with a CVR key
-        the_aggregate = {"contestCVR": contest.get("dict")}
         # The parent directory better exist or something is wrong
         with open(contest_file, "w", encoding="utf8") as outfile:
-            json.dump(
-                the_aggregate, outfile, sort_keys=True, indent=4, ensure_ascii=False
-            )
+            outfile.write(Ballot.gen_contest_payload(contest))
         return contest_file
 
     # pylint: disable=too-many-arguments
@@ -385,8 +400,7 @@ class Ballot:
         os.makedirs(os.path.dirname(receipt_file), exist_ok=True)
         # The parent directory better exist or something is wrong
         with open(receipt_file, "w", encoding="utf8") as outfile:
-            for line in lines:
-                outfile.write(f"{line}\n")
+            outfile.write(Ballot.gen_receipt_csv(lines))
         return receipt_file
 
     # pylint: disable=too-many-locals
@@ -473,6 +487,55 @@ class BlankBallot(Ballot):
     methods.
     """
 
+    # The class level LRU cache of the parsed blank ballots keyed on
+    # the absolute ballot file - see get_blank_ballot_json
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    @staticmethod
+    def get_blank_ballot_json(
+        operation_self, ballot_file: str, frozen: bool = False
+    ) -> dict:
+        """
+        Return the parsed json of a blank ballot file.  Since every
+        cast and accepted ballot reads its blank ballot, the parsed
+        blank ballots are kept in a process wide LRU cache of
+        BLANK_BALLOT_CACHE_SIZE entries that is shared by all the
+        operations (and so by all the web-api requests) of the
+        process.  A cache entry is only used while the stat (mtime,
+        size, and inode) of the file is unchanged, so a regenerated
+        or newly checked out blank ballot is read again.
+
+        When frozen is True the cached dictionary itself is returned
+        and the caller must not modify it.  Otherwise the caller gets
+        its own copy (unpickled from the cache, which is cheaper than
+        both re-parsing the json and a deepcopy).
+        """
+        ballot_file = os.path.abspath(ballot_file)
+        stat = os.stat(ballot_file)
+        stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with BlankBallot._cache_lock:
+            entry = BlankBallot._cache.get(ballot_file)
+            if entry and entry[0] == stat_key:
+                BlankBallot._cache.move_to_end(ballot_file)
+        if not entry or entry[0] != stat_key:
+            operation_self.imprimir(f"Reading {ballot_file}", 5)
+            with open(ballot_file, "r", encoding="utf8") as file:
+                json_doc = json.load(file)
+            entry = (
+                stat_key,
+                json_doc,
+                pickle.dumps(json_doc, protocol=pickle.HIGHEST_PROTOCOL),
+            )
+            with BlankBallot._cache_lock:
+                BlankBallot._cache[ballot_file] = entry
+                BlankBallot._cache.move_to_end(ballot_file)
+                while len(BlankBallot._cache) > Globals.get("BLANK_BALLOT_CACHE_SIZE"):
+                    BlankBallot._cache.popitem(last=False)
+        if frozen:
+            return entry[1]
+        return pickle.loads(entry[2])
+
     def create_blank_ballot(self, address, config):
         """Given an Address and a ElectionConfig, will generate the
         appropriate blank ballot.  Implementation note - this function
@@ -581,10 +644,16 @@ class BlankBallot(Ballot):
             raise NotImplementedError(f"Unsupported Ballot type ({style}) for writing")
         return ballot_file
 
-    def read_a_blank_ballot(self, address, config, ballot_file="", style="json"):
+    # pylint: disable=too-many-arguments
+    def read_a_blank_ballot(
+        self, address, config, ballot_file="", style="json", frozen=False
+    ):
         """
         Will return the dictionary of a blank ballot (given an address
-        so to be able to find the correct blank ballot)
+        so to be able to find the correct blank ballot).  If frozen
+        is True, the contests of this ballot share the (cached) blank
+        ballot data and must not be modified - see
+        get_blank_ballot_json.
         """
         if not ballot_file:
             # hackito ergo sum - since the ballot has not yet been
@@ -599,14 +668,14 @@ class BlankBallot(Ballot):
                 self.active_ggos, self.ballot_subdir, style
             )
         if style == "json":
-            self.operation_self.imprimir(f"Reading {ballot_file}", 5)
-            with open(ballot_file, "r", encoding="utf8") as file:
-                json_doc = json.load(file)
-                contests = json_doc["contests"]
-                self.active_ggos = json_doc["active_ggos"]
-                self.ballot_subdir = json_doc["ballot_subdir"]
-                self.ballot_node = json_doc["ballot_node"]
-                self.ballot_filename = json_doc["ballot_filename"]
+            json_doc = BlankBallot.get_blank_ballot_json(
+                self.operation_self, ballot_file, frozen
+            )
+            contests = json_doc["contests"]
+            self.active_ggos = json_doc["active_ggos"]
+            self.ballot_subdir = json_doc["ballot_subdir"]
+            self.ballot_node = json_doc["ballot_node"]
+            self.ballot_filename = json_doc["ballot_filename"]
             # Need to create Contest (objects) for each contest
             self.contests = []
             for contest in contests:
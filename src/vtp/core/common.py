@@ -72,6 +72,31 @@ class Globals:
         "BIN_DIR": "src/vtp",
         # How long to wait for a git shell command to complete - maybe a bad idea
         "SHELL_TIMEOUT": 15,
+        # The maximum number of long lived 'git cat-file' coprocesses
+        # per workspace (and per --batch/--batch-check style)
+        "GIT_CAT_FILE_POOL_SIZE": 4,
+        # The name (relative to the git directory) of the on disk index
+        # of the CVRs merged to main
+        "CVR_INDEX_FILE": "vtp-cvr-index.json",
+        # Ditto for the compiled snapshot of the parsed config.yaml tree
+        "CONFIG_SNAPSHOT_FILE": "vtp-config-snapshot.json",
+        # Ditto for the checkpoints of the streaming tallies
+        "TALLY_CHECKPOINT_FILE": "vtp-tally-checkpoint.json",
+        # The read size when streaming (large) git log outputs
+        "GIT_LOG_READ_CHUNK_SIZE": 1024 * 1024,
+        # How often (seconds) the merge daemon checks the remote for
+        # newly pushed CVR branches when not notified via a FIFO
+        "MERGE_DAEMON_POLL_INTERVAL": 1,
+        # The number of most recent merged CVRs the merge daemon
+        # latency metrics are computed over
+        "MERGE_DAEMON_LATENCY_WINDOW": 1000,
+        # How long (seconds) the parallel mock election waits for all
+        # its processes to parse their ElectionData and reach the start
+        # barrier
+        "MOCK_ELECTION_START_TIMEOUT": 300,
+        # The number of parsed blank ballots kept in the in memory
+        # (LRU) blank ballot cache
+        "BLANK_BALLOT_CACHE_SIZE": 256,
         # Number of ballots on a ballot receipt
         "BALLOT_RECEIPT_ROWS": 100,
         # Map the ElectionConfig 'kind' to the Address 'kind'
@@ -91,6 +116,30 @@ class Globals:
         # computer (requires a TPC/IP connection to get to).
         # The subdirectory where the FastAPI connection git workspaces are stored
         "GUID_CLIENT_DIRNAME": "guid-client-store",
+        # The subdirectory of the above where the pre-provisioned (not
+        # yet handed out) FastAPI connection git workspaces are stored
+        "GUID_POOL_DIRNAME": "pool",
+        # The limits of the guid workspaces - beyond these the least
+        # recently used ones are evicted (0 is no limit) - and the
+        # seconds a workspace (or an orphaned directory) needs to be
+        # idle before it can be evicted (reclaimed).  See
+        # GuidWorkspaceManager.
+        "GUID_WORKSPACE_MAX_COUNT": 1000,
+        "GUID_WORKSPACE_DISK_BUDGET": 10 * 1024**3,
+        "GUID_WORKSPACE_MIN_IDLE": 3600,
+        # How often (seconds) listing the guid workspaces rescans the
+        # guid-client-store for the ones created by other processes
+        "GUID_WORKSPACE_RESCAN_INTERVAL": 60,
+        # The subdirectory where the read-only snapshots of the generic
+        # read-only workspace are stored, the number of snapshots per
+        # process, how often (seconds) a snapshot lease checks for a
+        # new main tip, and the name (relative to the git directory of
+        # a snapshot) of the file that marks it read-only.  See
+        # ReadOnlySnapshotPool.
+        "RO_SNAPSHOT_DIRNAME": "ro-snapshots",
+        "RO_SNAPSHOT_POOL_SIZE": 4,
+        "RO_SNAPSHOT_REFRESH_INTERVAL": 2,
+        "RO_SNAPSHOT_MARKER_FILE": "vtp-ro-snapshot",
         # The subdirectory where the local tabulation git workspace is stored
         "TABULATION_SERVER_DIRNAME": "tabulation-server",
         # The subdirectory where the mock scanner git workspaces are stored
@@ -62,31 +62,35 @@ class Contest:
     _cast_keys = _blank_ballot_keys + ["selection", "cast_branch"]
     _choice_keys = ["name", "party", "ticket_names"]
 
-    # A simple numerical n digit uid
+    # The default (process wide) contest uid map - nominally each
+    # ElectionConfigTree supplies its own
     _uids = {}
-    _nextuid = 0
 
     @staticmethod
-    def set_uid(a_contest_blob: dict, ggo: str):
+    def set_uid(a_contest_blob: dict, ggo: str, uids: dict = None):
         """Will add a globally unique contest uid (only good within
         the context of this specific election) to the supplied contest
-        while caching the contest_name and ggo.
+        while caching the contest_name and ggo in the uids map.
         """
+        if uids is None:
+            uids = Contest._uids
         if "uid" in a_contest_blob:
             raise IndexError(
                 f"The uid of contest {a_contest_blob['contest_name']} is already set"
             )
-        a_contest_blob["uid"] = str(Contest._nextuid).rjust(4, "0")
-        if Contest._nextuid not in Contest._uids:
-            Contest._uids[Contest._nextuid] = {}
-        Contest._uids[Contest._nextuid]["contest_name"] = a_contest_blob["contest_name"]
-        Contest._uids[Contest._nextuid]["ggo"] = ggo
-        Contest._nextuid += 1
+        next_uid = len(uids)
+        a_contest_blob["uid"] = str(next_uid).rjust(4, "0")
+        uids[next_uid] = {
+            "contest_name": a_contest_blob["contest_name"],
+            "ggo": ggo,
+        }
 
     @staticmethod
-    def get_uid_pp_name(uid: str):
+    def get_uid_pp_name(uid: str, uids: dict = None):
         """Will return the contest pretty-print name of the global contest uid"""
-        return uid + " - " + Contest._uids[int(uid)]["contest_name"]
+        if uids is None:
+            uids = Contest._uids
+        return uid + " - " + uids[int(uid)]["contest_name"]
 
     @staticmethod
     # pylint: disable=too-many-branches
@@ -0,0 +1,251 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""An on disk index of the CVRs merged to the main branch"""
+
+# standard imports
+import itertools
+import json
+import os
+import secrets
+
+# local imports
+from .common import Globals
+
+
+class CvrIndex:
+    """
+    A class to maintain an on disk index of the CVRs that have been
+    merged to the (checked out) main branch so that a tally does not
+    need to 'git log' and json parse the entire main history every
+    time.  The index records the main tip that was last indexed and
+    only the commits in 'git log <last_tip>..HEAD' are parsed on an
+    update.
+
+    The index is a json file stored inside the git directory of the
+    workspace (see 'git rev-parse --git-path') and looks like:
+
+        {
+            "version": 2,
+            "generation": <a random token that changes on every rebuild>,
+            "tip": <the last indexed HEAD digest>,
+            "contests": {
+                <contest uid>: {<commit digest>: <CVR>, ...},
+                ...
+            }
+        }
+
+    where each per uid dictionary is in 'git log --topo-order
+    --no-merges --reverse' (parent to child) order.
+
+    Implementation note - the incremental updates are appended to the
+    existing per uid order.  When the new commits contain merges of
+    (older) side branches the resulting order can differ slightly
+    from a single full 'git log --topo-order' of the whole history.
+    The set of CVRs and hence the tally results are the same - only
+    the reported vote offsets of individual contests could differ.
+    A rebuild restores the full git log order.
+
+    If the last indexed tip is no longer an ancestor of HEAD (the
+    branch was reset or rewritten) the index is rebuilt from scratch.
+    Since the per uid dictionaries are otherwise only ever appended
+    to, a (generation, per uid CVR count) pair identifies a prefix of
+    the index - which is what the streaming tally checkpoints use.
+    """
+
+    _version = 2
+
+    def __init__(self, operation_self: dict, election_config: dict):
+        """
+        Will locate and load (but not update) the on disk index of the
+        election_config's workspace.  The operation_self supplies the
+        printing and shell_out environment.
+        """
+        self.operation_self = operation_self
+        self.election_config = election_config
+        # One git call returns both the index location and HEAD
+        with self.operation_self.changed_cwd(election_config.get("git_rootdir")):
+            index_file, checkpoint_file, self.head = (
+                self.operation_self.git_query(
+                    [
+                        "git",
+                        "rev-parse",
+                        "--git-path",
+                        Globals.get("CVR_INDEX_FILE"),
+                        "--git-path",
+                        Globals.get("TALLY_CHECKPOINT_FILE"),
+                        "HEAD",
+                    ]
+                )
+                .strip()
+                .splitlines()
+            )
+        self.index_file = os.path.join(election_config.get("git_rootdir"), index_file)
+        self.checkpoint_file = os.path.join(
+            election_config.get("git_rootdir"), checkpoint_file
+        )
+        self.index = self.load()
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"CvrIndex(index_file={self.index_file}, tip={self.index['tip']}, "
+            f"head={self.head}, contests={len(self.index['contests'])})"
+        )
+
+    def empty_index(self) -> dict:
+        """Return an empty index"""
+        return {
+            "version": CvrIndex._version,
+            "generation": secrets.token_hex(8),
+            "tip": "",
+            "contests": {},
+        }
+
+    def load(self) -> dict:
+        """Will load the index from disk, returning an empty index if
+        the file is missing, unreadable, or of a different version
+        """
+        try:
+            with open(self.index_file, "r", encoding="utf8") as index_fd:
+                index = json.load(index_fd)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return self.empty_index()
+        if index.get("version") != CvrIndex._version:
+            self.operation_self.imprimir(
+                f"Ignoring CVR index ({self.index_file}) of a different version", 4
+            )
+            return self.empty_index()
+        return index
+
+    def write_json_file(self, filename: str, data: dict):
+        """Will atomically write the json data to disk"""
+        self.operation_self.imprimir(f"Writing ({filename})", 5)
+        if self.operation_self.printonly:
+            return
+        tmp_file = filename + f".{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf8") as json_fd:
+            json.dump(data, json_fd, separators=(",", ":"))
+        os.replace(tmp_file, filename)
+
+    def save(self):
+        """Will atomically write the index to disk"""
+        self.write_json_file(self.index_file, self.index)
+
+    def load_tally_checkpoints(self) -> dict:
+        """
+        Will return the saved streaming tally checkpoints (keyed on
+        contest uid) if they were saved against this generation of
+        the index, otherwise an empty dictionary.
+        """
+        try:
+            with open(self.checkpoint_file, "r", encoding="utf8") as checkpoint_fd:
+                checkpoints = json.load(checkpoint_fd)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if checkpoints.get("generation") != self.index["generation"]:
+            return {}
+        return checkpoints["tallies"]
+
+    def save_tally_checkpoints(self, tallies: dict):
+        """Will save the streaming tally checkpoints (keyed on uid)"""
+        self.write_json_file(
+            self.checkpoint_file,
+            {"generation": self.index["generation"], "tallies": tallies},
+        )
+
+    def is_ancestor(self, digest: str) -> bool:
+        """Return True if digest is an ancestor of (or equal to) HEAD"""
+        with self.operation_self.changed_cwd(self.election_config.get("git_rootdir")):
+            result = self.operation_self.shell_out(
+                ["git", "merge-base", "--is-ancestor", digest, self.head],
+                printonly_override=True,
+                check=False,
+                incoming_printlevel=5,
+            )
+        return result.returncode == 0
+
+    def update(self, rebuild: bool = False) -> int:
+        """
+        Will bring the index up to date with HEAD, only parsing the
+        commits since the last indexed tip unless rebuild is True (or
+        the index cannot be incrementally updated).  Returns the
+        number of newly indexed CVRs.  The index is saved to disk if
+        anything changed.
+        """
+        tip = self.index["tip"]
+        if tip and not rebuild and tip == self.head:
+            self.operation_self.imprimir(f"CVR index is up to date ({tip})", 5)
+            return 0
+        if rebuild or not tip or not self.is_ancestor(tip):
+            self.operation_self.imprimir("(Re)building the CVR index", 4)
+            self.index = self.empty_index()
+            revision = []
+        else:
+            revision = [f"{tip}..{self.head}"]
+        count = 0
+        for digest, cvr in self.operation_self.cvr_stream_git_log(
+            [
+                "git",
+                "log",
+                "--topo-order",
+                "--no-merges",
+                "--reverse",
+            ]
+            + revision,
+            self.election_config,
+            incoming_printlevel=5,
+        ):
+            self.index["contests"].setdefault(cvr["contestCVR"]["uid"], {})[
+                digest
+            ] = cvr
+            count += 1
+        self.index["tip"] = self.head
+        self.operation_self.imprimir(f"Indexed {count} new CVRs through {self.head}", 4)
+        self.save()
+        return count
+
+    def get_contest_batches(self, offsets: dict = None) -> dict:
+        """
+        Return the indexed CVRs in the same form as
+        cvr_parse_git_log_output with grouped_by_uid set - a
+        dictionary keyed on contest uid of lists of CVRs with a
+        'digest' key added.  Since a Tally will modify the CVR
+        selections while counting, the returned CVRs are copies.
+
+        If offsets (keyed on uid) is supplied, only the CVRs past
+        the offset of each uid are returned.
+        """
+        offsets = offsets if offsets else {}
+        return {
+            uid: [
+                {
+                    "contestCVR": dict(
+                        cvr["contestCVR"],
+                        selection=list(cvr["contestCVR"]["selection"]),
+                    ),
+                    "digest": digest,
+                }
+                for digest, cvr in itertools.islice(
+                    contest.items(), offsets.get(uid, 0), None
+                )
+            ]
+            for uid, contest in self.index["contests"].items()
+        }
+
+
+# EOF
@@ -18,13 +18,14 @@
 """The VTP ElectionConfig class - everything needed to parse the config.yaml tree."""
 
 # standard imports
+import hashlib
+import json
 import os
 import re
-
-import networkx
-import yaml
+import threading
 
 # local imports
+from .address_index import AddressIndex
 from .common import Globals
 from .contest import Contest
 
@@ -95,14 +96,12 @@ class ElectionConfig:
     _address_map_keys = ["unique-ballots"]
     _address_map_subkeys = ["addresses", "ggos"]
 
-    # A simple numerical n digit GGO uid
-    _uids = {}
-    _nextuid = 0
-
-    # A private cache of ElectionConfig data of length one so that
-    # repeatably hitting the same EDF (Election Data File) is
-    # optimized.
-    _election_data = None
+    # The class level caches - the parsed election config trees keyed
+    # on the election's initial commit digest and the (lightweight)
+    # per workspace views of them keyed on the election_data_dir
+    _trees = {}
+    _workspaces = {}
+    _cache_lock = threading.Lock()
 
     @staticmethod
     def configure_election(operation_self: dict, election_data_dir: str):
@@ -110,54 +109,66 @@ class ElectionConfig:
         Return the existing ElectionData or parse a new one into
         existence.  This is the entrypoint/wrapper into/around the
         ElectionData class/instance.
+
+        An ElectionConfig is a lightweight per workspace view (the
+        git_rootdir, the initial commit, etc) of an ElectionConfigTree
+        - the parsed config.yaml tree.  The views are cached on the
+        election_data_dir so that a workspace only ever runs the
+        constructor's git commands once per process, and the trees
+        are cached on the election's initial commit so that all the
+        workspaces of the same election (the web-api guid workspaces,
+        the mock-clients, etc) share a single parse.  Since each tree
+        assigns its own GGO and contest uids, the uids of an election
+        are the same regardless of how many workspaces or elections a
+        process has seen.
         """
         # Safety check
         Globals.verify_election_data_dir(election_data_dir)
-        # Always call the constructor - sets the absolute path to
-        # election_data_dir.  It will call git rev-parse but at the
-        # moment that is required to determine the exact root of the
-        # ElectionData tree (as the CWD can move around etc).
-        incoming_ec = ElectionConfig(operation_self, election_data_dir)
-        # Now, if the git_rootdir is different than the previous
-        # constructor call, parse the new tree even though the EDF is
-        # the same.  Two design notes: 1) if the git_rootdir is stored
-        # some place else or differently other than in the
-        # ElectionConfig object, then different EDF workspaces could
-        # share the same EDF data while supporting multiple EDF git
-        # workspaces (required with the web-api interface); and 2)
-        # caching the last constructor call avoids multiple scans of
-        # the same ElectionData tree.  But if in a web based demo, the
-        # incoming requests will be dynamically varying over different
-        # guid based workspaces etc, so either keep a stack of them
-        # which all could consume memory or just optimize for repeated
-        # hits by the same client (into the same workspace).  So, for
-        # now, implementing the latter.
-
-        # 2024/04/12: HOWEVER, doing the latter will not recreate the
-        # same ED since the ggo uids will increment (they are a class
-        # variable).  So, either move _uid and _next_uid to instance
-        # variables or simply do not parse a new ED ever (for this
-        # process instance).  Since it is considered illegitimate to
-        # parse multiple different ED's, pick the latter again.
-        if ElectionConfig._election_data is not None:
-            return ElectionConfig._election_data
-        # Parses the actual election_data_dir
-        ElectionConfig._election_data = incoming_ec
-        ElectionConfig._election_data.parse_configs()
-        # Returns self
-        return ElectionConfig._election_data
+        workspace = os.path.realpath(
+            os.getcwd() if election_data_dir in ["", ".", None] else election_data_dir
+        )
+        with ElectionConfig._cache_lock:
+            the_election_config = ElectionConfig._workspaces.get(workspace)
+            if the_election_config is None:
+                # Sets the absolute path to the git_rootdir and the
+                # initial commit of the workspace
+                the_election_config = ElectionConfig(operation_self, workspace)
+                ElectionConfig._workspaces[workspace] = the_election_config
+            # The operation_self of the most recent caller handles
+            # the printing
+            the_election_config.operation_self = operation_self
+            if the_election_config.tree is None:
+                git_initial_commit = the_election_config.git_initial_commit
+                tree = ElectionConfig._trees.get(git_initial_commit)
+                if tree is None:
+                    # Load the compiled snapshot if it is still fresh
+                    tree = ElectionConfigTree.from_snapshot(
+                        operation_self,
+                        the_election_config.git_rootdir,
+                        the_election_config.config_snapshot_file,
+                        git_initial_commit,
+                    )
+                if tree is None:
+                    # Parses the actual election_data_dir
+                    tree = ElectionConfigTree(git_initial_commit)
+                    tree.parse_configs(operation_self, the_election_config.git_rootdir)
+                    tree.save_snapshot(
+                        operation_self,
+                        the_election_config.git_rootdir,
+                        the_election_config.config_snapshot_file,
+                    )
+                ElectionConfig._trees[git_initial_commit] = tree
+                the_election_config.tree = tree
+        return the_election_config
 
     @staticmethod
-    def get_next_uid(ggo: str):
-        """Will return the next GGO uid (only good within the context of
-        this specific election)
+    def forget_workspace(election_data_dir: str):
         """
-        this_uid = str(ElectionConfig._nextuid).rjust(3, "0")
-        if this_uid in ElectionConfig._uids:
-            raise KeyError(f"A GGO uid cannot be reused (ggo={ggo}, uid={this_uid})")
-        ElectionConfig._nextuid += 1
-        ElectionConfig._uids[this_uid] = ggo
-        return this_uid
+        Drop the cached view of a (to be removed) workspace - the
+        shared tree of its election is kept.
+        """
+        with ElectionConfig._cache_lock:
+            ElectionConfig._workspaces.pop(os.path.realpath(election_data_dir), None)
 
     @staticmethod
     def is_valid_ggo_string(arg: str):
@@ -227,7 +238,13 @@ class ElectionConfig:
         with self.operation_self.changed_cwd(self.git_rootdir):
             # the path
             result = self.operation_self.shell_out(
-                ["git", "rev-parse", "--show-toplevel"],
+                [
+                    "git",
+                    "rev-parse",
+                    "--show-toplevel",
+                    "--git-path",
+                    Globals.get("CONFIG_SNAPSHOT_FILE"),
+                ],
                 check=True,
                 capture_output=True,
                 text=True,
@@ -246,8 +263,11 @@ class ElectionConfig:
             raise EnvironmentError(
                 "Cannot determine workspace top level via 'git rev-parse'"
             )
-        # Set values based on result
-        self.git_rootdir = result.stdout.strip()
+        # Set values based on result.  Note - the git path is relative
+        # to the CWD of the git command.
+        git_rootdir, snapshot_file = result.stdout.strip().splitlines()
+        self.config_snapshot_file = os.path.join(self.git_rootdir, snapshot_file)
+        self.git_rootdir = git_rootdir
         self.root_config_file = os.path.join(
             self.git_rootdir,
             Globals.get("CONFIG_FILE"),
@@ -256,8 +276,9 @@ class ElectionConfig:
             self.git_rootdir,
             Globals.get("ADDRESS_MAP_FILE"),
         )
-        self.parsed_configs = ["."]
         self.uid = None
+        # The (shared) parsed tree - see configure_election
+        self.tree = None
 
         # Check result2 - determine the initial commit to branch the CVRs and
         # RECEIPTS from
@@ -287,20 +308,18 @@ class ElectionConfig:
                     "Cannot determine workspace origin remote name via 'git remote get-url origin'"
                 )
 
-        # With the above set, can spend the time to determine the election data
-        # network graph
-        self.digraph = networkx.DiGraph()
-
     def get(self, name: str):
         """A generic getter - will raise a NameError if name is not defined"""
         if name in ElectionConfig._config_keys:
-            return getattr(self, "config")[name]
+            return self.tree.config[name]
         if name in ElectionConfig._address_map_keys:
-            return getattr(self, "config")[name]
+            return self.tree.address_map[name]
         if name == "git_rootdir":
             return self.git_rootdir
         if name == "git_initial_commit":
             return self.git_initial_commit
+        if name == "contest_uids":
+            return self.tree.contest_uids
         raise NameError(
             (
                 f"Name {name} is not a supported root level key "
@@ -308,8 +327,16 @@ class ElectionConfig:
             )
         )
 
+    @property
+    def digraph(self):
+        """The GGO DAG of the (shared) parsed tree"""
+        return self.tree.digraph
+
     def get_dag(self, what: str):
         """An ElectionConfig get interface to the underlying DiGraph class."""
+        # pylint: disable=import-outside-toplevel
+        import networkx
+
         if what == "nodes":
             return self.digraph.nodes()
         if what == "edges":
@@ -346,16 +373,232 @@ class ElectionConfig:
 
     def ancestors(self, node):
         """Wrapper"""
+        # pylint: disable=import-outside-toplevel
+        import networkx
+
         return networkx.ancestors(self.digraph, node)
 
     def descendants(self, node):
         """Wrapper"""
+        # pylint: disable=import-outside-toplevel
+        import networkx
+
         return networkx.descendants(self.digraph, node)
 
+    def get_address_index(self):
+        """
+        Return the AddressIndex of the address_map files, which is
+        built on first use and shared by all the views of the tree.
+        """
+        with ElectionConfig._cache_lock:
+            if self.tree.address_index is None:
+                self.tree.address_index = AddressIndex(self.digraph)
+            return self.tree.address_index
+
     def __str__(self):
         """Return the serialization of this instance's ElectionConfig dictionary"""
         return str(list(self.get_dag("topo")))
 
+    def gen_unique_ggo_name(self, active_ggos, filename):
+        """
+        Given a set of active ggos, create a unique ggo name.  For the
+        time being, just sort order the ggos UIDs
+        """
+        ggo_unique_name = [self.get_node(ggo, "uid") for ggo in active_ggos]
+        # alphanumerically sort the string
+        ggo_unique_name.sort(key=int)
+        # for now, no error checking ...
+        ggo_unique_name.append(filename)
+        return ",".join(ggo_unique_name)
+
+    def gen_blank_ballot_location(self, active_ggos, ballot_subdir, style="json"):
+        """Return the file location of a blank ballot"""
+        return os.path.join(
+            self.get("git_rootdir"),
+            ballot_subdir,
+            Globals.get("BLANK_BALLOT_SUBDIR"),
+            style,
+            self.gen_unique_ggo_name(active_ggos, Globals.get("BALLOT_FILE")),
+        )
+
+    def gen_blank_ballot_location_from_filename(
+        self, ballot_subdir, filename, style="json"
+    ):
+        """Return the file location of a blank ballot given a blank ballot filename"""
+        return os.path.join(
+            self.get("git_rootdir"),
+            ballot_subdir,
+            Globals.get("BLANK_BALLOT_SUBDIR"),
+            style,
+            filename,
+        )
+
+
+class ElectionConfigTree:
+    """
+    The parsed config.yaml and address_map.yaml tree of an election -
+    the GGO DAG (a networkx DiGraph) plus the GGO and contest uids
+    that were assigned while parsing it.  A tree is shared by all the
+    ElectionConfig (workspace) views of the same election in a
+    process and is read-only once parsed - see
+    ElectionConfig.configure_election.
+
+    Since parsing the yaml tree on every command is slow, a parsed
+    tree is also saved as a compiled (JSON) snapshot in the git
+    directory of the workspace (see CONFIG_SNAPSHOT_FILE) keyed by the
+    digests of all the files that were read.  When none of those
+    files changed the next command loads the snapshot instead.
+    """
+
+    _snapshot_version = 1
+
+    def __init__(self, git_initial_commit: str):
+        """An empty tree - see parse_configs"""
+        # networkx (and yaml) are imported lazily so that the CLI
+        # startup does not pay for them when no election config is
+        # needed (for example --help)
+        # pylint: disable=import-outside-toplevel
+        import networkx
+
+        self.git_initial_commit = git_initial_commit
+        self.operation_self = None
+        self.config = {}
+        self.address_map = {}
+        self.parsed_configs = ["."]
+        # The GGO uid -> GGO name and the contest uid (int) ->
+        # {contest_name, ggo} maps of this election
+        self.ggo_uids = {}
+        self.contest_uids = {}
+        self.digraph = networkx.DiGraph()
+        # source file -> sha256 (or None if missing) of all the files
+        # read while parsing - see save_snapshot
+        self.sources = {}
+        # The AddressIndex of the address_map files - see
+        # ElectionConfig.get_address_index
+        self.address_index = None
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"ElectionConfigTree(git_initial_commit={self.git_initial_commit}, "
+            f"ggos={len(self.ggo_uids)}, contests={len(self.contest_uids)})"
+        )
+
+    def get_next_uid(self, ggo: str):
+        """Will return the next GGO uid (only good within the context of
+        this specific election)
+        """
+        this_uid = str(len(self.ggo_uids)).rjust(3, "0")
+        if this_uid in self.ggo_uids:
+            raise KeyError(f"A GGO uid cannot be reused (ggo={ggo}, uid={this_uid})")
+        self.ggo_uids[this_uid] = ggo
+        return this_uid
+
+    @staticmethod
+    def get_source_digest(filename: str):
+        """Return the sha256 of a source file or None if it does not exist"""
+        try:
+            with open(filename, "rb") as source_file:
+                return hashlib.sha256(source_file.read()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def get_sources_key(sources: dict) -> str:
+        """Return the digest of all the (relative path, digest) sources"""
+        return hashlib.sha256(
+            json.dumps(sorted(sources.items())).encode("utf8")
+        ).hexdigest()
+
+    def read_source(self, filename: str) -> str:
+        """Read a source (yaml) file and note its digest"""
+        with open(filename, "rb") as source_file:
+            data = source_file.read()
+        self.sources[filename] = hashlib.sha256(data).hexdigest()
+        return data.decode("utf8")
+
+    def save_snapshot(self, operation_self: dict, git_rootdir: str, filename: str):
+        """
+        Will (atomically) write the compiled snapshot of this parsed
+        tree - the parsed yaml data, the DAG, the uids, and the digests
+        of all the source files read (relative to git_rootdir) - as
+        JSON to filename.  A failure to write it is not an error.
+        """
+        sources = {
+            os.path.relpath(source, git_rootdir): digest
+            for source, digest in self.sources.items()
+        }
+        snapshot = {
+            "version": ElectionConfigTree._snapshot_version,
+            "key": ElectionConfigTree.get_sources_key(sources),
+            "git_initial_commit": self.git_initial_commit,
+            "sources": sources,
+            "parsed_configs": self.parsed_configs,
+            "ggo_uids": self.ggo_uids,
+            "contest_uids": list(self.contest_uids.items()),
+            "nodes": list(self.digraph.nodes(data=True)),
+            "edges": list(self.digraph.edges()),
+        }
+        operation_self.imprimir(f"Writing ({filename})", 5)
+        if operation_self.printonly:
+            return
+        tmp_file = filename + f".{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf8") as json_fd:
+                json.dump(snapshot, json_fd, separators=(",", ":"))
+            os.replace(tmp_file, filename)
+        except OSError as error:
+            operation_self.imprimir(
+                f"Could not write the config snapshot ({filename}): {error}", 4
+            )
+
+    @staticmethod
+    def from_snapshot(
+        operation_self: dict, git_rootdir: str, filename: str, git_initial_commit: str
+    ):
+        """
+        Return the tree of the compiled snapshot in filename if it is
+        fresh - of the same election and with the digest of every
+        source file (re-read relative to git_rootdir) unchanged -
+        otherwise None.  Checking the sources is a handful of small
+        file reads, much cheaper than parsing the yaml.
+        """
+        try:
+            with open(filename, "r", encoding="utf8") as json_fd:
+                snapshot = json.load(json_fd)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if (
+            snapshot.get("version") != ElectionConfigTree._snapshot_version
+            or snapshot.get("git_initial_commit") != git_initial_commit
+        ):
+            return None
+        sources = {
+            source: ElectionConfigTree.get_source_digest(
+                os.path.join(git_rootdir, source)
+            )
+            for source in snapshot["sources"]
+        }
+        if ElectionConfigTree.get_sources_key(sources) != snapshot["key"]:
+            operation_self.imprimir(f"Ignoring stale config snapshot ({filename})", 5)
+            return None
+        operation_self.imprimir(f"Reading config snapshot ({filename})", 5)
+        tree = ElectionConfigTree(git_initial_commit)
+        tree.sources = {
+            os.path.join(git_rootdir, source): digest
+            for source, digest in sources.items()
+        }
+        tree.parsed_configs = snapshot["parsed_configs"]
+        tree.ggo_uids = snapshot["ggo_uids"]
+        tree.contest_uids = {int(uid): value for uid, value in snapshot["contest_uids"]}
+        # The node and edge order is the same as when parsed
+        tree.digraph.add_nodes_from(snapshot["nodes"])
+        tree.digraph.add_edges_from(snapshot["edges"])
+        # The root config and address_map are those of the root node
+        tree.config = tree.digraph.nodes["."]["config"]
+        tree.address_map = tree.digraph.nodes["."]["address_map"]
+        return tree
+
     def read_address_map(self, filename: str):
         """
         Read the address_map yaml file return the dictionary but
@@ -363,27 +606,35 @@ class ElectionConfig:
         """
         if os.path.isfile(filename):
             self.operation_self.imprimir(f"Reading {filename}", 5)
-            with open(filename, "r", encoding="utf8") as map_file:
-                this_address_map = yaml.load(map_file, Loader=yaml.BaseLoader)
+            # pylint: disable=import-outside-toplevel
+            import yaml
+
+            this_address_map = yaml.load(
+                self.read_source(filename), Loader=yaml.BaseLoader
+            )
             # sanity-check it
             ElectionConfig.check_address_map_syntax(this_address_map, filename)
             return this_address_map
+        # A missing address_map is a source as well
+        self.sources[filename] = None
         return {}
 
     def read_config_file(self, filename: str):
         """
         Read the config yaml file return the dictionary and check the syntax.
         """
+        # pylint: disable=import-outside-toplevel
+        import yaml
+
         self.operation_self.imprimir(f"Reading {filename}", 5)
-        with open(filename, "r", encoding="utf8") as config_file:
-            config = yaml.load(config_file, Loader=yaml.BaseLoader)
+        config = yaml.load(self.read_source(filename), Loader=yaml.BaseLoader)
         # sanity-check it
         ElectionConfig.check_config_syntax(config, filename)
         # should really sanity check the contests too
         if "contests" in config:
             for contest in config["contests"]:
                 Contest.check_contest_blob_syntax(contest, filename, set_defaults=True)
-                Contest.set_uid(contest, ".")
+                Contest.set_uid(contest, ".", self.contest_uids)
         #        import pdb; pdb.set_trace()
         return config
 
@@ -396,6 +647,9 @@ class ElectionConfig:
         """Will add implicit address includes from one
         parent/sibling to another sibling/child
         """
+        # pylint: disable=import-outside-toplevel
+        import networkx
+
         for node in networkx.topological_sort(self.digraph):
             if "unique-ballots" in self.digraph.nodes[node]["address_map"]:
                 for entry in self.digraph.nodes[node]["address_map"]["unique-ballots"]:
@@ -408,10 +662,10 @@ class ElectionConfig:
                         if not self.digraph.has_edge(node, ggo):
                             self.digraph.add_edge(node, ggo)
 
-    def parse_configs(self):
+    def parse_configs(self, operation_self: dict, git_rootdir: str):
         """Will inspect the data in the root config and load the
-        entire election config tree.  The walk is depth first and
-        hitting a node twice is an error.
+        entire election config tree of the git_rootdir workspace.  The
+        walk is depth first and hitting a node twice is an error.
 
         The GGOs and config.yaml basically represent a double entry
         accounting system - both must exist for the specific
@@ -419,12 +673,20 @@ class ElectionConfig:
 
         This will load both the config and address_map yaml data
         """
+        # Only needed (for printing) while parsing
+        self.operation_self = operation_self
 
         # read the root config and address_map files
-        config = self.read_config_file(self.root_config_file)
+        config = self.read_config_file(
+            os.path.join(git_rootdir, Globals.get("CONFIG_FILE"))
+        )
+        self.config = config
 
         # read the root address_map and sanity check that
-        address_map = self.read_address_map(self.root_address_map_file)
+        address_map = self.read_address_map(
+            os.path.join(git_rootdir, Globals.get("ADDRESS_MAP_FILE"))
+        )
+        self.address_map = address_map
 
         def recursively_parse_tree(subdir, parent_node_name):
             """Something to recursivelty parse the GGO tree"""
@@ -439,7 +701,7 @@ class ElectionConfig:
                             f"The GGO kind value is not a list ({ggo_kind})"
                         )
                     ggo_subdir_abspath = os.path.join(
-                        self.git_rootdir,
+                        git_rootdir,
                         subdir,
                         ggo_kind,
                     )
@@ -489,7 +751,7 @@ class ElectionConfig:
                             kind=ggo_kind,
                             config=this_config,
                             ggo_name=ggo,
-                            uid=ElectionConfig.get_next_uid(ggo),
+                            uid=self.get_next_uid(ggo),
                             address_map=this_address_map,
                             subdir=os.path.join(subdir, ggo_kind, ggo),
                         )
@@ -508,44 +770,11 @@ class ElectionConfig:
             config=config,
             address_map=address_map,
             ggo_name="root",
-            uid=ElectionConfig.get_next_uid("."),
+            uid=self.get_next_uid("."),
             subdir=".",
         )
         recursively_parse_tree("GGOs", ".")
-
-    def gen_unique_ggo_name(self, active_ggos, filename):
-        """
-        Given a set of active ggos, create a unique ggo name.  For the
-        time being, just sort order the ggos UIDs
-        """
-        ggo_unique_name = [self.get_node(ggo, "uid") for ggo in active_ggos]
-        # alphanumerically sort the string
-        ggo_unique_name.sort(key=int)
-        # for now, no error checking ...
-        ggo_unique_name.append(filename)
-        return ",".join(ggo_unique_name)
-
-    def gen_blank_ballot_location(self, active_ggos, ballot_subdir, style="json"):
-        """Return the file location of a blank ballot"""
-        return os.path.join(
-            self.get("git_rootdir"),
-            ballot_subdir,
-            Globals.get("BLANK_BALLOT_SUBDIR"),
-            style,
-            self.gen_unique_ggo_name(active_ggos, Globals.get("BALLOT_FILE")),
-        )
-
-    def gen_blank_ballot_location_from_filename(
-        self, ballot_subdir, filename, style="json"
-    ):
-        """Return the file location of a blank ballot given a blank ballot filename"""
-        return os.path.join(
-            self.get("git_rootdir"),
-            ballot_subdir,
-            Globals.get("BLANK_BALLOT_SUBDIR"),
-            style,
-            filename,
-        )
+        self.operation_self = None
 
 
 # EOF
@@ -0,0 +1,107 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Integer encoded RCV ballots for the 'encoded' Tally RCV engine"""
+
+# local
+from .contest import Contest
+
+
+class EncodedRcvBallots:
+    """
+    The RCV ballots of a contest encoded once as tuples of choice
+    offsets (the ranking of each ballot) plus a per ballot position of
+    the currently active rank.  Rather than re-walking every CVR and
+    re-parsing its selection strings each RCV round, the ballots are
+    bucketed by their active choice so that eliminating a choice only
+    touches the ballots currently counting for it - a ballot's
+    position is advanced past all the eliminated choices and the
+    ballot moves to the bucket of its next choice (or is exhausted).
+
+    The ballot offsets are the offsets in the original contest_batch
+    so that the caller can report on them in the same (git log) order
+    as the classic engine.
+    """
+
+    def __init__(self, contest_batch: list):
+        """Encode the contest_batch (a list of git CVRs)"""
+        self.digests = []
+        self.rankings = []
+        for a_git_cvr in contest_batch:
+            self.digests.append(a_git_cvr["digest"])
+            # depending on version, selection could be an int or a string
+            self.rankings.append(
+                tuple(
+                    (
+                        Contest.extract_offest_from_selection(selection)
+                        if isinstance(selection, str)
+                        else selection
+                    )
+                    for selection in a_git_cvr["contestCVR"]["selection"]
+                )
+            )
+        self.positions = [0] * len(self.rankings)
+        self.eliminated = set()
+        # choice offset -> offsets of the ballots currently counting for it
+        self.buckets = {}
+        for ballot, ranking in enumerate(self.rankings):
+            if ranking:
+                self.buckets.setdefault(ranking[0], []).append(ballot)
+
+    def __len__(self):
+        """The number of ballots"""
+        return len(self.rankings)
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"EncodedRcvBallots(ballots={len(self.rankings)}, "
+            f"eliminated={sorted(self.eliminated)})"
+        )
+
+    def active_choice(self, ballot: int):
+        """Return the active choice offset of a ballot or None if the
+        ballot is blank or exhausted"""
+        if self.positions[ballot] < len(self.rankings[ballot]):
+            return self.rankings[ballot][self.positions[ballot]]
+        return None
+
+    def eliminate(self, losers: list) -> list:
+        """
+        Will eliminate the loser choice offsets and recast the ballots
+        that were counting for them.  Returns the recasts as a list of
+        (ballot, loser, new choice offset or None if dropped) tuples in
+        ballot order.
+        """
+        self.eliminated.update(losers)
+        recasts = []
+        for loser in losers:
+            for ballot in self.buckets.pop(loser, []):
+                ranking = self.rankings[ballot]
+                position = self.positions[ballot]
+                while position < len(ranking) and ranking[position] in self.eliminated:
+                    position += 1
+                self.positions[ballot] = position
+                new_choice = self.active_choice(ballot)
+                if new_choice is not None:
+                    self.buckets.setdefault(new_choice, []).append(ballot)
+                recasts.append((ballot, loser, new_choice))
+        recasts.sort(key=lambda recast: recast[0])
+        return recasts
+
+
+# EOF
@@ -0,0 +1,279 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Long lived 'git cat-file --batch' and '--batch-check' coprocesses for
+VoteTracker+.
+
+Forking a fresh git process for every read only query dominates the
+latency of the short web-api lookups (receipt checks, contest digest
+checks, etc).  A 'git cat-file' process started in --batch or
+--batch-check mode will answer any number of object queries over its
+stdin/stdout pipes, and since it re-resolves names on each query it
+sees new commits and refs as they land.  So keep a small bounded pool
+of such processes per git workspace and hand them out to callers.
+"""
+
+# standard imports
+import atexit
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+
+# local imports
+from .common import Globals
+
+
+class GitCatFile:
+    """
+    A single 'git cat-file --batch' (style="batch") or 'git cat-file
+    --batch-check' (style="batch-check") coprocess bound to one git
+    workspace.  Not thread safe - see GitCatFilePool for that.
+
+    Note - cat-file (without --buffer) flushes its stdout after each
+    response, so the queries are written and read one object at a
+    time.  That avoids any pipe deadlock with large --batch payloads
+    and the per object round trip is only a pipe write/read.
+    """
+
+    _styles = ["batch", "batch-check"]
+
+    def __init__(self, git_dir: str, style: str = "batch-check"):
+        """Start the coprocess in the supplied git workspace"""
+        if style not in GitCatFile._styles:
+            raise ValueError(
+                f"GitCatFile: unsupported style ({style}) - "
+                f"must be one of {GitCatFile._styles}"
+            )
+        self.git_dir = git_dir
+        self.style = style
+        self.process = None
+        self.start()
+
+    def __repr__(self):
+        """Boilerplate"""
+        return f"GitCatFile(git_dir={self.git_dir}, style={self.style})"
+
+    def start(self):
+        """(Re)start the git cat-file coprocess"""
+        # pylint: disable=consider-using-with
+        self.process = subprocess.Popen(
+            ["git", "cat-file", f"--{self.style}"],
+            cwd=self.git_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def is_healthy(self) -> bool:
+        """Return True if the coprocess is still running"""
+        return self.process is not None and self.process.poll() is None
+
+    def close(self):
+        """Shut down the coprocess - closing stdin is a clean exit"""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=Globals.get("SHELL_TIMEOUT"))
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            self.process.stdout.close()
+            self.process = None
+
+    def restart(self):
+        """Kill and restart the coprocess"""
+        self.close()
+        self.start()
+
+    def query_one(self, name: str) -> dict:
+        """
+        Query a single object name (digest, ref, <rev>:<path>, etc).
+        Returns a dictionary with the keys 'name' (the supplied name),
+        'objectname', 'objecttype', 'size', and (when style is batch)
+        'contents' as bytes.  Missing or ambiguous names return an
+        objecttype of 'missing' or 'ambiguous' with the objectname set
+        to the supplied name, which matches what the batch-check
+        output looks like.
+
+        Raises a BrokenPipeError (on write) or an EOFError (on read)
+        if the coprocess has died.
+        """
+        if "\n" in name:
+            raise ValueError(
+                f"GitCatFile: object names cannot contain newlines ({name})"
+            )
+        self.process.stdin.write(name.encode("utf8") + b"\n")
+        self.process.stdin.flush()
+        header = self.process.stdout.readline()
+        if not header.endswith(b"\n"):
+            raise EOFError(f"{self}: coprocess exited while reading '{name}'")
+        header = header.decode("utf8").rstrip("\n")
+        result = {"name": name}
+        # Responses are either '<oid> <type> <size>' or '<name> missing'
+        # (or '<name> ambiguous').  Note - the <name> can contain spaces.
+        if header.endswith((" missing", " ambiguous")):
+            result["objectname"] = name
+            result["objecttype"] = header.rsplit(" ", 1)[1]
+            result["size"] = 0
+            if self.style == "batch":
+                result["contents"] = b""
+        else:
+            (
+                result["objectname"],
+                result["objecttype"],
+                size,
+            ) = header.split(" ")
+            result["size"] = int(size)
+            if self.style == "batch":
+                # the contents is followed by a LF
+                contents = self.process.stdout.read(result["size"] + 1)
+                if len(contents) != result["size"] + 1:
+                    raise EOFError(f"{self}: coprocess exited while reading '{name}'")
+                result["contents"] = contents[:-1]
+        return result
+
+    def query(self, names: list) -> list:
+        """Query a list of object names - see query_one"""
+        return [self.query_one(name) for name in names]
+
+
+class GitCatFilePool:
+    """
+    A bounded pool of GitCatFile coprocesses per (git workspace,
+    style).  The pools are held at the class level so that all
+    Operations in the same python process share them.  A caller
+    checks out a coprocess for the duration of its query - if all of
+    the coprocesses are busy, another one is started until the pool
+    size (GIT_CAT_FILE_POOL_SIZE) is reached, after which the caller
+    waits.  A coprocess that has died is restarted, and a query that
+    fails mid flight is retried once on a restarted coprocess.
+    """
+
+    # class level registry of pools keyed on (realpath, style)
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    @staticmethod
+    def get_pool(git_dir: str, style: str = "batch-check"):
+        """Return the (shared) pool for the workspace and style"""
+        key = (os.path.realpath(git_dir), style)
+        with GitCatFilePool._pools_lock:
+            if key not in GitCatFilePool._pools:
+                GitCatFilePool._pools[key] = GitCatFilePool(key[0], style)
+            return GitCatFilePool._pools[key]
+
+    @staticmethod
+    def close_all():
+        """Shut down all the coprocesses of all the pools"""
+        with GitCatFilePool._pools_lock:
+            for pool in GitCatFilePool._pools.values():
+                pool.close()
+            GitCatFilePool._pools = {}
+
+    @staticmethod
+    def close_pool(git_dir: str):
+        """Shut down and forget the pools of a (to be removed) workspace"""
+        git_dir = os.path.realpath(git_dir)
+        with GitCatFilePool._pools_lock:
+            for key in [key for key in GitCatFilePool._pools if key[0] == git_dir]:
+                GitCatFilePool._pools.pop(key).close()
+
+    def __init__(self, git_dir: str, style: str, size: int = None):
+        """Create an empty pool - coprocesses are started on demand"""
+        self.git_dir = git_dir
+        self.style = style
+        self.size = size if size else Globals.get("GIT_CAT_FILE_POOL_SIZE")
+        # idle coprocesses plus a count of all coprocesses
+        self.idle = []
+        self.count = 0
+        # once closed, the checked out coprocesses are closed on return
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"GitCatFilePool(git_dir={self.git_dir}, style={self.style}, "
+            f"size={self.size}, count={self.count}, idle={len(self.idle)}, "
+            f"closed={self.closed})"
+        )
+
+    @contextmanager
+    def coprocess(self):
+        """Context manager to check out a healthy coprocess"""
+        with self.condition:
+            while not self.idle and self.count >= self.size:
+                self.condition.wait()
+            if self.idle:
+                cat_file = self.idle.pop()
+            else:
+                cat_file = None
+                self.count += 1
+        try:
+            if cat_file is None:
+                cat_file = GitCatFile(self.git_dir, self.style)
+            elif not cat_file.is_healthy():
+                cat_file.restart()
+        except Exception:
+            with self.condition:
+                self.count -= 1
+                self.condition.notify()
+            raise
+        try:
+            yield cat_file
+        finally:
+            with self.condition:
+                if self.closed:
+                    cat_file.close()
+                    self.count -= 1
+                else:
+                    self.idle.append(cat_file)
+                self.condition.notify()
+
+    def query(self, names: list) -> list:
+        """
+        Query a list of object names on a checked out coprocess,
+        restarting and retrying once if the coprocess dies.
+        """
+        with self.coprocess() as cat_file:
+            try:
+                return cat_file.query(names)
+            except (OSError, EOFError):
+                cat_file.restart()
+                return cat_file.query(names)
+
+    def close(self):
+        """
+        Shut down the idle coprocesses - the ones checked out at the
+        moment are shut down when they are returned
+        """
+        with self.condition:
+            self.closed = True
+            for cat_file in self.idle:
+                cat_file.close()
+                self.count -= 1
+            self.idle = []
+
+
+# Do not leave the coprocesses around at interpreter exit
+atexit.register(GitCatFilePool.close_all)
+
+# EOF
@@ -0,0 +1,353 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""An in-process manager of the web-api guid workspaces"""
+
+# standard imports
+import os
+import re
+import shutil
+import threading
+import time
+
+# local imports
+from .common import Globals
+from .election_config import ElectionConfig
+from .git_cat_file import GitCatFilePool
+from .unmerged_cvr_pool import UnmergedCvrPool
+
+
+class GuidWorkspaceManager:
+    """
+    A class to manage the lifecycle of the web-api guid workspaces,
+    the <location>/guid-client-store/xx/yyyy... ElectionData clones
+    created by 'setup-vtp-demo --guid_client_store'.
+
+    The manager holds an in memory inventory of the workspaces (guid
+    -> clone directory, last access time, and disk usage) that is
+    built by one scan of the guid-client-store and then maintained
+    as the workspaces are added, looked up, and evicted, so that a
+    lookup does not need to list any directories.  A guid that is not
+    in the inventory (created by another process) is read from disk
+    on its first lookup, and listing the guids rescans the
+    guid-client-store at most every GUID_WORKSPACE_RESCAN_INTERVAL
+    seconds.
+
+    The last access time of a workspace is the mtime of its guid
+    directory, which each lookup updates, so that it is shared by all
+    the web-api processes and survives a restart.  evict removes the
+    least recently used workspaces while there are more than
+    GUID_WORKSPACE_MAX_COUNT of them or they use more than
+    GUID_WORKSPACE_DISK_BUDGET bytes, but never one used within the
+    last GUID_WORKSPACE_MIN_IDLE seconds.  A scan also reclaims the
+    orphaned directories - guid directories that do not hold exactly
+    one clone (an interrupted clone or eviction) and the hidden
+    directories of interrupted guid pool clones - once they have not
+    changed for GUID_WORKSPACE_MIN_IDLE seconds.
+    """
+
+    # class level registry of managers keyed on the runtime location
+    _managers = {}
+    _managers_lock = threading.Lock()
+
+    @staticmethod
+    def get_manager(location: str = "", operation_self: dict = None):
+        """
+        Return the (shared) manager of the guid workspaces of the
+        location (default DEFAULT_RUNTIME_LOCATION)
+        """
+        location = os.path.abspath(location or Globals.get("DEFAULT_RUNTIME_LOCATION"))
+        with GuidWorkspaceManager._managers_lock:
+            if location not in GuidWorkspaceManager._managers:
+                GuidWorkspaceManager._managers[location] = GuidWorkspaceManager(
+                    location
+                )
+            the_manager = GuidWorkspaceManager._managers[location]
+        # The operation_self of the most recent caller handles the printing
+        if operation_self:
+            the_manager.operation_self = operation_self
+        return the_manager
+
+    @staticmethod
+    def verify_guid(guid: str):
+        """Raise a ValueError if guid is not a 40 character hex string"""
+        if len(guid) != 40:
+            raise ValueError(f"The provided guid is not 40 characters long: {guid}")
+        if not re.match("^[0-9a-f]+$", guid):
+            raise ValueError(
+                f"The provided guid contains characters other than [0-9a-f]: {guid}"
+            )
+
+    @staticmethod
+    def get_disk_usage(path: str) -> int:
+        """
+        Return the disk usage in bytes of a directory tree.  Note -
+        the objects a 'git clone --shared' workspace borrows are not
+        part of its tree and so are not counted.
+        """
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(path):
+            for name in dirnames + filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_blocks * 512
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def __init__(self, location: str):
+        """Scan the guid workspaces of the location"""
+        self.location = location
+        self.guid_client_dir = os.path.join(
+            location, Globals.get("GUID_CLIENT_DIRNAME")
+        )
+        self.operation_self = None
+        # guid -> {"edf_dir", "last_access", "size", "size_time"}
+        self.workspaces = {}
+        self.last_scan = 0.0
+        self.lock = threading.Lock()
+        self.scan()
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"GuidWorkspaceManager(location={self.location}, "
+            f"workspaces={len(self.workspaces)})"
+        )
+
+    def imprimir(self, a_line: str, incoming_printlevel: int):
+        """Print via the operation_self of the most recent caller, if any"""
+        if self.operation_self:
+            self.operation_self.imprimir(a_line, incoming_printlevel)
+
+    def get_guid_path(self, guid: str) -> str:
+        """Return the guid directory of a guid"""
+        return os.path.join(self.guid_client_dir, guid[:2], guid[2:])
+
+    # pylint: disable=duplicate-code
+    def read_workspace(self, guid: str) -> dict:
+        """
+        Read a guid workspace from disk.  Raises a FileNotFoundError
+        if there is no such guid directory and a ValueError if the
+        guid directory does not hold exactly one clone.
+        """
+        edf_path = self.get_guid_path(guid)
+        dirs = [
+            name
+            for name in os.listdir(edf_path)
+            if os.path.isdir(os.path.join(edf_path, name))
+        ]
+        if len(dirs) > 1:
+            raise ValueError(
+                f"The provided guid ({guid}) based path ({edf_path}) "
+                "contains multiple subdirs - there can only be one"
+            )
+        if len(dirs) == 0:
+            raise ValueError(
+                f"The guid directory ({edf_path}) "
+                "is empty - there needs to be exactly one git clone "
+                "of a ElectionData repo"
+            )
+        return {
+            "edf_dir": os.path.join(edf_path, dirs[0]),
+            "last_access": os.stat(edf_path).st_mtime,
+            "size": None,
+            "size_time": 0.0,
+        }
+
+    def scan(self):
+        """
+        (Re)build the inventory from disk and reclaim the orphaned
+        directories.  The in memory access times and disk usages of
+        the already known workspaces are kept.
+        """
+        workspaces = {}
+        orphans = []
+        if os.path.isdir(self.guid_client_dir):
+            for entry in os.scandir(self.guid_client_dir):
+                if entry.name == Globals.get("GUID_POOL_DIRNAME") and entry.is_dir():
+                    # The interrupted pool clones (see SetupVtpDemoOperation)
+                    orphans += [
+                        pool_entry.path
+                        for pool_entry in os.scandir(entry.path)
+                        if pool_entry.name.startswith(".")
+                    ]
+                    continue
+                if not entry.is_dir() or not re.match("^[0-9a-f]{2}$", entry.name):
+                    continue
+                for subdir in os.scandir(entry.path):
+                    guid = entry.name + subdir.name
+                    if subdir.is_dir() and re.match("^[0-9a-f]{38}$", subdir.name):
+                        try:
+                            workspaces[guid] = self.read_workspace(guid)
+                            continue
+                        except (FileNotFoundError, ValueError):
+                            pass
+                    orphans.append(subdir.path)
+        with self.lock:
+            for guid, workspace in workspaces.items():
+                known = self.workspaces.get(guid)
+                if known:
+                    workspace["last_access"] = max(
+                        workspace["last_access"], known["last_access"]
+                    )
+                    workspace["size"] = known["size"]
+                    workspace["size_time"] = known["size_time"]
+            self.workspaces = workspaces
+            self.last_scan = time.time()
+        self.reclaim_orphans(orphans)
+
+    def reclaim_orphans(self, orphans: list):
+        """Remove the orphaned directories that have been idle long enough"""
+        now = time.time()
+        for orphan in orphans:
+            try:
+                if now - os.lstat(orphan).st_mtime < Globals.get(
+                    "GUID_WORKSPACE_MIN_IDLE"
+                ):
+                    continue
+            except FileNotFoundError:
+                continue
+            self.imprimir(f"Reclaiming orphaned guid directory ({orphan})", 4)
+            if os.path.isdir(orphan) and not os.path.islink(orphan):
+                shutil.rmtree(orphan, ignore_errors=True)
+            else:
+                os.remove(orphan)
+
+    def add_workspace(self, guid: str):
+        """Add a (newly created) guid workspace to the inventory"""
+        workspace = self.read_workspace(guid)
+        workspace["last_access"] = time.time()
+        with self.lock:
+            self.workspaces[guid] = workspace
+
+    def get_edf_dir(self, guid: str) -> str:
+        """
+        Return the ElectionData clone directory of a guid workspace
+        and record the access.  Raises a ValueError for an invalid
+        guid or guid workspace and a FileNotFoundError for a guid
+        without a workspace.
+        """
+        GuidWorkspaceManager.verify_guid(guid)
+        with self.lock:
+            workspace = self.workspaces.get(guid)
+        if workspace is None:
+            workspace = self.read_workspace(guid)
+            with self.lock:
+                self.workspaces[guid] = workspace
+        try:
+            os.utime(self.get_guid_path(guid))
+        except FileNotFoundError:
+            # Evicted by another process
+            with self.lock:
+                self.workspaces.pop(guid, None)
+            raise
+        workspace["last_access"] = time.time()
+        return workspace["edf_dir"]
+
+    def get_guids(self) -> list:
+        """Return the list of the guids of all the guid workspaces"""
+        if time.time() - self.last_scan > Globals.get("GUID_WORKSPACE_RESCAN_INTERVAL"):
+            self.scan()
+        with self.lock:
+            return list(self.workspaces)
+
+    def get_inventory(self) -> dict:
+        """Return a copy of the inventory - guid -> workspace info"""
+        with self.lock:
+            return {
+                guid: dict(workspace) for guid, workspace in self.workspaces.items()
+            }
+
+    def remove_workspace(self, guid: str):
+        """
+        Remove a guid workspace.  The in-process state of the
+        workspace (its ElectionConfig view, git cat-file coprocesses,
+        and unmerged CVR pool) is dropped first.  The guid directory
+        is then renamed to a hidden directory so that it disappears
+        atomically - if the removal is interrupted, a later scan
+        reclaims it.
+        """
+        with self.lock:
+            workspace = self.workspaces.pop(guid, None)
+        if workspace is None:
+            try:
+                workspace = self.read_workspace(guid)
+            except (FileNotFoundError, ValueError):
+                pass
+        if workspace is not None:
+            ElectionConfig.forget_workspace(workspace["edf_dir"])
+            GitCatFilePool.close_pool(workspace["edf_dir"])
+            UnmergedCvrPool.forget_pool(workspace["edf_dir"])
+        guid_path = self.get_guid_path(guid)
+        hidden_path = os.path.join(os.path.dirname(guid_path), "." + guid[2:])
+        try:
+            os.rename(guid_path, hidden_path)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(hidden_path, ignore_errors=True)
+
+    def evict(
+        self, max_count: int = None, disk_budget: int = None, min_idle: int = None
+    ) -> list:
+        """
+        Evict the least recently used guid workspaces beyond the
+        maximum count and disk budget (a 0 limit is no limit) that
+        have not been used for min_idle seconds.  The limits default
+        to the GUID_WORKSPACE_* Globals.  Returns the evicted guids.
+        """
+        if max_count is None:
+            max_count = Globals.get("GUID_WORKSPACE_MAX_COUNT")
+        if disk_budget is None:
+            disk_budget = Globals.get("GUID_WORKSPACE_DISK_BUDGET")
+        if min_idle is None:
+            min_idle = Globals.get("GUID_WORKSPACE_MIN_IDLE")
+        with self.lock:
+            by_age = sorted(
+                self.workspaces.items(), key=lambda item: item[1]["last_access"]
+            )
+        total = 0
+        if disk_budget:
+            # Only (re)measure the workspaces used since their last measurement
+            for _, workspace in by_age:
+                if workspace["size"] is None or (
+                    workspace["size_time"] < workspace["last_access"]
+                ):
+                    workspace["size_time"] = time.time()
+                    workspace["size"] = GuidWorkspaceManager.get_disk_usage(
+                        os.path.dirname(workspace["edf_dir"])
+                    )
+                total += workspace["size"]
+        count = len(by_age)
+        now = time.time()
+        evicted = []
+        for guid, workspace in by_age:
+            if (not max_count or count <= max_count) and (
+                not disk_budget or total <= disk_budget
+            ):
+                break
+            # The rest are even more recently used
+            if now - workspace["last_access"] < min_idle:
+                break
+            self.imprimir(f"Evicting guid workspace ({guid})", 4)
+            self.remove_workspace(guid)
+            count -= 1
+            total -= workspace["size"] or 0
+            evicted.append(guid)
+        return evicted
+
+
+# EOF
@@ -0,0 +1,216 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Opt-in wall time instrumentation of an Operation"""
+
+# standard imports
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+class Instrumentation:
+    """
+    A class to accumulate where the wall time of an Operation goes -
+    see Operation.enable_instrumentation.  The timings are aggregated
+    per (kind, key) where kind is one of:
+
+        run - the run() of the operation (key is the operation class)
+        shell_out - a shell_out call (key is argv[0:2], e.g. 'git log')
+        changed_cwd - a changed_cwd block (key is the directory)
+        changed_branch - a changed_branch block (key is the branch,
+            with the random suffix of a CVR branch dropped)
+        tally - a tally phase (key is the phase)
+
+    and each aggregate holds the count, total, min, and max seconds.
+    The shell_out aggregates also hold the bytes written to (stdin)
+    and read from (stdout plus stderr) the command and the count per
+    exit code.  Note that the blocks nest - a shell_out inside a
+    changed_cwd block is also part of that block's time.
+
+    The profile can be rendered as a dictionary (json), as a human
+    readable table (slowest first), or as a Prometheus text
+    exposition file (for the node_exporter textfile collector).
+    """
+
+    _prometheus_prefix = "vtp_operation"
+
+    @staticmethod
+    def escape_label(value: str) -> str:
+        """Escape a Prometheus label value"""
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def __init__(self, operation_name: str):
+        """An empty profile of the named operation"""
+        self.operation_name = operation_name
+        # (kind, key) -> the aggregate - see record
+        self.timings = {}
+        self.start_time = time.time()
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"Instrumentation(operation_name={self.operation_name}, "
+            f"timings={len(self.timings)})"
+        )
+
+    # pylint: disable=too-many-arguments
+    def record(
+        self,
+        kind: str,
+        key: str,
+        seconds: float,
+        exit_code=None,
+        bytes_in: int = 0,
+        bytes_out: int = 0,
+    ):
+        """Add one timed event to the (kind, key) aggregate"""
+        timing = self.timings.get((kind, key))
+        if timing is None:
+            timing = self.timings[(kind, key)] = {
+                "count": 0,
+                "seconds": 0.0,
+                "min": seconds,
+                "max": seconds,
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "exit_codes": {},
+            }
+        timing["count"] += 1
+        timing["seconds"] += seconds
+        timing["min"] = min(timing["min"], seconds)
+        timing["max"] = max(timing["max"], seconds)
+        timing["bytes_in"] += bytes_in
+        timing["bytes_out"] += bytes_out
+        if exit_code is not None:
+            code = str(exit_code)
+            timing["exit_codes"][code] = timing["exit_codes"].get(code, 0) + 1
+
+    @contextmanager
+    def timer(self, kind: str, key: str):
+        """Context manager that records the wall time of its block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, key, time.perf_counter() - start)
+
+    def get_profile(self) -> dict:
+        """Return the profile as a (json serializable) dictionary"""
+        return {
+            "operation": self.operation_name,
+            "start_time": self.start_time,
+            "timings": [
+                {
+                    "kind": kind,
+                    "key": key,
+                    "count": timing["count"],
+                    "seconds": round(timing["seconds"], 6),
+                    "mean": round(timing["seconds"] / timing["count"], 6),
+                    "min": round(timing["min"], 6),
+                    "max": round(timing["max"], 6),
+                    "bytes_in": timing["bytes_in"],
+                    "bytes_out": timing["bytes_out"],
+                    "exit_codes": dict(sorted(timing["exit_codes"].items())),
+                }
+                for (kind, key), timing in sorted(
+                    self.timings.items(), key=lambda item: -item[1]["seconds"]
+                )
+            ],
+        }
+
+    def get_table(self) -> list:
+        """Return the profile as a list of (human readable) table lines"""
+        lines = [
+            f"Profile of {self.operation_name}",
+            f"{'kind':<15} {'key':<40} {'count':>7} {'total s':>9} "
+            f"{'mean ms':>9} {'max ms':>9} {'in B':>9} {'out B':>10}",
+        ]
+        for timing in self.get_profile()["timings"]:
+            key = timing["key"]
+            if len(key) > 40:
+                key = "..." + key[-37:]
+            lines.append(
+                f"{timing['kind']:<15} {key:<40} {timing['count']:>7} "
+                f"{timing['seconds']:>9.3f} {timing['mean'] * 1000:>9.2f} "
+                f"{timing['max'] * 1000:>9.2f} {timing['bytes_in']:>9} "
+                f"{timing['bytes_out']:>10}"
+            )
+        return lines
+
+    def get_prometheus(self) -> list:
+        """Return the profile as a list of Prometheus text exposition lines"""
+        prefix = Instrumentation._prometheus_prefix
+        operation = Instrumentation.escape_label(self.operation_name)
+        metrics = {
+            "seconds_total": ("counter", "Wall time spent", []),
+            "calls_total": ("counter", "Number of timed calls", []),
+            "max_seconds": ("gauge", "Slowest single call", []),
+            "bytes_in_total": ("counter", "Bytes written to shell commands", []),
+            "bytes_out_total": ("counter", "Bytes read from shell commands", []),
+            "exit_codes_total": ("counter", "Shell command exit codes", []),
+        }
+        for (kind, key), timing in sorted(self.timings.items()):
+            labels = (
+                f'operation="{operation}",kind="{kind}",'
+                f'key="{Instrumentation.escape_label(key)}"'
+            )
+            metrics["seconds_total"][2].append(f"{{{labels}}} {timing['seconds']:.6f}")
+            metrics["calls_total"][2].append(f"{{{labels}}} {timing['count']}")
+            metrics["max_seconds"][2].append(f"{{{labels}}} {timing['max']:.6f}")
+            if kind == "shell_out":
+                metrics["bytes_in_total"][2].append(
+                    f"{{{labels}}} {timing['bytes_in']}"
+                )
+                metrics["bytes_out_total"][2].append(
+                    f"{{{labels}}} {timing['bytes_out']}"
+                )
+                for code, count in sorted(timing["exit_codes"].items()):
+                    metrics["exit_codes_total"][2].append(
+                        f'{{{labels},code="{code}"}} {count}'
+                    )
+        lines = []
+        for name, (metric_type, help_text, samples) in metrics.items():
+            if not samples:
+                continue
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            lines += [f"{prefix}_{name}{sample}" for sample in samples]
+        return lines
+
+    def write_profile(self, filename: str, profile_format: str = "json"):
+        """
+        Will (atomically) write the profile in the json, table, or
+        prometheus format to filename
+        """
+        match profile_format:
+            case "json":
+                contents = json.dumps(self.get_profile(), indent=2) + "\n"
+            case "table":
+                contents = "\n".join(self.get_table()) + "\n"
+            case "prometheus":
+                contents = "\n".join(self.get_prometheus()) + "\n"
+            case _:
+                raise ValueError(f"Unsupported profile format ({profile_format})")
+        tmp_file = filename + f".{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf8") as outfile:
+            outfile.write(contents)
+        os.replace(tmp_file, filename)
+
+
+# EOF
@@ -0,0 +1,179 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""The structured output sink behind Operation.imprimir"""
+
+# standard imports
+import json
+import re
+from collections import deque
+
+
+class OutputSink:
+    """
+    A class to collect the output of an Operation (see
+    Operation.imprimir) as structured records rather than as
+    formatted strings.  A record is a (level, kind, template, args)
+    tuple where kind is one of:
+
+        line - a line of text, template % args if there are args
+        hyperlinks - ditto but the html rendering links the digests
+        formatting - template is an imprimir_formatting construct
+
+    A record is only formatted when it is rendered - immediately when
+    printing to STDOUT, otherwise when the output is retrieved - so
+    that an Operation accumulating a large output (a tally with
+    track_contests for example) only pays for appending tuples.  And
+    since the Operation drops the records above its verbosity before
+    they get here, the filtered out lines cost nothing beyond the
+    verbosity check.
+
+    The records are rendered in one of three output styles: text, html
+    (the levels become css spans and optionally the digests become
+    links), and json (one {"level", "message"} or {"level",
+    "formatting"} object per record - printed as json lines).  With a
+    max_records limit the accumulated records are a ring buffer that
+    only keeps the most recent ones, which bounds the memory of a
+    long running web-api request.
+    """
+
+    # The rendering of the imprimir_formatting constructs - (text, html)
+    _formatting = {
+        "horizontal_line": ("-" * 78, "<hr>"),
+        "horizontal_shortline": ("-" * 32, '<hr width="50%">'),
+        "empty_line": ("", ""),
+        "begin_good_box": ("*" * 12, "*" * 12),
+        "end_good_box": ("*" * 12, "*" * 12),
+        "begin_error_box": ("#" * 12, "#" * 12),
+        "end_error_box": ("#" * 12, "#" * 12),
+    }
+    _level_prefixes = {
+        1: ("[ERROR] ", '<span class="error">[ERROR] </span>'),
+        2: ("[WARNING] ", '<span class="warning">[WARNING] </span>'),
+    }
+    _output_styles = ["text", "html", "json"]
+    _sha1_regex = re.compile(r"([0-9a-fA-F]{40})")
+
+    @staticmethod
+    def is_formatting(a_construct: str) -> bool:
+        """Return True if a_construct is a supported formatting construct"""
+        return a_construct in OutputSink._formatting
+
+    @staticmethod
+    def get_message(record: tuple) -> str:
+        """Return the (unstyled) message of a line record"""
+        _, _, template, args = record
+        return template % args if args else template
+
+    @staticmethod
+    def get_dict(record: tuple) -> dict:
+        """Return the json rendering of a record"""
+        level, kind, template, _ = record
+        if kind == "formatting":
+            return {"level": level, "formatting": template}
+        return {"level": level, "message": OutputSink.get_message(record)}
+
+    def __init__(
+        self,
+        output_style: str = "text",
+        stdout_printing: bool = True,
+        max_records: int = 0,
+    ):
+        """
+        An empty sink.  If stdout_printing is True the records are
+        printed as they arrive, otherwise they are accumulated (at most
+        max_records of them if max_records is not 0).
+        """
+        if output_style not in OutputSink._output_styles:
+            raise ValueError(
+                f"Unsupported output style ({output_style}) - "
+                f"must be one of {OutputSink._output_styles}"
+            )
+        self.output_style = output_style
+        self.stdout_printing = stdout_printing
+        self.records = deque(maxlen=max_records or None)
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"OutputSink(output_style={self.output_style}, "
+            f"stdout_printing={self.stdout_printing}, "
+            f"records={len(self.records)}, max_records={self.records.maxlen})"
+        )
+
+    def __len__(self):
+        """The number of accumulated records"""
+        return len(self.records)
+
+    def set_max_records(self, max_records: int):
+        """(Re)set the ring buffer size - 0 is unbounded"""
+        self.records = deque(self.records, maxlen=max_records or None)
+
+    def emit(self, record: tuple):
+        """Print or accumulate a record"""
+        if self.stdout_printing:
+            print(self.render_record(record))
+        else:
+            self.records.append(record)
+
+    def extend(self, records: list):
+        """Print or accumulate a list of records (of another sink)"""
+        if self.stdout_printing:
+            for record in records:
+                print(self.render_record(record))
+        else:
+            self.records.extend(records)
+
+    def clear(self):
+        """Drop the accumulated records"""
+        self.records.clear()
+
+    def render_record(self, record: tuple, output_style: str = "") -> str:
+        """Render a record as a string in the (default sink) output style"""
+        output_style = output_style or self.output_style
+        level, kind, template, _ = record
+        if output_style == "json":
+            return json.dumps(OutputSink.get_dict(record))
+        html = output_style == "html"
+        if kind == "formatting":
+            return OutputSink._formatting[template][html]
+        a_line = OutputSink.get_message(record)
+        if html and kind == "hyperlinks":
+            a_line = OutputSink._sha1_regex.sub(
+                r'<a href="foo/\1" target="_blank">\1</a>', a_line
+            )
+        if level in OutputSink._level_prefixes:
+            a_line = OutputSink._level_prefixes[level][html] + a_line
+        return a_line
+
+    def render(self, output_style: str = "") -> list:
+        """
+        Render the accumulated records as a list of strings.  The html
+        output always starts with a paragraph marker.
+        """
+        output_style = output_style or self.output_style
+        prologue = ["<p>"] if output_style == "html" else []
+        return prologue + [
+            self.render_record(record, output_style) for record in self.records
+        ]
+
+    def render_json(self) -> list:
+        """Render the accumulated records as a list of dictionaries"""
+        return [OutputSink.get_dict(record) for record in self.records]
+
+
+# EOF
@@ -0,0 +1,351 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""A pool of read-only ElectionData snapshots for the web-api queries"""
+
+# standard imports
+import atexit
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+# local imports
+from .common import Globals
+from .election_config import ElectionConfig
+from .git_cat_file import GitCatFilePool
+
+
+# pylint: disable=too-many-instance-attributes
+class ReadOnlySnapshotPool:
+    """
+    A class to spread the concurrent read-only web-api queries
+    (show-contests, verify-ballot-receipt, tally-contests, etc) over
+    a pool of RO_SNAPSHOT_POOL_SIZE read-only snapshots of the
+    ElectionData repo instead of running all of them in the one
+    generic read-only workspace (see WebAPI.get_generic_ro_edf_dir).
+
+    A snapshot is a 'git worktree add --detach' of the generic
+    read-only workspace (the base) pinned at the origin/main tip, so
+    the snapshots share the objects and remote refs of the base and
+    cost little more than a checkout.  The snapshots live in
+    <location>/ro-snapshots/<pid> - each process has its own - and a
+    marker file in the private git directory of each snapshot tells
+    the operations that they are running in a snapshot (see
+    is_snapshot), in which case they do not 'git pull' - the pool
+    fetches for them.
+
+    A query leases a snapshot (see lease) - the least leased one of
+    the current generation, round robin among equals.  At most every
+    RO_SNAPSHOT_REFRESH_INTERVAL seconds a lease also fetches the
+    base, and if origin/main has moved, a new generation of snapshots
+    is created at the new tip and swapped in under the lock.  The
+    queries already running keep their (now retired) snapshot, which
+    is removed when its last lease is released, so that a query never
+    sees the workspace change under it.  The per workspace caches of
+    the new snapshots (the CVR index, the tally checkpoints, and the
+    config snapshot) are seeded from the retired ones so that a
+    rotation only costs an incremental index update.
+
+    The pools are held at the class level, one per runtime location,
+    so that all the queries in the same python process share them.
+    """
+
+    # class level registry of pools keyed on the runtime location
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    # The per workspace files (relative to the git directory) that are
+    # carried forward from one generation of snapshots to the next
+    _seeded_files = [
+        "CVR_INDEX_FILE",
+        "TALLY_CHECKPOINT_FILE",
+        "CONFIG_SNAPSHOT_FILE",
+    ]
+
+    @staticmethod
+    def get_pool(base_dir: str, location: str = "", operation_self: dict = None):
+        """
+        Return the (shared) pool of the location (default
+        DEFAULT_RUNTIME_LOCATION).  The base_dir, the generic
+        read-only workspace that the snapshots are worktrees of, is
+        only used when the pool is created.
+        """
+        location = os.path.realpath(location or Globals.get("DEFAULT_RUNTIME_LOCATION"))
+        with ReadOnlySnapshotPool._pools_lock:
+            if location not in ReadOnlySnapshotPool._pools:
+                ReadOnlySnapshotPool._pools[location] = ReadOnlySnapshotPool(
+                    base_dir, location
+                )
+            the_pool = ReadOnlySnapshotPool._pools[location]
+        # The operation_self of the most recent caller handles the printing
+        if operation_self:
+            the_pool.operation_self = operation_self
+        return the_pool
+
+    @staticmethod
+    def close_all():
+        """Remove all the snapshots of all the pools"""
+        with ReadOnlySnapshotPool._pools_lock:
+            for pool in ReadOnlySnapshotPool._pools.values():
+                pool.close()
+            ReadOnlySnapshotPool._pools = {}
+
+    @staticmethod
+    def is_snapshot(git_rootdir: str) -> bool:
+        """
+        Return True if the workspace is a read-only snapshot.  Only
+        reads the '.git' file of the workspace (a worktree has a
+        'gitdir: <dir>' file instead of a directory) and so is cheap
+        enough to call on every operation.
+        """
+        dot_git = os.path.join(git_rootdir, ".git")
+        if not os.path.isfile(dot_git):
+            return False
+        with open(dot_git, "r", encoding="utf8") as dot_git_fd:
+            line = dot_git_fd.readline().strip()
+        if not line.startswith("gitdir:"):
+            return False
+        git_dir = os.path.join(git_rootdir, line[len("gitdir:") :].strip())
+        return os.path.isfile(
+            os.path.join(git_dir, Globals.get("RO_SNAPSHOT_MARKER_FILE"))
+        )
+
+    @staticmethod
+    def is_alive(pid: int) -> bool:
+        """Return True if there is a process with the pid"""
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def __init__(self, base_dir: str, location: str, size: int = None):
+        """
+        An empty pool - the first lease creates the first generation
+        of snapshots.  Reclaims the snapshot directories left behind
+        by processes that are no longer running.
+        """
+        self.base_dir = os.path.realpath(base_dir)
+        self.location = location
+        self.size = size if size else Globals.get("RO_SNAPSHOT_POOL_SIZE")
+        self.snapshot_root = os.path.join(location, Globals.get("RO_SNAPSHOT_DIRNAME"))
+        self.snapshot_dir = os.path.join(self.snapshot_root, str(os.getpid()))
+        self.operation_self = None
+        # The current generation - a list of {"edf_dir", "git_dir",
+        # "leases", "retired"} dictionaries - and its origin/main tip
+        self.snapshots = []
+        self.tip = ""
+        self.generation = 0
+        self.next_index = 0
+        self.last_refresh = 0.0
+        # self.lock guards the above, self.refresh_lock serializes
+        # the fetches and rotations
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.reclaim_snapshot_dirs()
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"ReadOnlySnapshotPool(base_dir={self.base_dir}, size={self.size}, "
+            f"generation={self.generation}, tip={self.tip})"
+        )
+
+    def imprimir(self, a_line: str, incoming_printlevel: int):
+        """Print via the operation_self of the most recent caller, if any"""
+        if self.operation_self:
+            self.operation_self.imprimir(a_line, incoming_printlevel)
+
+    def git(self, git_dir: str, *args) -> str:
+        """
+        Run a git command in git_dir and return its stripped stdout.
+        Uses 'git -C' rather than changing the CWD of the (threaded)
+        process.  Raises a CalledProcessError if the command fails.
+        """
+        argv = ["git", "-C", git_dir] + list(args)
+        self.imprimir(f'Running ({" ".join(argv)})', 5)
+        return subprocess.run(
+            argv,
+            check=True,
+            capture_output=True,
+            text=True,
+            timeout=Globals.get("SHELL_TIMEOUT"),
+        ).stdout.strip()
+
+    def reclaim_snapshot_dirs(self):
+        """
+        Remove the snapshot directories of the processes that are no
+        longer running (and of a previous process with the same pid)
+        and prune their worktrees from the base.
+        """
+        if not os.path.isdir(self.snapshot_root):
+            return
+        reclaimed = False
+        for entry in os.scandir(self.snapshot_root):
+            if entry.name.isdigit() and (
+                int(entry.name) == os.getpid()
+                or not ReadOnlySnapshotPool.is_alive(int(entry.name))
+            ):
+                self.imprimir(f"Reclaiming read-only snapshots ({entry.path})", 4)
+                shutil.rmtree(entry.path, ignore_errors=True)
+                reclaimed = True
+        if reclaimed:
+            self.git(self.base_dir, "worktree", "prune")
+
+    def add_snapshot(self, tip: str, index: int) -> dict:
+        """
+        Create a snapshot of the next generation at tip, seeding its
+        per workspace caches from the corresponding snapshot of the
+        current generation, if any.
+        """
+        edf_dir = os.path.join(self.snapshot_dir, f"{self.generation + 1}.{index}")
+        self.imprimir(f"Creating read-only snapshot ({edf_dir}) at {tip}", 4)
+        self.git(self.base_dir, "worktree", "add", "--detach", "--quiet", edf_dir, tip)
+        git_dir = self.git(edf_dir, "rev-parse", "--absolute-git-dir")
+        with open(
+            os.path.join(git_dir, Globals.get("RO_SNAPSHOT_MARKER_FILE")),
+            "w",
+            encoding="utf8",
+        ) as marker_fd:
+            marker_fd.write(f"{tip}\n")
+        if self.snapshots:
+            previous = self.snapshots[index % len(self.snapshots)]
+            for name in ReadOnlySnapshotPool._seeded_files:
+                try:
+                    shutil.copy2(
+                        os.path.join(previous["git_dir"], Globals.get(name)),
+                        os.path.join(git_dir, Globals.get(name)),
+                    )
+                except FileNotFoundError:
+                    pass
+        return {"edf_dir": edf_dir, "git_dir": git_dir, "leases": 0, "retired": False}
+
+    def remove_snapshot(self, snapshot: dict):
+        """Remove a (drained) snapshot and drop its in memory caches"""
+        self.imprimir(f"Removing read-only snapshot ({snapshot['edf_dir']})", 4)
+        ElectionConfig.forget_workspace(snapshot["edf_dir"])
+        GitCatFilePool.close_pool(snapshot["edf_dir"])
+        try:
+            self.git(
+                self.base_dir, "worktree", "remove", "--force", snapshot["edf_dir"]
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            shutil.rmtree(snapshot["edf_dir"], ignore_errors=True)
+            self.git(self.base_dir, "worktree", "prune")
+
+    def refresh(self, force: bool = False):
+        """
+        Fetch the base and, if origin/main has moved, rotate to a new
+        generation of snapshots.  Unless forced this happens at most
+        every RO_SNAPSHOT_REFRESH_INTERVAL seconds.  Only one thread
+        refreshes at a time - the others keep using the current
+        generation rather than waiting, unless there is none yet.
+        """
+        interval = Globals.get("RO_SNAPSHOT_REFRESH_INTERVAL")
+        if not force and time.time() - self.last_refresh < interval:
+            return
+        # pylint: disable=consider-using-with
+        if not self.refresh_lock.acquire(blocking=not self.snapshots):
+            return
+        try:
+            if not force and time.time() - self.last_refresh < interval:
+                return
+            self.last_refresh = time.time()
+            try:
+                self.git(self.base_dir, "fetch", "--quiet", "origin")
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as exc:
+                # Keep serving the current generation
+                if not self.snapshots:
+                    raise
+                self.imprimir(
+                    f"[WARNING] cannot fetch ({self.base_dir}): {exc} - "
+                    "keeping the current read-only snapshots",
+                    2,
+                )
+                return
+            tip = self.git(
+                self.base_dir, "rev-parse", "--verify", "refs/remotes/origin/main"
+            )
+            if self.snapshots and tip == self.tip:
+                return
+            new_snapshots = [
+                self.add_snapshot(tip, index) for index in range(self.size)
+            ]
+            with self.lock:
+                old_snapshots = self.snapshots
+                self.snapshots = new_snapshots
+                self.tip = tip
+                self.generation += 1
+                drained = []
+                for snapshot in old_snapshots:
+                    snapshot["retired"] = True
+                    if snapshot["leases"] == 0:
+                        drained.append(snapshot)
+            for snapshot in drained:
+                self.remove_snapshot(snapshot)
+        finally:
+            self.refresh_lock.release()
+
+    @contextmanager
+    def lease(self):
+        """
+        Context manager that yields the ElectionData directory of a
+        read-only snapshot at the (recent) origin/main tip for the
+        duration of a query.
+        """
+        self.refresh()
+        with self.lock:
+            count = len(self.snapshots)
+            start = self.next_index
+            self.next_index = (start + 1) % count
+            snapshot = min(
+                (self.snapshots[(start + offset) % count] for offset in range(count)),
+                key=lambda snapshot: snapshot["leases"],
+            )
+            snapshot["leases"] += 1
+        try:
+            yield snapshot["edf_dir"]
+        finally:
+            with self.lock:
+                snapshot["leases"] -= 1
+                drained = snapshot["retired"] and snapshot["leases"] == 0
+            if drained:
+                self.remove_snapshot(snapshot)
+
+    def close(self):
+        """Remove all the snapshots - the leased ones included"""
+        with self.refresh_lock, self.lock:
+            snapshots = self.snapshots
+            self.snapshots = []
+            self.tip = ""
+        for snapshot in snapshots:
+            self.remove_snapshot(snapshot)
+        # The retired snapshots that are still leased
+        if os.path.isdir(self.snapshot_dir):
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+            self.git(self.base_dir, "worktree", "prune")
+
+
+# Do not leave the snapshots around at interpreter exit
+atexit.register(ReadOnlySnapshotPool.close_all)
+
+# EOF
@@ -22,10 +22,11 @@ import operator
 
 # local
 from .contest import Contest
+from .encoded_rcv_ballots import EncodedRcvBallots
 from .exceptions import TallyException
 
 
-# pylint: disable=too-many-instance-attributes # (8/7 - not worth it at this time)
+# pylint: disable=too-many-instance-attributes,too-many-public-methods # (not worth it at this time)
 class Tally:
     """
     A class to tally ballot contests a.k.a. CVRs.  The three primary
@@ -33,6 +34,9 @@ class Tally:
     print-the-tally function.
     """
 
+    # The RCV round engines - see recast_votes and recast_encoded_votes
+    _rcv_engines = ["classic", "encoded"]
+
     @staticmethod
     def get_choices_from_round(choices, what: str = ""):
         """Will smartly return just the pure list of choices sans all
@@ -42,7 +46,36 @@ class Tally:
             return [choice[1] for choice in choices]
         return [choice[0] for choice in choices]
 
-    def __init__(self, a_git_cvr: dict, operation_self: dict):
+    @staticmethod
+    def from_checkpoint(
+        checkpoint: dict, operation_self: dict, rcv_engine: str = "classic"
+    ):
+        """Will re-create a streaming Tally from a checkpoint as
+        returned by get_checkpoint.  More CVRs can then be added
+        without recounting the checkpointed ones.
+        """
+        the_tally = Tally(
+            {"digest": checkpoint["digest"], "contestCVR": checkpoint["contest"]},
+            operation_self,
+            streaming=True,
+            rcv_engine=rcv_engine,
+        )
+        the_tally.cvr_count = checkpoint["cvr_count"]
+        the_tally.vote_count = checkpoint["vote_count"]
+        the_tally.selection_counts = checkpoint["selection_counts"]
+        the_tally.rcv_ballots = [
+            (digest, tuple(selection))
+            for digest, selection in checkpoint["rcv_ballots"]
+        ]
+        return the_tally
+
+    def __init__(
+        self,
+        a_git_cvr: dict,
+        operation_self: dict,
+        streaming: bool = False,
+        rcv_engine: str = "classic",
+    ):
         """Given a contest as parsed from the git log, a.k.a the
         contest digest and CVR json payload, will construct a Tally.
         A tally object can validate and tally a contest.
@@ -55,6 +88,20 @@ class Tally:
         the outer ops class/object.  That object just passes down its
         print function to the Tally constructor so that each (contest)
         tally can handle printing as desired.
+
+        If streaming is True, the Tally is expected to be kept alive
+        and fed CVRs via add_cvr/add_cvrs as they are merged, with
+        update_results (re)computing the results.  In that case the
+        RCV first choice counts are kept as is and the ranked
+        selections of each CVR are saved so that the RCV rounds can
+        be re-run without a recount of the CVRs - see get_checkpoint.
+
+        The rcv_engine selects how the RCV rounds are run.  The
+        "classic" engine walks every CVR each round, popping the
+        eliminated choices off of the selection lists.  The "encoded"
+        engine encodes the ballots once as choice offsets and each
+        round only recasts the ballots of the eliminated choices - see
+        EncodedRcvBallots.  Both produce the same results and output.
         """
         #        import pdb; pdb.set_trace()
         self.operation_self = operation_self
@@ -70,6 +117,18 @@ class Tally:
         # Total vote count for this contest.  RCV rounds will not effect
         # this.
         self.vote_count = 0
+        # The number of CVRs added (counted) so far
+        self.cvr_count = 0
+        # When streaming, the pristine (digest, selection) pairs of the
+        # RCV CVRs added so far
+        self.streaming = streaming
+        self.rcv_ballots = []
+        if rcv_engine not in Tally._rcv_engines:
+            raise ValueError(
+                f"unsupported RCV engine ({rcv_engine}) - "
+                f"must be one of {Tally._rcv_engines}"
+            )
+        self.rcv_engine = rcv_engine
         # Ordered list of winners - a list of tuples and not dictionaries.
         self.winner_order = []
         # Used in both plurality and rcv, but only round 0 is used in
@@ -107,6 +166,7 @@ class Tally:
             "contest",
             "selection_counts",
             "vote_count",
+            "cvr_count",
             "winner_order",
             "rcv_round",
         ]:
@@ -158,17 +218,19 @@ class Tally:
                 self.vote_count += 1
                 if provenance_digest:
                     self.operation_self.imprimir(
-                        f"Counted {provenance_digest} as vote {vote_count}: choice={choice}",
+                        "Counted %s as vote %s: choice=%s",
                         0,
+                        args=(provenance_digest, vote_count, choice),
                     )
                 elif self.operation_self.verbosity == 5:
                     self.operation_self.imprimir(
-                        f"counted {digest} as vote {vote_count}: choice={choice}"
+                        "counted %s as vote %s: choice=%s",
+                        args=(digest, vote_count, choice),
                     )
             else:
                 if provenance_digest:
                     self.operation_self.imprimir(
-                        f"No-vote {provenance_digest}: BLANK", 0
+                        "No-vote %s: BLANK", 0, args=(provenance_digest,)
                     )
 
     def tally_a_rcv_contest(
@@ -186,12 +248,15 @@ class Tally:
             self.vote_count += 1
             if provenance_digest:
                 self.operation_self.imprimir(
-                    f"Counted {provenance_digest} as vote {vote_count}: choice={choice}",
+                    "Counted %s as vote %s: choice=%s",
                     0,
+                    args=(provenance_digest, vote_count, choice),
                 )
         else:
             if provenance_digest:
-                self.operation_self.imprimir(f"No vote {provenance_digest}: BLANK", 0)
+                self.operation_self.imprimir(
+                    "No vote %s: BLANK", 0, args=(provenance_digest,)
+                )
 
     def safely_determine_last_place_names(self, current_round: int) -> list:
         """Safely determine the next set of last_place_names for which
@@ -376,6 +441,9 @@ class Tally:
         this RCV round.  If there is no next choice, the there is no
         recast and the vote is dropped.
         """
+        if self.rcv_engine == "encoded":
+            self.recast_encoded_votes(last_place_names, contest_batch, checks)
+            return
 
         # Loop over CVRs
         for vote_count, uid in enumerate(contest_batch):
@@ -383,9 +451,9 @@ class Tally:
             digest = uid["digest"]
             if digest in checks:
                 self.operation_self.imprimir(
-                    f"INSPECTING: {digest} (contest={contest['contest_name']}) "
-                    f"as vote {vote_count + 1}",
+                    "INSPECTING: %s (contest=%s) as vote %s",
                     3,
+                    args=(digest, contest["contest_name"], vote_count + 1),
                 )
             # Note - if there is no selection, there is no selection
             if not contest["selection"]:
@@ -420,18 +488,83 @@ class Tally:
                         # original variant: if digest in checks or loglevel == "DEBUG":
                         if digest in checks or self.operation_self.verbosity >= 4:
                             self.operation_self.imprimir(
-                                f"RCV: {digest} (contest={contest['contest_name']}) last place "
-                                f"pop and count ({last_place_name} -> {new_choice_name})",
+                                "RCV: %s (contest=%s) last place pop and count (%s -> %s)",
                                 0,
+                                args=(
+                                    digest,
+                                    contest["contest_name"],
+                                    last_place_name,
+                                    new_choice_name,
+                                ),
                             )
                     else:
                         if digest in checks or self.operation_self.verbosity >= 4:
                             self.operation_self.imprimir(
-                                f"RCV: {digest} (contest={contest['contest_name']}) last place "
-                                f"pop and drop ({last_place_name} -> BLANK)",
+                                "RCV: %s (contest=%s) last place pop and drop (%s -> BLANK)",
                                 0,
+                                args=(digest, contest["contest_name"], last_place_name),
                             )
 
+    def recast_encoded_votes(
+        self,
+        last_place_names: list,
+        encoded_ballots: EncodedRcvBallots,
+        checks: list,
+    ):
+        """
+        The "encoded" engine variant of recast_votes - only the
+        ballots currently counting for a last place choice are
+        visited.  The (checks and verbose) printing is the same as
+        recast_votes and in the same ballot order.
+        """
+        choices = Contest.get_choices_from_contest(self.contest["choices"])
+        recasts = {
+            ballot: (loser, new_choice)
+            for ballot, loser, new_choice in encoded_ballots.eliminate(
+                [choices.index(name) for name in last_place_names]
+            )
+        }
+        inspected = set()
+        if checks:
+            inspected = {
+                ballot
+                for ballot, digest in enumerate(encoded_ballots.digests)
+                if digest in checks
+            }
+        for ballot in sorted(inspected.union(recasts)):
+            digest = encoded_ballots.digests[ballot]
+            if ballot in inspected:
+                self.operation_self.imprimir(
+                    "INSPECTING: %s (contest=%s) as vote %s",
+                    3,
+                    args=(digest, self.contest["contest_name"], ballot + 1),
+                )
+            if ballot not in recasts:
+                continue
+            last_place_name = choices[recasts[ballot][0]]
+            # Regardless of the next choice, the current choice is decremented
+            self.selection_counts[last_place_name] -= 1
+            if recasts[ballot][1] is not None:
+                new_choice_name = choices[recasts[ballot][1]]
+                self.selection_counts[new_choice_name] += 1
+                if digest in checks or self.operation_self.verbosity >= 4:
+                    self.operation_self.imprimir(
+                        "RCV: %s (contest=%s) last place pop and count (%s -> %s)",
+                        0,
+                        args=(
+                            digest,
+                            self.contest["contest_name"],
+                            last_place_name,
+                            new_choice_name,
+                        ),
+                    )
+            elif digest in checks or self.operation_self.verbosity >= 4:
+                self.operation_self.imprimir(
+                    "RCV: %s (contest=%s) last place pop and drop (%s -> BLANK)",
+                    0,
+                    args=(digest, self.contest["contest_name"], last_place_name),
+                )
+
     def handle_another_rcv_round(
         self, this_round: int, last_place_names: list, contest_batch: list, checks: list
     ):
@@ -496,70 +629,106 @@ class Tally:
         )
         return
 
-    def parse_all_contests(self, contest_batch: list, checks: list):
-        """Will parse all the contests validating each"""
-        errors = {}
-        vote_count = 0
-        for a_git_cvr in contest_batch:
-            vote_count += 1
-            contest = a_git_cvr["contestCVR"]
-            digest = a_git_cvr["digest"]
-            Contest.check_contest_blob_syntax(contest, digest=digest)
-            # Maybe print an provenance log for the tally of this contest
-            provenance_digest = digest if digest in checks else ""
-            # Validate the values that should be the same as self
-            for field in [
-                "choices",
-                "tally",
-                "win_by",
-                "max_selections",
-                "ggo",
-                "uid",
-                "contest_name",
-                "contest_type",
-                "election_upstream_remote",
-            ]:
-                if field in self.contest:
-                    if self.contest[field] != contest[field]:
-                        errors[digest].append(
-                            f"{field} field does not match: "
-                            f"{self.contest[field]} != {contest[field]}"
-                        )
-                elif field in contest:
-                    errors[digest].append(
-                        f"{field} field is not present in Tally object but "
-                        "is present in digest"
+    def add_cvr(self, a_git_cvr: dict, checks: list = None, errors: dict = None):
+        """
+        Will validate and count (the first round of) a single CVR.
+        For plurality tallies that is the complete count.  If errors
+        is supplied, structural errors are recorded there keyed by
+        digest for the caller to report, otherwise a TallyException is
+        raised.
+        """
+        report_errors = errors is None
+        if report_errors:
+            errors = {}
+        self.cvr_count += 1
+        contest = a_git_cvr["contestCVR"]
+        digest = a_git_cvr["digest"]
+        Contest.check_contest_blob_syntax(contest, digest=digest)
+        # Maybe print an provenance log for the tally of this contest
+        provenance_digest = digest if checks and digest in checks else ""
+        # Validate the values that should be the same as self
+        for field in [
+            "choices",
+            "tally",
+            "win_by",
+            "max_selections",
+            "ggo",
+            "uid",
+            "contest_name",
+            "contest_type",
+            "election_upstream_remote",
+        ]:
+            if field in self.contest:
+                if self.contest[field] != contest[field]:
+                    errors.setdefault(digest, []).append(
+                        f"{field} field does not match: "
+                        f"{self.contest[field]} != {contest[field]}"
                     )
-            # Tally the contest - this is just the first pass of a
-            # tally.  It just so happens that with plurality tallies
-            # the tally can be completed with a single pass over
-            # the CVRs.  And that can be done here.  But with more
-            # complicated tallies such as RCV, the additional passes
-            # are done outside of this for loop.
-            if contest["tally"] == "plurality":
-                self.tally_a_plurality_contest(
-                    contest, provenance_digest, vote_count, digest
-                )
-            elif contest["tally"] == "rcv":
-                # Since this is the first round on a rcv tally, just
-                # grap the first selection
-                self.tally_a_rcv_contest(contest, provenance_digest, vote_count)
-            else:
-                # This code block should never be executed as the
-                # constructor or the Validate values clause above will
-                # catch this type of error.  It is here only as a
-                # safety check during development time when adding
-                # support for more tallies.
-                raise NotImplementedError(
-                    f"the specified tally ({contest['tally']}) is not yet implemented"
+            elif field in contest:
+                errors.setdefault(digest, []).append(
+                    f"{field} field is not present in Tally object but "
+                    "is present in digest"
                 )
+        # Tally the contest - this is just the first pass of a
+        # tally.  It just so happens that with plurality tallies
+        # the tally can be completed with a single pass over
+        # the CVRs.  And that can be done here.  But with more
+        # complicated tallies such as RCV, the additional passes
+        # are done outside of this function.
+        if contest["tally"] == "plurality":
+            self.tally_a_plurality_contest(
+                contest, provenance_digest, self.cvr_count, digest
+            )
+        elif contest["tally"] == "rcv":
+            # Since this is the first round on a rcv tally, just
+            # grap the first selection
+            self.tally_a_rcv_contest(contest, provenance_digest, self.cvr_count)
+            if self.streaming:
+                self.rcv_ballots.append((digest, tuple(contest["selection"])))
+        else:
+            # This code block should never be executed as the
+            # constructor or the Validate values clause above will
+            # catch this type of error.  It is here only as a
+            # safety check during development time when adding
+            # support for more tallies.
+            raise NotImplementedError(
+                f"the specified tally ({contest['tally']}) is not yet implemented"
+            )
+        if report_errors and errors:
+            raise TallyException(
+                "The following CVRs have structural errors:" f"{errors}"
+            )
 
+    def add_cvrs(self, contest_batch: list, checks: list = None):
+        """
+        Will validate and count (the first round of) a batch of CVRs,
+        reporting all the structural errors found at the end.
+        """
+        errors = {}
+        for a_git_cvr in contest_batch:
+            self.add_cvr(a_git_cvr, checks, errors)
         # Will the potential CVR errors found, report them all
         if errors:
             raise TallyException(
                 "The following CVRs have structural errors:" f"{errors}"
             )
 
+    def parse_all_contests(self, contest_batch: list, checks: list):
+        """Will parse all the contests validating each"""
+        self.add_cvrs(contest_batch, checks)
+
+    def print_tally_header(self, batch_size: int):
+        """Will print the header of the (first round of a) tally"""
+        if self.contest["tally"] == "plurality":
+            self.operation_self.imprimir("Plurality - one round", 0)
+        else:
+            self.operation_self.imprimir_formatting("empty_line")
+            if batch_size > 1:
+                self.operation_self.imprimir_formatting("horizontal_shortline")
+            else:
+                self.operation_self.imprimir_formatting("horizontal_line")
+            self.operation_self.imprimir("RCV: round 0", 0)
+
     def tallyho(
         self,
         contest_batch: list,
@@ -572,17 +741,77 @@ class Tally:
         to check.
         """
         # Read all the contests, validate, and count votes
+        self.print_tally_header(len(contest_batch))
+        with self.operation_self.timed("tally", "add_cvrs"):
+            self.parse_all_contests(contest_batch, checks)
+        with self.operation_self.timed("tally", "rounds"):
+            self.tally_rounds(contest_batch, checks)
+
+    def update_results(self, checks: list = None):
+        """
+        For a streaming Tally, will (re)compute the results from the
+        CVRs added so far.  The plurality results are simply the
+        current counts.  The RCV rounds are re-run against copies of
+        the saved selections and afterwards the first round counts are
+        restored so that more CVRs can be added - i.e. the
+        selection_counts of a streaming RCV Tally are always the first
+        choice counts while rcv_round holds the results.
+        """
+        if not self.streaming:
+            raise TallyException(
+                "update_results can only be called on a streaming Tally"
+            )
+        checks = checks if checks else []
+        self.rcv_round = [[]]
+        self.winner_order = []
+        self.obe_choices = {}
+        self.print_tally_header(self.cvr_count)
         if self.contest["tally"] == "plurality":
-            self.operation_self.imprimir("Plurality - one round", 0)
-        else:
-            self.operation_self.imprimir_formatting("empty_line")
-            if len(contest_batch) > 1:
-                self.operation_self.imprimir_formatting("horizontal_shortline")
-            else:
-                self.operation_self.imprimir_formatting("horizontal_line")
-            self.operation_self.imprimir("RCV: round 0", 0)
-        self.parse_all_contests(contest_batch, checks)
+            self.tally_rounds([], checks)
+            return
+        first_choice_counts = self.selection_counts.copy()
+        contest_batch = [
+            {
+                "contestCVR": {
+                    "contest_name": self.contest["contest_name"],
+                    "selection": list(selection),
+                },
+                "digest": digest,
+            }
+            for digest, selection in self.rcv_ballots
+        ]
+        try:
+            self.tally_rounds(contest_batch, checks)
+        finally:
+            self.selection_counts = first_choice_counts
+
+    def get_checkpoint(self) -> dict:
+        """
+        Return a json serializable checkpoint of a streaming Tally -
+        see from_checkpoint.  Note - a plurality checkpoint is just the
+        counts while a RCV checkpoint also includes the selections of
+        every CVR since the RCV rounds need them.
+        """
+        if not self.streaming:
+            raise TallyException(
+                "get_checkpoint can only be called on a streaming Tally"
+            )
+        return {
+            "digest": self.digest,
+            "contest": self.contest,
+            "cvr_count": self.cvr_count,
+            "vote_count": self.vote_count,
+            "selection_counts": self.selection_counts,
+            "rcv_ballots": [
+                [digest, list(selection)] for digest, selection in self.rcv_ballots
+            ],
+        }
 
+    def tally_rounds(self, contest_batch: list, checks: list):
+        """
+        With the first round counted, will order the results and, for
+        RCV, run the additional RCV rounds as needed.
+        """
         # For all tallies order what has been counted so far (a tuple)
         self.rcv_round[0] = sorted(
             self.selection_counts.items(), key=operator.itemgetter(1), reverse=True
@@ -634,6 +863,8 @@ class Tally:
         last_place_names = self.safely_determine_last_place_names(0)
         for name in last_place_names:
             self.obe_choices[name] = 0
+        if self.rcv_engine == "encoded":
+            contest_batch = EncodedRcvBallots(contest_batch)
         # Go.  handle_another_rcv_round will return somehow at some point
         self.handle_another_rcv_round(1, last_place_names, contest_batch, checks)
         return
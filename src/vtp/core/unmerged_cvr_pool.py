@@ -0,0 +1,248 @@
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""An in-process pool of the not yet merged CVR branches"""
+
+# standard imports
+import os
+import random
+import threading
+
+# local imports
+from .common import Globals
+
+
+class UnmergedCvrPool:
+    """
+    A class to maintain, per workspace, the pool of CVR branches that
+    have not yet been merged to main, grouped by contest uid.  The
+    accept-ballot receipt only needs BALLOT_RECEIPT_ROWS random
+    digests per contest, and since a CVR branch is named
+    CVRs/<uid>/<random hex> and its head commit is the CVR, the pool
+    never needs to read (let alone parse) the CVRs themselves.
+
+    The pool is refreshed from a single 'git for-each-ref' over the
+    local and origin remote tracking CVR branches (see
+    get_pending_branches, which merge-contests uses as well) - the
+    branches that appeared or disappeared (merged) since the last
+    refresh are applied as a delta.  Branches created locally can also
+    be added directly.  The pools are held at the class level so that all the
+    ballots accepted in the same process share them.
+
+    Implementation note - each uid holds a list of branch names and a
+    branch to list offset map so that adding, removing (swap with the
+    last entry), and sampling are all O(1) per branch.
+    """
+
+    # class level registry of pools keyed on the workspace git_rootdir
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    @staticmethod
+    def get_pool(operation_self: dict, election_config: dict):
+        """Return the (shared) pool for the election_config workspace"""
+        git_rootdir = election_config.get("git_rootdir")
+        key = os.path.realpath(git_rootdir)
+        with UnmergedCvrPool._pools_lock:
+            if key not in UnmergedCvrPool._pools:
+                UnmergedCvrPool._pools[key] = UnmergedCvrPool(
+                    git_rootdir, election_config.get("git_initial_commit")
+                )
+            the_pool = UnmergedCvrPool._pools[key]
+        # The operation_self of the most recent caller handles the printing
+        the_pool.operation_self = operation_self
+        return the_pool
+
+    @staticmethod
+    def forget_pool(git_rootdir: str):
+        """Drop the pool of a (to be removed) workspace"""
+        with UnmergedCvrPool._pools_lock:
+            UnmergedCvrPool._pools.pop(os.path.realpath(git_rootdir), None)
+
+    @staticmethod
+    def branch_from_refname(refname: str) -> str:
+        """Return the CVRs/<uid>/<hex> branch name of a local or
+        origin remote tracking ref name, or "" if it is not a CVR
+        branch
+        """
+        for prefix in ["refs/heads/", "refs/remotes/origin/"]:
+            if refname.startswith(prefix):
+                branch = refname.removeprefix(prefix)
+                if branch.startswith(Globals.get("CONTEST_FILE_SUBDIR") + "/"):
+                    return branch
+        return ""
+
+    @staticmethod
+    def get_pending_branches(
+        operation_self: dict,
+        local: bool = True,
+        remote: bool = True,
+        branchpoint: str = "",
+    ) -> dict:
+        """
+        Return the pending (not yet merged) CVR branches of the CWD
+        workspace via a single 'git for-each-ref' as a uid -> {branch:
+        digest} dictionary.  The local branches are named
+        CVRs/<uid>/<hex> and the origin remote tracking branches
+        origin/CVRs/<uid>/<hex> (the 'git branch -r' names).  Both the
+        uids and the branches of each uid are in refname order.
+
+        Note - accept-ballot pushes a new CVR branch before committing
+        the CVR to it, so if a branchpoint (the initial election
+        commit) is supplied, the branches still at it are skipped as
+        they do not hold a CVR yet.
+        """
+        patterns = []
+        if local:
+            patterns.append("refs/heads/" + Globals.get("CONTEST_FILE_SUBDIR"))
+        if remote:
+            patterns.append("refs/remotes/origin/" + Globals.get("CONTEST_FILE_SUBDIR"))
+        pending = {}
+        if not patterns:
+            return pending
+        for line in operation_self.shell_out(
+            ["git", "for-each-ref", "--format=%(objectname) %(refname)"] + patterns,
+            incoming_printlevel=5,
+            printonly_override=True,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.splitlines():
+            digest, refname = line.split(" ", 1)
+            if digest == branchpoint:
+                continue
+            branch = UnmergedCvrPool.branch_from_refname(refname)
+            if not branch:
+                continue
+            uid = branch.split("/")[1]
+            if refname.startswith("refs/remotes/"):
+                branch = "origin/" + branch
+            pending.setdefault(uid, {})[branch] = digest
+        return pending
+
+    def __init__(self, git_rootdir: str, branchpoint: str = ""):
+        """
+        An empty pool - see refresh.  The branches still at the
+        branchpoint are not (yet) unmerged CVRs.
+        """
+        self.git_rootdir = git_rootdir
+        self.branchpoint = branchpoint
+        self.operation_self = None
+        # branch -> digest for all the branches in the pool
+        self.digests = {}
+        # uid -> list of branches and branch -> offset in that list
+        self.uid_branches = {}
+        self.offsets = {}
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        """Boilerplate"""
+        return (
+            f"UnmergedCvrPool(git_rootdir={self.git_rootdir}, "
+            f"branches={len(self.digests)}, uids={len(self.uid_branches)})"
+        )
+
+    def add_branch(self, branch: str, digest: str):
+        """Add a CVRs/<uid>/<hex> branch and its (head) digest"""
+        with self.lock:
+            self._add(branch, digest)
+
+    def remove_branch(self, branch: str):
+        """Remove a branch (nominally because it was merged)"""
+        with self.lock:
+            self._remove(branch)
+
+    def _add(self, branch: str, digest: str):
+        """Add a branch - the caller holds the lock"""
+        if branch in self.digests:
+            self.digests[branch] = digest
+            return
+        uid = branch.split("/")[1]
+        self.digests[branch] = digest
+        branches = self.uid_branches.setdefault(uid, [])
+        self.offsets[branch] = len(branches)
+        branches.append(branch)
+
+    def _remove(self, branch: str):
+        """Remove a branch - the caller holds the lock"""
+        if branch not in self.digests:
+            return
+        uid = branch.split("/")[1]
+        branches = self.uid_branches[uid]
+        offset = self.offsets.pop(branch)
+        last = branches.pop()
+        if last != branch:
+            branches[offset] = last
+            self.offsets[last] = offset
+        del self.digests[branch]
+
+    def refresh(self) -> tuple[int, int]:
+        """
+        Will apply the delta between the current local and origin
+        remote tracking CVR branches and the pool.  Returns the number
+        of (added, removed) branches.
+        """
+        with self.operation_self.changed_cwd(self.git_rootdir):
+            pending = UnmergedCvrPool.get_pending_branches(
+                self.operation_self, branchpoint=self.branchpoint
+            )
+        current = {}
+        for branches in pending.values():
+            for branch, digest in branches.items():
+                current[branch.removeprefix("origin/")] = digest
+        with self.lock:
+            removed = [branch for branch in self.digests if branch not in current]
+            for branch in removed:
+                self._remove(branch)
+            added = 0
+            for branch, digest in current.items():
+                if self.digests.get(branch) != digest:
+                    self._add(branch, digest)
+                    added += 1
+        self.operation_self.imprimir(
+            f"Unmerged CVR pool: {added} added, {len(removed)} removed, "
+            f"{len(self.digests)} total",
+            5,
+        )
+        return added, len(removed)
+
+    def uids(self) -> list:
+        """Return the contest uids with unmerged CVRs"""
+        with self.lock:
+            return [uid for uid, branches in self.uid_branches.items() if branches]
+
+    def count(self, uid: str) -> int:
+        """Return the number of unmerged CVRs of a contest uid"""
+        with self.lock:
+            return len(self.uid_branches.get(uid, []))
+
+    def sample(self, uid: str, count: int) -> list:
+        """
+        Return up to count randomly selected unmerged CVRs of the
+        contest uid as a list of {'digest': ..., 'branch': ...}
+        dictionaries - the same 'digest' key as the CVRs returned by
+        Operation.cvr_parse_git_log_output.
+        """
+        with self.lock:
+            branches = self.uid_branches.get(uid, [])
+            return [
+                {"digest": self.digests[branch], "branch": branch}
+                for branch in random.sample(branches, min(count, len(branches)))
+            ]
+
+
+# EOF
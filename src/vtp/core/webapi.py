@@ -22,9 +22,12 @@ import csv
 import json
 import os
 import re
+from contextlib import contextmanager
 
 # local imports
 from .common import Globals
+from .guid_workspace_manager import GuidWorkspaceManager
+from .readonly_snapshot_pool import ReadOnlySnapshotPool
 
 
 class WebAPI:
@@ -47,7 +50,8 @@ class WebAPI:
         generic/readonly commands.  It is 'readonly' because any
         number of processes could be executing in this one git
         workspace at the same time and if any them wrote anything, it
-        would be bad.
+        would be bad.  See get_readonly_edf_dir for spreading the
+        concurrent queries over read-only snapshots of it.
         """
         edf_path = os.path.join(
             Globals.get("DEFAULT_RUNTIME_LOCATION"),
@@ -74,6 +78,27 @@ class WebAPI:
             )
         return os.path.join(edf_path, dirs[0])
 
+    @staticmethod
+    @contextmanager
+    def get_readonly_edf_dir(operation_self: dict = None):
+        """
+        Context manager that yields the EDF workspace of a read-only
+        snapshot (of the generic EDF workspace) at the current main
+        tip for the duration of a generic/readonly command.  The
+        concurrent commands are routed over a pool of such snapshots
+        that are rotated forward as main advances - see
+        ReadOnlySnapshotPool.  Usage:
+
+            with WebAPI.get_readonly_edf_dir() as edf_dir:
+                an_op = ShowContestsOperation(election_data_dir=edf_dir, ...)
+                ...
+        """
+        the_pool = ReadOnlySnapshotPool.get_pool(
+            WebAPI.get_generic_ro_edf_dir(), operation_self=operation_self
+        )
+        with the_pool.lease() as edf_dir:
+            yield edf_dir
+
     @staticmethod
     def get_guid_based_edf_dir(guid: str) -> str:
         """
@@ -82,39 +107,11 @@ class WebAPI:
         named anything.  HOWEVER it is assumed (REQUIRED) that there
         is only one clone in this directory, which is reasonable given
         that the whole tree from '/' is nominally created by the
-        setup-vtp-demo operation.
+        setup-vtp-demo operation.  The lookup goes through the (in
+        memory) GuidWorkspaceManager inventory, which also records the
+        access for its LRU eviction.
         """
-        if len(guid) != 40:
-            raise ValueError(f"The provided guid is not 40 characters long: {guid}")
-        if not re.match("^[0-9a-f]+$", guid):
-            raise ValueError(
-                f"The provided guid contains characters other than [0-9a-f]: {guid}"
-            )
-        edf_path = os.path.join(
-            Globals.get("DEFAULT_RUNTIME_LOCATION"),
-            Globals.get("GUID_CLIENT_DIRNAME"),
-            guid[:2],
-            guid[2:],
-        )
-        # Need to verify that the _only_ directory in edf_path is a
-        # valid EDF tree via some clone
-        dirs = [
-            name
-            for name in os.listdir(edf_path)
-            if os.path.isdir(os.path.join(edf_path, name))
-        ]
-        if len(dirs) > 1:
-            raise ValueError(
-                f"The provided guid ({guid}) based path ({edf_path}) ",
-                "contains multiple subdirs - there can only be one",
-            )
-        if len(dirs) == 0:
-            raise ValueError(
-                f"The guid directory ({edf_path}) ",
-                "is empty - there needs to be exactly one git clone ",
-                "of a ElectionData repo",
-            )
-        return os.path.join(edf_path, dirs[0])
+        return GuidWorkspaceManager.get_manager().get_edf_dir(guid)
 
     @staticmethod
     def convert_csv_to_2d_list(ballot_check_cvs: list) -> list[list[str]]:
@@ -32,14 +32,12 @@ import os
 import random
 import secrets
 
-import qrcode
-import qrcode.image.svg
-
 # Project imports
 from vtp.core.address import Address
 from vtp.core.ballot import Ballot
 from vtp.core.common import Globals
 from vtp.core.election_config import ElectionConfig
+from vtp.core.unmerged_cvr_pool import UnmergedCvrPool
 from vtp.core.webapi import WebAPI
 from vtp.ops.merge_contests_operation import MergeContestsOperation
 
@@ -157,42 +155,31 @@ class AcceptBallotOperation(Operation):
         raise RuntimeError(f"could not create git branch {branch} on the third attempt")
 
     def get_unmerged_contests(self, config):
-        """Queries git for the unmerged CVRs and returns the list.  See
-        Shellout.cvr_parse_git_log_output for more info.  The returned
-        list is still in git log order.
+        """Returns a dictionary keyed on contest uid of up to
+        BALLOT_RECEIPT_ROWS randomly selected unmerged CVRs, each a
+        dictionary with a 'digest' key.  See UnmergedCvrPool - the
+        pool of unmerged CVR branches is shared across all the ballots
+        accepted by this process and is only refreshed from the delta
+        of a single 'git for-each-ref', so the CVRs themselves are
+        never read.
         """
-        # Mmm, at the moment the thought is that we need all the unmerged
-        # contests and ignore anything already merged.  So first get the
-        # list of HEAD commits for all the unmerged branches.  Note that
-        # since this is per contest, there should only be about 100 or so
-        # of them.
-        head_commits = (
-            self.shell_out(
-                [
-                    "git",
-                    "rev-list",
-                    "--no-walk",
-                    "--exclude=refs/heads/main",
-                    "--exclude=HEAD",
-                    "--exclude=refs/remotes/origin/main",
-                    "--exclude=refs/remotes/origin/HEAD",
-                    "--all",
-                ],
-                incoming_printlevel=5,
-                check=True,
-                capture_output=True,
-                text=True,
+        unmerged_pool = UnmergedCvrPool.get_pool(self, config)
+        unmerged_pool.refresh()
+        unmerged_cvrs = {}
+        for uid in unmerged_pool.uids():
+            unmerged_cvrs[uid] = unmerged_pool.sample(
+                uid, Globals.get("BALLOT_RECEIPT_ROWS")
             )
-            .stdout.strip()
-            .splitlines()
-        )
-        # With that list of HEAD exclusion commits, list the rest of the
-        # --yes-walk commits and scrape that for the commits of interest.
-        return self.cvr_parse_git_log_output(
-            ["git", "log", "--no-walk", "--pretty=format:%H%B"] + head_commits,
-            config,
-            incoming_printlevel=5,
-        )
+        return unmerged_cvrs
+
+    def add_to_unmerged_pool(
+        self, config: dict, branches: list, contest_receipts: dict
+    ):
+        """Add the newly created CVR branches (named CVRs/<uid>/...) and
+        their digests to the shared unmerged CVR pool"""
+        unmerged_pool = UnmergedCvrPool.get_pool(self, config)
+        for branch in branches:
+            unmerged_pool.add_branch(branch, contest_receipts[branch.split("/")[1]])
 
     def get_cloaked_contests(self, contest, branch):
         """Return a list of N cloaked cast CVRs for the specified contest.
@@ -267,14 +254,8 @@ class AcceptBallotOperation(Operation):
                 incoming_printlevel=5,
             )
         # Capture the digest
-        digest = self.shell_out(
-            ["git", "log", "-1", "--pretty=format:%H"],
-            check=True,
-            capture_output=True,
-            text=True,
-            incoming_printlevel=5,
-        ).stdout.strip()
-        return digest
+        results = self.git_cat_file(["HEAD"], os.getcwd(), incoming_printlevel=5)
+        return results[0]["objectname"] if results else ""
 
     def create_ballot_receipt(
         self, the_ballot, contest_receipts, unmerged_cvrs, the_election_config
@@ -434,6 +415,9 @@ class AcceptBallotOperation(Operation):
                     # if cloaking, get those as well
                     if "cloak" in contest.get("contest"):
                         cloak_receipts[uid] = self.get_cloaked_contests(contest, "main")
+            # The next ballot can sample these CVRs without waiting on
+            # a refresh
+            self.add_to_unmerged_pool(the_election_config, branches, contest_receipts)
             # After all the contests digests have been generated as well
             # as the others and cloaks as much as possible, then push as
             # atomically as possible all the contests.
@@ -450,18 +434,231 @@ class AcceptBallotOperation(Operation):
                 )
         return contest_receipts, branches, unmerged_cvrs, cloak_receipts
 
+    def fast_import_commits(self, the_election_config: dict, commits: list) -> list:
+        """
+        Will create the supplied commits via a single 'git fast-import'
+        stream without touching the working tree, the index, or the
+        checked out branch.  Each commit is a (branch, path, content,
+        message) tuple where path is relative to the git_rootdir.
+        Each commit is a child of the initial election commit (the
+        same branchpoint as checkout_new_branch) with the single file
+        added.  Returns the list of commit digests in the same order.
+
+        Note - the author/committer ident is the same one 'git
+        commit' would use - see get_git_idents.
+        """
+        author, committer = self.get_git_idents()
+        branchpoint = the_election_config.get("git_initial_commit").encode("utf8")
+
+        def data(payload: bytes) -> bytes:
+            return b"data " + str(len(payload)).encode("utf8") + b"\n" + payload
+
+        stream = []
+        for mark, (branch, path, content, message) in enumerate(commits, start=1):
+            stream += [
+                b"commit refs/heads/" + branch.encode("utf8"),
+                b"mark :" + str(mark).encode("utf8"),
+                b"author " + author,
+                b"committer " + committer,
+                data(message.encode("utf8")),
+                b"from " + branchpoint,
+                b"M 100644 inline " + path.encode("utf8"),
+                data(content.encode("utf8")),
+                b"",
+            ]
+        # Ask for the commit digests (written to stdout)
+        stream += [
+            b"get-mark :" + str(mark).encode("utf8")
+            for mark in range(1, len(commits) + 1)
+        ]
+        stream += [b"done", b""]
+        with self.changed_cwd(the_election_config.get("git_rootdir")):
+            digests = (
+                self.shell_out(
+                    ["git", "fast-import", "--quiet", "--done"],
+                    input=b"\n".join(stream),
+                    check=True,
+                    capture_output=True,
+                    incoming_printlevel=5,
+                )
+                .stdout.decode("utf8")
+                .split()
+            )
+        # printonly returns nothing
+        return digests if digests else [""] * len(commits)
+
+    def push_and_delete_branches(self, branches: list, atomic: bool = False):
+        """
+        Will push the supplied new local branches with a single 'git
+        push' and, only if that succeeded, delete the local branches
+        via a single 'git update-ref --stdin' (the local reflog keeps
+        track of the local branches).  If the push fails the local
+        branches are left as is so that nothing is lost.
+
+        If atomic is True, the push is a 'git push --atomic' so that
+        either all or none of the branches land on the remote.  In
+        that case a failed push deletes the local branches as well
+        (the commits were never published) and raises a RuntimeError
+        so that the caller can fail the ballot as a whole.
+        """
+        result = self.shell_out(
+            ["git", "push"] + (["--atomic"] if atomic else []) + ["origin"] + branches,
+            incoming_printlevel=5,
+        )
+        if result.returncode != 0 and not atomic:
+            self.imprimir(
+                f"could not push branches {branches} - leaving the local branches",
+                2,
+            )
+            return
+        self.shell_out(
+            ["git", "update-ref", "--stdin"],
+            input="".join(f"delete refs/heads/{branch}\n" for branch in branches),
+            text=True,
+            check=True,
+            incoming_printlevel=5,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"the atomic push of the ballot's branches {branches} failed - "
+                "none of the branches were pushed"
+            )
+
+    def main_handle_contests_fast_import(
+        self,
+        a_ballot: dict,
+        the_election_config: dict,
+        push: bool = True,
+    ):
+        """
+        Called only by main.  The same as main_handle_contests but
+        instead of a checkout/add/commit dance per contest, all the
+        contest CVR commits of the ballot are created with one 'git
+        fast-import' and pushed with one 'git push'.  If push is
+        False, the caller is responsible for pushing (and deleting)
+        the local branches.
+        """
+        contest_receipts = {}
+        branches = []
+        cloak_receipts = {}
+        commits = []
+        contest_file = os.path.relpath(
+            Ballot.gen_contest_location(
+                the_election_config, a_ballot.get("ballot_subdir")
+            ),
+            the_election_config.get("git_rootdir"),
+        )
+        with self.changed_cwd(a_ballot.get_cvr_parent_dir(the_election_config)):
+            # See main_handle_contests
+            unmerged_cvrs = self.get_unmerged_contests(the_election_config)
+            for contest in a_ballot.get("contests"):
+                # Note - the branch names are unique within the ballot
+                # as they include the contest uid.  The push below will
+                # fail on the (highly unlikely) remote name collision.
+                branches.append(self.new_branch_name(contest, "contest"))
+                contest.set("cast_branch", branches[-1])
+                payload = Ballot.gen_contest_payload(contest)
+                # 'git commit -F' would have added a trailing newline
+                commits.append((branches[-1], contest_file, payload, payload + "\n"))
+                # if cloaking, get those as well
+                if "cloak" in contest.get("contest"):
+                    cloak_receipts[contest.get("uid")] = self.get_cloaked_contests(
+                        contest, "main"
+                    )
+            digests = self.fast_import_commits(the_election_config, commits)
+            for contest, digest in zip(a_ballot.get("contests"), digests):
+                contest_receipts[contest.get("uid")] = digest
+            self.add_to_unmerged_pool(the_election_config, branches, contest_receipts)
+            if push:
+                self.push_and_delete_branches(branches)
+        return contest_receipts, branches, unmerged_cvrs, cloak_receipts
+
+    def create_qr_image(
+        self, a_ballot: dict, the_election_config: dict, receipt_digest: str
+    ):
+        """
+        Create the (untracked) QR image that points to the versioned
+        ballot receipt and return the qrcode image.
+        """
+        # qrcode is only needed here - import it lazily so that the
+        # CLI startup (and the non receipt paths) do not pay for it
+        # pylint: disable=import-outside-toplevel
+        import qrcode
+        import qrcode.image.svg
+
+        qr_url = (
+            f"{Globals.get('ELECTION_UPSTREAM_REMOTE')}/"
+            # to point to the file on the branch
+            # f"/blob/{receipt_branch}/{a_ballot.get('ballot_subdir')}/"
+            # f"{receipt_branch}/{Globals.get('RECEIPT_FILE')}.md"
+            #
+            # to point the ballot receipt commit
+            f"show-commit.html?digest={receipt_digest}"
+        )
+        qr_img = qrcode.make(
+            qr_url,
+            image_factory=qrcode.image.svg.SvgImage,
+        )
+        # The qr_file is not versioned and placed next to the
+        # ballot.json and receipt.csv
+        qr_file = Ballot.gen_receipt_location(
+            the_election_config, a_ballot.get("ballot_subdir")
+        )
+        qr_file = os.path.join(os.path.dirname(qr_file), "qr.svg")
+        with open(qr_file, "wb") as qr_fh:
+            qr_img.save(qr_fh)
+        self.imprimir(f"#### Created (untracked) QR file: {qr_file}")
+        return qr_img
+
     # pylint: disable=too-many-arguments
     def main_handle_receipt(
         self,
         a_ballot: dict,
         ballot_check: list,
         the_election_config: dict,
+        fast_import: bool = False,
+        push: bool = True,
     ):
-        """Called only by main.  Handles the receipt git dance"""
+        """Called only by main.  Handles the receipt git dance.  See
+        main_handle_contests_fast_import for fast_import and push.
+        """
         # When here the actual voucher file on disk wants to be a
         # markdown file for a web-api endpoint rather than the
         # original csv file defined above.
         receipt_digest = None
+        if fast_import:
+            # Commit and push the receipt without touching the working
+            # tree - see main_handle_contests_fast_import
+            receipt_branch = self.new_branch_name("", "receipt")
+            receipt_file = os.path.relpath(
+                Ballot.gen_receipt_location(
+                    the_election_config,
+                    a_ballot.get("ballot_subdir"),
+                    receipt_branch,
+                    versioned=True,
+                ),
+                the_election_config.get("git_rootdir"),
+            )
+            receipt_digest = self.fast_import_commits(
+                the_election_config,
+                [
+                    (
+                        receipt_branch,
+                        receipt_file,
+                        Ballot.gen_receipt_csv(ballot_check),
+                        "Ballot Voucher\n",
+                    )
+                ],
+            )[0]
+            self.imprimir(
+                f"#### Versioned csv receipt (branch={receipt_branch}, "
+                f"digest={receipt_digest}): {receipt_file}"
+            )
+            if push:
+                with self.changed_cwd(the_election_config.get("git_rootdir")):
+                    self.push_and_delete_branches([receipt_branch])
+            qr_img = self.create_qr_image(a_ballot, the_election_config, receipt_digest)
+            return receipt_branch, qr_img, receipt_digest
         with self.changed_cwd(a_ballot.get_cvr_parent_dir(the_election_config)):
             with self.changed_branch("main"):
                 # Create a unique branch for the receipt
@@ -490,28 +687,9 @@ class AcceptBallotOperation(Operation):
 
                 # Create the QR image while still in the branch as exiting the
                 # above with will nominally delete it
-                qr_url = (
-                    f"{Globals.get('ELECTION_UPSTREAM_REMOTE')}/"
-                    # to point to the file on the branch
-                    # f"/blob/{receipt_branch}/{a_ballot.get('ballot_subdir')}/"
-                    # f"{receipt_branch}/{Globals.get('RECEIPT_FILE')}.md"
-                    #
-                    # to point the ballot receipt commit
-                    f"show-commit.html?digest={receipt_digest}"
-                )
-                qr_img = qrcode.make(
-                    qr_url,
-                    image_factory=qrcode.image.svg.SvgImage,
-                )
-                # The qr_file is not versioned and placed next to the
-                # ballot.json and receipt.csv
-                qr_file = Ballot.gen_receipt_location(
-                    the_election_config, a_ballot.get("ballot_subdir")
+                qr_img = self.create_qr_image(
+                    a_ballot, the_election_config, receipt_digest
                 )
-                qr_file = os.path.join(os.path.dirname(qr_file), "qr.svg")
-                with open(qr_file, "wb") as qr_fh:
-                    qr_img.save(qr_fh)
-                self.imprimir(f"#### Created (untracked) QR file: {qr_file}")
 
                 # Create a markdown version of the receipt that contains the QR code.
                 # demo_receipt = a_ballot.write_receipt_md(
@@ -536,6 +714,7 @@ class AcceptBallotOperation(Operation):
     # pylint: disable=duplicate-code
     # pylint: disable=too-many-locals
     # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-branches
     def run(
         self,
         an_address: Address = None,
@@ -543,6 +722,8 @@ class AcceptBallotOperation(Operation):
         cast_ballot_json: dict = "",
         merge_contests: bool = False,
         version_receipts: bool = False,
+        fast_import: bool = False,
+        atomic_push: bool = False,
     ) -> tuple[list, int, str, str]:
         """
         Main function - see -h for more info.  Will work with either
@@ -555,6 +736,16 @@ class AcceptBallotOperation(Operation):
         dict of the JSON.
 
         Incoming cast ballots are verified.
+
+        If fast_import is True, the contest CVR (and receipt) commits
+        are created via 'git fast-import' without touching the working
+        tree - see main_handle_contests_fast_import.
+
+        If atomic_push is True (which implies fast_import), all the
+        contest branches and the receipt branch of the ballot are
+        pushed with a single 'git push --atomic' - either the whole
+        ballot lands on the remote or none of it does, in which case
+        a RuntimeError is raised.
         """
 
         # Create a VTP ElectionData object if one does not already exist
@@ -600,6 +791,11 @@ class AcceptBallotOperation(Operation):
         # Validate it
         a_ballot.verify_cast_ballot_data(the_election_config)
 
+        # The atomic push requires the not yet pushed local branches
+        # that the fast-import path creates
+        if atomic_push:
+            fast_import = True
+
         # Set the three EV's
         os.environ["GIT_AUTHOR_DATE"] = Globals.get("ELECTION_DATETIME")
         os.environ["GIT_COMMITTER_DATE"] = Globals.get("ELECTION_DATETIME")
@@ -612,9 +808,14 @@ class AcceptBallotOperation(Operation):
             branches,
             unmerged_cvrs,
             cloak_receipts,
-        ) = self.main_handle_contests(
+        ) = (
+            self.main_handle_contests_fast_import
+            if fast_import
+            else self.main_handle_contests
+        )(
             a_ballot=a_ballot,
             the_election_config=the_election_config,
+            **({"push": False} if atomic_push else {}),
         )
 
         # Create the ballot check
@@ -628,10 +829,21 @@ class AcceptBallotOperation(Operation):
                 a_ballot=a_ballot,
                 ballot_check=ballot_check,
                 the_election_config=the_election_config,
+                fast_import=fast_import,
+                push=not atomic_push,
             )
         else:
             receipt_branch = None
             qr_img = None
+            receipt_digest = None
+
+        # Atomically push the whole ballot
+        if atomic_push:
+            with self.changed_cwd(the_election_config.get("git_rootdir")):
+                self.push_and_delete_branches(
+                    branches + ([receipt_branch] if receipt_branch else []),
+                    atomic=True,
+                )
 
         # Optionally merge the branches now and avoid calling
         # merge-contests later. Note - this will serialize the ballots
@@ -655,6 +867,8 @@ class AcceptBallotOperation(Operation):
                     verbosity=self.verbosity,
                     printonly=self.printonly,
                 )
+                if self.instrumentation is not None:
+                    mco.enable_instrumentation(self.instrumentation)
                 self.imprimir("Calling MergeContestsOperation.run (contest)", 5)
                 mco.run(
                     branch="origin/" + branch,
@@ -29,8 +29,6 @@ the Merkle tree.
 import pprint
 import random
 
-import pyinputplus
-
 # Project imports
 from vtp.core.address import Address
 from vtp.core.ballot import Ballot, BlankBallot
@@ -68,6 +66,10 @@ class CastBallotOperation(Operation):
 
     def get_user_selection(self, the_contest, count, total_contests):
         """Print the contest and get the selection(s) from the user"""
+        # Only the interactive (non demo) path needs pyinputplus
+        # pylint: disable=import-outside-toplevel
+        import pyinputplus
+
         choices = the_contest.get("choices")
         tally = the_contest.get("tally")
         max_votes = the_contest.get("max_selections")
@@ -182,6 +184,9 @@ class CastBallotOperation(Operation):
                 self.get_user_selection(contest, count, total_contests)
         # pylint: disable=too-many-nested-blocks
         if not demo_mode:
+            # pylint: disable=import-outside-toplevel
+            import pyinputplus
+
             # UX wise replicate the self adjudication experince.  This is
             # basically another endless loop until done
             while True:
@@ -24,13 +24,15 @@ for the CVR stays intact in a Merkle tree sense.
 """
 
 # Standard imports
+import base64
 import os
 import random
-import re
+import secrets
 
 # Project import
 from vtp.core.common import Globals
 from vtp.core.election_config import ElectionConfig
+from vtp.core.unmerged_cvr_pool import UnmergedCvrPool
 
 # Local imports
 from .operation import Operation
@@ -180,16 +182,179 @@ class MergeContestsOperation(Operation):
                 incoming_printlevel=5,
             )
 
+    def get_contest_files(self, branches: list, digests: dict = None) -> dict:
+        """
+        Return the contest file of each of the supplied CVR branches as
+        a branch -> (digest, contest_file) dictionary via a single 'git
+        cat-file' and a single 'git diff-tree' regardless of the number
+        of branches.  The 'git cat-file' is skipped if the branch ->
+        digest dictionary is supplied (see get_pending_branches).
+        Branches with no files are not included (see
+        merge_contest_branch).
+        """
+        if digests:
+            digests = [digests[branch] for branch in branches]
+        else:
+            digests = self.shell_out(
+                ["git", "cat-file", "--batch-check=%(objectname)"],
+                input="\n".join(branches) + "\n",
+                incoming_printlevel=5,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.split()
+        # Without --no-commit-id each commit digest is printed ahead
+        # of its files
+        digest_set = set(digests)
+        contest_files = {}
+        for line in self.shell_out(
+            ["git", "diff-tree", "-r", "--name-only", "--stdin"],
+            input="\n".join(digests) + "\n",
+            incoming_printlevel=5,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.splitlines():
+            if line in digest_set:
+                digest = line
+            elif line:
+                contest_files[digest] = line
+        return {
+            branch: (digest, contest_files[digest])
+            for branch, digest in zip(branches, digests)
+            if digest in contest_files
+        }
+
+    # pylint: disable=too-many-locals
+    def merge_contest_branches(
+        self, branches: list, remote: bool, digests: dict = None
+    ):
+        """
+        Will merge the supplied contest branches to main as a chain of
+        merge commits, one per branch, exactly as merge_contest_branch
+        would have created them (the contest file of each merge is
+        slammed to a runtime random value), but with a single push of
+        main per call.  The merge commits are created with a single
+        'git fast-import' stream on a scratch ref which main is then
+        fast-forwarded to.  Main and the deletion of all the merged
+        branches are pushed in one 'git push --atomic' so that either
+        the batch is merged or none of it is.  Returns the number of
+        branches merged.  The optional digests are passed to
+        get_contest_files.
+        """
+        contest_files = self.get_contest_files(branches, digests)
+        for branch in branches:
+            if branch not in contest_files:
+                self.imprimir(
+                    "(contest) 'git diff-tree -r --name-only --stdin' "
+                    f"returned no files for {branch}.  Skipping",
+                    1,
+                )
+        if not contest_files:
+            return 0
+        author, committer = self.get_git_idents()
+        message = b"auto commit - thank you for voting"
+        scratch_ref = "refs/vtp/merge-batch"
+
+        def data(payload: bytes) -> bytes:
+            return b"data " + str(len(payload)).encode("utf8") + b"\n" + payload
+
+        # ZZZ - as with merge_contest_branch, replace the random
+        # content with a run-time cryptographic value derived from
+        # the run-time election private key.  Note - the 'openssl
+        # rand -base64 48' content is generated in process.
+        stream = []
+        parent = b"refs/heads/main^0"
+        for mark, (digest, contest_file) in enumerate(contest_files.values(), start=1):
+            stream += [
+                b"commit " + scratch_ref.encode("utf8"),
+                b"mark :" + str(mark).encode("utf8"),
+                b"author " + author,
+                b"committer " + committer,
+                data(message),
+                b"from " + parent,
+                b"merge " + digest.encode("utf8"),
+                b"M 100644 inline " + contest_file.encode("utf8"),
+                data(base64.encodebytes(secrets.token_bytes(48))),
+                b"",
+            ]
+            parent = b":" + str(mark).encode("utf8")
+        stream += [b"done", b""]
+        self.shell_out(
+            ["git", "fast-import", "--quiet", "--force", "--done"],
+            input=b"\n".join(stream),
+            check=True,
+            incoming_printlevel=5,
+        )
+        main_tip = self.shell_out(
+            ["git", "rev-parse", "main"],
+            incoming_printlevel=5,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        self.shell_out(
+            ["git", "merge", "--ff-only", scratch_ref],
+            check=True,
+            incoming_printlevel=5,
+        )
+        self.shell_out(
+            ["git", "update-ref", "-d", scratch_ref],
+            check=True,
+            incoming_printlevel=5,
+        )
+        # Push main and delete the remote branches in one go
+        result = self.shell_out(
+            ["git", "push", "--atomic", "origin", "main"]
+            + [":" + branch.removeprefix("origin/") for branch in contest_files],
+            incoming_printlevel=5,
+        )
+        if result.returncode != 0:
+            # Nothing was published - back out the local merges
+            self.shell_out(
+                ["git", "reset", "--hard", main_tip],
+                check=True,
+                incoming_printlevel=5,
+            )
+            raise RuntimeError(
+                f"could not push the merge of {len(contest_files)} contest "
+                "branches - backed out the local merges"
+            )
+        # Delete the local branches if these are local branches
+        if not remote:
+            self.shell_out(
+                ["git", "update-ref", "--stdin"],
+                input="".join(
+                    f"delete refs/heads/{branch}\n" for branch in contest_files
+                ),
+                check=True,
+                incoming_printlevel=5,
+                text=True,
+            )
+        return len(contest_files)
+
     # pylint: disable=too-many-arguments
     def randomly_merge_contests(
-        self, uid: str, batch: list, minimum_cast_cache: int, flush: bool, remote: bool
+        self,
+        uid: str,
+        batch: list,
+        minimum_cast_cache: int,
+        flush: bool,
+        remote: bool,
+        batch_size: int = 0,
+        digests: dict = None,
     ):
         """
         Will randomingly select (len(batch) - BALLOT_RECEIPT_ROWS) contest
         branches from the supplied list of branch and merge them to the
         main branch.
 
-        This is the git merge-to-main sequence.
+        This is the git merge-to-main sequence.  If batch_size is
+        non zero, the same random selection is merged batch_size
+        branches at a time via merge_contest_branches (one push of
+        main per batch) rather than one branch at a time.  The
+        optional branch -> digest dictionary saves looking the
+        digests up again.
         """
         if len(batch) <= minimum_cast_cache:
             if flush:
@@ -204,13 +369,23 @@ class MergeContestsOperation(Operation):
             count = len(batch) - minimum_cast_cache
         loop = count
         self.imprimir(f"Merging {count} contests for contest {uid}", 4)
+        picks = []
         while loop:
             pick = random.randrange(len(batch))
             branch = batch[pick]
-            self.merge_contest_branch(branch, remote)
+            if batch_size:
+                picks.append(branch)
+            else:
+                self.merge_contest_branch(branch, remote)
             # End of loop maintenance
             del batch[pick]
             loop -= 1
+        if picks:
+            count = 0
+            for offset in range(0, len(picks), batch_size):
+                count += self.merge_contest_branches(
+                    picks[offset : offset + batch_size], remote, digests
+                )
         self.imprimir(f"Merged {count} {uid} contests", 4)
         return count
 
@@ -222,6 +397,7 @@ class MergeContestsOperation(Operation):
         remote: bool = False,
         minimum_cast_cache: int = 100,
         style: str = "contest",
+        batch_size: int = 0,
     ):
         """
         Main function - see -h for more info.  Note that the merge
@@ -239,6 +415,13 @@ class MergeContestsOperation(Operation):
         actual branch specification in this case contains an 'origin/'
         prefix which needs to be stripped as git nominally does not
         want that when deleting remote branches.
+
+        If batch_size is non zero, the randomly selected contest
+        branches are merged batch_size at a time with one (atomic)
+        push of main and of the branch deletions per batch - see
+        merge_contest_branches.
+
+        Returns the number of branches merged.
         """
 
         # Create a VTP ElectionData object if one does not already exist
@@ -270,64 +453,23 @@ class MergeContestsOperation(Operation):
                 else:
                     self.merge_receipt_branch(branch, remote)
                 self.imprimir(f"Merged '{branch}'", 4)
-                return
-            # Get the pending CVR branches
-            cmds = ["git", "branch"]
-            cvr_regex = f"{Globals.get('CONTEST_FILE_SUBDIR')}/([^/]+?)/"
-            if remote:
-                cmds.append("-r")
-                cvr_regex = "^origin/" + cvr_regex
-            else:
-                cvr_regex = "^" + cvr_regex
-            # Note - the re.search will strip non CVRs lines, and then
-            # after that each result is strip'ed
-            cvr_branches = [
-                this_branch.strip()
-                for this_branch in self.shell_out(
-                    cmds,
-                    incoming_printlevel=5,
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                ).stdout.splitlines()
-                if re.search(cvr_regex, this_branch.strip())
-            ]
-            #            import pdb; pdb.set_trace()
-            # Note - sorted alphanumerically on contest UID. Loop over
-            # contests and randomly merge extras
-            batch = []  # if ordered_set was native would probably use that
-            current_uid = "-1"
-            for this_branch in cvr_branches:
-                uid = re.search(cvr_regex, this_branch).group(1)
-                if current_uid == uid:
-                    batch.append(this_branch)
-                    continue
-                # Since cvr_branches is ordered, when there is a new uid
-                # that does not match the current_uid then try to merge
-                # that contest uid set of branched.  Also try to merge the
-                # batch if this is the final iteration of the loop.
-                if current_uid != "-1":
-                    # see if previous batch can be merged
-                    merged += self.randomly_merge_contests(
-                        uid=current_uid,
-                        batch=batch,
-                        flush=flush,
-                        remote=remote,
-                        minimum_cast_cache=minimum_cast_cache,
-                    )
-                # Start a new next batch
-                current_uid = uid
-                batch = [this_branch]
-            if batch:
-                # Always try to merge the remaining batch
+                return 1
+            # Get the pending CVR branches grouped by contest uid
+            pending = UnmergedCvrPool.get_pending_branches(
+                self, local=not remote, remote=remote
+            )
+            for uid, branches in pending.items():
                 merged += self.randomly_merge_contests(
-                    uid=current_uid,
-                    batch=batch,
+                    uid=uid,
+                    batch=list(branches),
                     flush=flush,
                     remote=remote,
                     minimum_cast_cache=minimum_cast_cache,
+                    batch_size=batch_size,
+                    digests=branches,
                 )
         self.imprimir(f"Merged {merged} contest branches", 3)
+        return merged
 
 
 # EOF
@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+
+#  VoteTrackerPlus
+#   Copyright (C) 2022 Sandy Currier
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program; if not, write to the Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Logic of operation for the merge daemon - a long running VTP server
+process that merges the pushed CVR contest branches as they arrive.
+"""
+
+# Standard imports
+import collections
+import hashlib
+import json
+import os
+import select
+import statistics
+import time
+
+# Project imports
+from vtp.core.common import Globals
+from vtp.core.election_config import ElectionConfig
+from vtp.core.unmerged_cvr_pool import UnmergedCvrPool
+
+# Local imports
+from .merge_contests_operation import MergeContestsOperation
+from .operation import Operation
+
+# The post-receive hook that notifies the merge daemon FIFO.  Note -
+# the FIFO is opened read-write so that the hook never blocks when no
+# daemon is reading it.
+POST_RECEIVE_HOOK = """#!/bin/sh
+# VTP merge-daemon notification hook - see merge-daemon --install_hook
+FIFO="{fifo}"
+[ -p "$FIFO" ] || exit 0
+exec 3<>"$FIFO"
+grep " refs/heads/{cvr_dir}/" >&3
+exit 0
+"""
+
+
+class MergeDaemonOperation(Operation):
+    """
+    A class to implememt the merge-daemon operation.  See the
+    merge-daemon help output or read the parse_argument argparse
+    description in the cli/merge_daemon.py source file.
+
+    Rather than re-running merge-contests every N seconds, the daemon
+    waits to be told that CVR branches were pushed to the remote -
+    either by the post-receive hook of the (bare) remote writing to a
+    FIFO or, by default, by polling the remote CVR refs - and only
+    then pulls and merges the contests that exceed the
+    minimum_cast_cache.  The ElectionConfig, the MergeContestsOperation,
+    and the pending branch index are created once and kept for the
+    life of the daemon.
+    """
+
+    def __init__(
+        self,
+        election_data_dir: str = "",
+        verbosity: int = 3,
+        printonly: bool = False,
+        stdout_printing: bool = True,
+        output_style: str = "text",
+    ):
+        """
+        Primarily to module-ize the scripts and keep things simple,
+        idiomatic, and in different namespaces.
+        """
+        super().__init__(
+            election_data_dir, verbosity, printonly, stdout_printing, output_style
+        )
+        # branch -> time first seen for the pending branches
+        self.first_seen = {}
+        self.pending = {}
+        self.latencies = collections.deque(
+            maxlen=Globals.get("MERGE_DAEMON_LATENCY_WINDOW")
+        )
+        self.metrics = {
+            "passes": 0,
+            "merged": 0,
+            "queue_depth": 0,
+            "queue_depth_by_uid": {},
+            "last_pass_seconds": 0.0,
+            "merge_latency": {},
+        }
+        self.remote_refs_digest = ""
+        self.branchpoint = ""
+
+    def install_post_receive_hook(self, fifo: str):
+        """
+        Will create the FIFO (if needed) and install the post-receive
+        hook that writes the pushed CVR refs to it in the origin remote
+        - which needs to be a local (bare) repo.  An existing hook that
+        was not installed by the merge-daemon is left as is and raises
+        an error.
+        """
+        remote = self.shell_out(
+            ["git", "remote", "get-url", "origin"],
+            printonly_override=True,
+            incoming_printlevel=5,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+        if not os.path.isdir(remote):
+            raise ValueError(
+                f"the origin remote ({remote}) is not a local repo - install "
+                "the post-receive hook on the remote host instead"
+            )
+        hook = os.path.join(
+            self.shell_out(
+                ["git", "-C", remote, "rev-parse", "--absolute-git-dir"],
+                printonly_override=True,
+                incoming_printlevel=5,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.strip(),
+            "hooks",
+            "post-receive",
+        )
+        if os.path.exists(hook):
+            with open(hook, "r", encoding="utf8") as infile:
+                if "VTP merge-daemon" not in infile.read():
+                    raise FileExistsError(f"a post-receive hook ({hook}) exists")
+        self.imprimir(f"Installing post-receive hook {hook} -> {fifo}", 3)
+        if self.printonly:
+            return
+        if not os.path.exists(fifo):
+            os.mkfifo(fifo)
+        with open(hook, "w", encoding="utf8") as outfile:
+            outfile.write(
+                POST_RECEIVE_HOOK.format(
+                    fifo=fifo, cvr_dir=Globals.get("CONTEST_FILE_SUBDIR")
+                )
+            )
+        os.chmod(hook, 0o755)
+
+    def remote_refs_changed(self) -> bool:
+        """
+        Return True if the origin remote CVR refs changed since the
+        last call - a single 'git ls-remote' whose output is digested.
+        """
+        refs = self.shell_out(
+            [
+                "git",
+                "ls-remote",
+                "origin",
+                f"refs/heads/{Globals.get('CONTEST_FILE_SUBDIR')}/*",
+            ],
+            printonly_override=True,
+            incoming_printlevel=5,
+            check=True,
+            capture_output=True,
+        ).stdout
+        digest = hashlib.sha256(refs).hexdigest()
+        if digest == self.remote_refs_digest:
+            return False
+        self.remote_refs_digest = digest
+        return True
+
+    def wait_for_push(self, fifo_fd: int, poll_interval: float, stop_event) -> bool:
+        """
+        Will wait up to poll_interval seconds for CVR branches to be
+        pushed.  Returns True if there may be something to merge.
+        With a FIFO, that is when the post-receive hook wrote to it
+        (which is drained).  Without, that is when the remote CVR refs
+        changed.
+        """
+        if fifo_fd is None:
+            if stop_event is not None:
+                if stop_event.wait(poll_interval):
+                    return False
+            else:
+                time.sleep(poll_interval)
+            return self.remote_refs_changed()
+        readable, _, _ = select.select([fifo_fd], [], [], poll_interval)
+        if not readable:
+            return False
+        try:
+            while os.read(fifo_fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def update_pending(self, now: float):
+        """
+        Will refresh the pending branch index from the remote tracking
+        refs (see UnmergedCvrPool.get_pending_branches, which skips the
+        branches still at the branchpoint) and record the merge
+        latency of the branches that are no longer pending.
+        """
+        self.pending = UnmergedCvrPool.get_pending_branches(
+            self, local=False, remote=True, branchpoint=self.branchpoint
+        )
+        current = set()
+        for branches in self.pending.values():
+            current.update(branches)
+        for branch in [branch for branch in self.first_seen if branch not in current]:
+            self.latencies.append(now - self.first_seen.pop(branch))
+        for branch in current:
+            self.first_seen.setdefault(branch, now)
+
+    def update_metrics(self, merged: int, seconds: float):
+        """Will update the queue depth and merge latency metrics"""
+        self.metrics["passes"] += 1
+        self.metrics["merged"] += merged
+        self.metrics["last_pass_seconds"] = round(seconds, 3)
+        self.metrics["queue_depth_by_uid"] = {
+            uid: len(branches) for uid, branches in self.pending.items()
+        }
+        self.metrics["queue_depth"] = sum(self.metrics["queue_depth_by_uid"].values())
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            self.metrics["merge_latency"] = {
+                "count": len(latencies),
+                "mean": round(statistics.fmean(latencies), 3),
+                "p50": round(latencies[len(latencies) // 2], 3),
+                "p90": round(latencies[int(len(latencies) * 0.9)], 3),
+                "max": round(latencies[-1], 3),
+            }
+
+    def write_metrics(self, metrics_file: str):
+        """Will (atomically) write the metrics as JSON to metrics_file"""
+        if not metrics_file or self.printonly:
+            return
+        with open(metrics_file + ".tmp", "w", encoding="utf8") as outfile:
+            json.dump(self.metrics, outfile, indent=2)
+        os.replace(metrics_file + ".tmp", metrics_file)
+
+    # pylint: disable=too-many-arguments
+    def merge_pass(
+        self,
+        merge_contests: MergeContestsOperation,
+        minimum_cast_cache: int,
+        flush: bool,
+        batch_size: int,
+    ) -> int:
+        """
+        A single merge pass - pull, refresh the pending branch index,
+        and merge the contests that exceed the minimum_cast_cache (or
+        all of them if flush).  The CWD is the workspace.  Returns the
+        number of merged contest branches.
+        """
+        start = time.time()
+        self.shell_out(
+            ["git", "pull", "--prune"],
+            timeout=None,
+            check=True,
+            incoming_printlevel=5,
+        )
+        self.update_pending(start)
+        merged = 0
+        for uid, branches in self.pending.items():
+            if flush or len(branches) > minimum_cast_cache:
+                merged += merge_contests.randomly_merge_contests(
+                    uid=uid,
+                    batch=list(branches),
+                    flush=flush,
+                    remote=True,
+                    minimum_cast_cache=minimum_cast_cache,
+                    batch_size=batch_size,
+                    digests=branches,
+                )
+        if merged:
+            self.update_pending(time.time())
+        self.update_metrics(merged, time.time() - start)
+        latency = self.metrics["merge_latency"]
+        self.imprimir(
+            f"Merge pass {self.metrics['passes']}: merged {merged}, "
+            f"queue depth {self.metrics['queue_depth']}, "
+            f"{time.time() - start:.2f} seconds"
+            + (
+                f", merge latency p50 {latency['p50']}s p90 {latency['p90']}s"
+                if latency
+                else ""
+            ),
+            3,
+        )
+        return merged
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def run(
+        self,
+        minimum_cast_cache: int = 100,
+        batch_size: int = 0,
+        fifo: str = "",
+        install_hook: bool = False,
+        poll_interval: float = Globals.get("MERGE_DAEMON_POLL_INTERVAL"),
+        metrics_file: str = "",
+        iterations: int = 0,
+        duration: int = 0,
+        flush_on_exit: bool = False,
+        stop_event=None,
+    ) -> tuple:
+        """
+        Main function - see -h for more info.  Runs until stop_event
+        (a threading or multiprocessing Event) is set, for iterations
+        wake-ups, or for duration minutes - forever if none are
+        supplied.  A merge pass is run at startup and then each time
+        CVR branches are pushed.  A wake-up is the startup or a return
+        from waiting for a push (see wait_for_push), whether or not
+        anything was pushed, so that an idle daemon still exits.  If
+        flush_on_exit, all the remaining contests are merged on exit.
+
+        Returns the number of (merge passes, merged contest branches).
+        """
+
+        # Create a VTP ElectionData object if one does not already
+        # exist - it is kept warm for the life of the daemon
+        the_election_config = ElectionConfig.configure_election(
+            self,
+            self.election_data_dir,
+        )
+        merge_contests = MergeContestsOperation(
+            election_data_dir=self.election_data_dir,
+            verbosity=self.verbosity,
+            printonly=self.printonly,
+        )
+        if self.instrumentation is not None:
+            merge_contests.enable_instrumentation(self.instrumentation)
+        self.branchpoint = the_election_config.get("git_initial_commit")
+
+        # Set the three EV's
+        os.environ["GIT_AUTHOR_DATE"] = Globals.get("ELECTION_DATETIME")
+        os.environ["GIT_COMMITTER_DATE"] = Globals.get("ELECTION_DATETIME")
+        os.environ["GIT_EDITOR"] = "true"
+
+        start_time = time.time()
+        merged = 0
+        wakeups = 0
+        fifo_fd = None
+        with self.changed_cwd(the_election_config.get("git_rootdir")):
+            if fifo:
+                if install_hook:
+                    self.install_post_receive_hook(fifo)
+                # Open read-write so that there is never an EOF
+                fifo_fd = os.open(fifo, os.O_RDWR | os.O_NONBLOCK)
+            else:
+                # Note the current remote CVR refs
+                self.remote_refs_changed()
+            try:
+                changed = True
+                while True:
+                    wakeups += 1
+                    if changed:
+                        merged += self.merge_pass(
+                            merge_contests, minimum_cast_cache, False, batch_size
+                        )
+                        self.write_metrics(metrics_file)
+                    if stop_event is not None and stop_event.is_set():
+                        break
+                    if iterations and wakeups >= iterations:
+                        break
+                    if duration and time.time() - start_time > 60 * duration:
+                        break
+                    changed = self.wait_for_push(fifo_fd, poll_interval, stop_event)
+                if flush_on_exit:
+                    self.imprimir("Cleaning up remaining unmerged ballots", 3)
+                    merged += self.merge_pass(merge_contests, 0, True, batch_size)
+                    self.write_metrics(metrics_file)
+            finally:
+                if fifo_fd is not None:
+                    os.close(fifo_fd)
+        self.imprimir(
+            f"Merged {merged} contest branches in {self.metrics['passes']} passes",
+            3,
+        )
+        return self.metrics["passes"], merged
+
+
+# EOF
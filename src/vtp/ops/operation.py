@@ -18,14 +18,19 @@
 """Base class of operations."""
 
 # standard imports
+import functools
 import json
 import os
-import re
 import subprocess
+import sys
+import time
 from contextlib import contextmanager
 
 # local imports
 from vtp.core.common import Globals
+from vtp.core.git_cat_file import GitCatFilePool
+from vtp.core.instrumentation import Instrumentation
+from vtp.core.output_sink import OutputSink
 
 # ZZZ - not sure how to best do this - could not make it work.  See:
 # https://stackoverflow.com/questions/6760685/what-is-the-best-way-of-implementing-singleton-in-python
@@ -46,7 +51,7 @@ from vtp.core.common import Globals
 #    pass
 
 
-# pylint: disable=too-few-public-methods
+# pylint: disable=too-many-public-methods
 class Operation:
     """
     Generic operation base class constructor - covers
@@ -55,9 +60,6 @@ class Operation:
     election_data_dir.
     """
 
-    # class constants
-    _sha1_regex = re.compile(r"([0-9a-fA-F]{40})")
-
     # Originally the design target was a singleton, but it then became apparent
     # the that design target could not be that since each op call wants to be
     # or may want to be different.
@@ -72,6 +74,28 @@ class Operation:
     #     "initialized": False,
     # }
 
+    @staticmethod
+    def timed_run(run):
+        """
+        Decorator that records the wall time of a run() method when
+        the operation is instrumented - see enable_instrumentation
+        """
+
+        @functools.wraps(run)
+        def wrapper(self, *args, **kwargs):
+            if self.instrumentation is None:
+                return run(self, *args, **kwargs)
+            with self.instrumentation.timer("run", type(self).__name__):
+                return run(self, *args, **kwargs)
+
+        return wrapper
+
+    def __init_subclass__(cls, **kwargs):
+        """Time the run() of every operation"""
+        super().__init_subclass__(**kwargs)
+        if "run" in cls.__dict__:
+            cls.run = Operation.timed_run(cls.__dict__["run"])
+
     # pylint: disable=too-many-arguments
     def __init__(
         self,
@@ -111,10 +135,9 @@ class Operation:
         Globals.verify_election_data_dir(self.election_data_dir)
         # Configure printing
         self.stdout_printing = stdout_printing
-        if output_style == "html":
-            self.stdout_output = ["<p>"]
-        else:
-            self.stdout_output = []
+        self.output_sink = OutputSink(output_style, stdout_printing)
+        # The (opt-in) timing instrumentation - see enable_instrumentation
+        self.instrumentation = None
         # Operation._hackitoergosum["election_data_dir"] = self.election_data_dir
         # Operation._hackitoergosum["printonly"] = self.printonly
         # Operation._hackitoergosum["verbosity"] = self.verbosity
@@ -127,6 +150,68 @@ class Operation:
         """allow setting the verbosity (and nothing else) on the run"""
         self.verbosity = verbosity
 
+    def enable_instrumentation(self, instrumentation: Instrumentation = None):
+        """
+        Turn on the recording of the wall time of the run(), of each
+        shell_out, changed_cwd, and changed_branch, and of the tally
+        phases of this operation.  An operation that runs another
+        operation can pass its own instrumentation so that both end
+        up in the same profile.  Returns the instrumentation.
+        """
+        if instrumentation is None:
+            instrumentation = Instrumentation(type(self).__name__)
+        self.instrumentation = instrumentation
+        return instrumentation
+
+    @contextmanager
+    def timed(self, kind: str, key: str):
+        """
+        Context manager that records the wall time of its block if
+        the operation is instrumented (and otherwise does nothing)
+        """
+        if self.instrumentation is None:
+            yield
+        else:
+            with self.instrumentation.timer(kind, key):
+                yield
+
+    def write_instrumentation(self, profile_format: str, profile_file: str = ""):
+        """
+        Write the profile of an instrumented operation in the json,
+        table, or prometheus format to profile_file, or if there is
+        no profile_file, print it to STDERR.
+        """
+        if self.instrumentation is None:
+            return
+        if profile_file:
+            self.instrumentation.write_profile(profile_file, profile_format)
+            return
+        match profile_format:
+            case "json":
+                print(
+                    json.dumps(self.instrumentation.get_profile(), indent=2),
+                    file=sys.stderr,
+                )
+            case "table":
+                print("\n".join(self.instrumentation.get_table()), file=sys.stderr)
+            case "prometheus":
+                print("\n".join(self.instrumentation.get_prometheus()), file=sys.stderr)
+            case _:
+                raise ValueError(f"Unsupported profile format ({profile_format})")
+
+    @property
+    def stdout_output(self) -> list:
+        """The (rendered) accumulated output lines - see get_imprimir"""
+        return self.output_sink.render()
+
+    def set_max_output_records(self, max_records: int):
+        """
+        Only keep the max_records most recent output records (0 keeps
+        all of them) - a bounded ring buffer for long running callers
+        such as the web-api.
+        """
+        self.output_sink.set_max_records(max_records)
+
     def imprimir_formatting(
         self,
         a_construct: str,
@@ -136,95 +221,52 @@ class Operation:
         incoming_printlevel is less than or equal to self.verbosity,
         the line prints.  The default self.verbosity is nominally 3.
         """
-        a_line = ""
         if incoming_printlevel <= self.verbosity:
-            if self.output_style == "html":
-                match a_construct:
-                    case "horizontal_line":
-                        a_line = "<hr>"
-                    case "horizontal_shortline":
-                        a_line = '<hr width="50%">'
-                    case "empty_line":
-                        a_line = ""
-                    case "begin_good_box":
-                        a_line = "*" * 12
-                    case "end_good_box":
-                        a_line = "*" * 12
-                    case "begin_error_box":
-                        a_line = "#" * 12
-                    case "end_error_box":
-                        a_line = "#" * 12
-                    case _:
-                        raise RuntimeError(
-                            f"Error: unsupported printing construct {a_construct}"
-                        )
-            else:
-                match a_construct:
-                    case "horizontal_line":
-                        a_line = "-" * 78
-                    case "horizontal_shortline":
-                        a_line = "-" * 32
-                    case "empty_line":
-                        a_line = ""
-                    case "begin_good_box":
-                        a_line = "*" * 12
-                    case "end_good_box":
-                        a_line = "*" * 12
-                    case "begin_error_box":
-                        a_line = "#" * 12
-                    case "end_error_box":
-                        a_line = "#" * 12
-                    case _:
-                        raise RuntimeError(
-                            f"Error: unsupported printing construct {a_construct}"
-                        )
-            if self.stdout_printing:
-                print(a_line)
-            else:
-                self.stdout_output.append(a_line)
+            if not OutputSink.is_formatting(a_construct):
+                raise RuntimeError(
+                    f"Error: unsupported printing construct {a_construct}"
+                )
+            self.output_sink.emit((incoming_printlevel, "formatting", a_construct, ()))
 
     def imprimir(
         self,
         a_line: str,
         incoming_printlevel: int = Globals.get("DEFAULT_VERBOSITY"),
         handle_hyperlinks: bool = False,
+        args: tuple = (),
     ):
         """Either prints a line of text to STDOUT or appends it to a
         list, in which case the output needs to be retrieved.  If
         incoming_printlevel is less than or equal to self.verbosity,
         the line prints.  The default self.verbosity is nominally 3.
+
+        If args are supplied, a_line is a %-style template that is
+        only formatted (template % args) if and when the line is
+        rendered - so a caller of a frequently filtered out line
+        should pass its values as args rather than as an f-string.
+        The line is recorded in self.output_sink, which handles the
+        text, html, and json output styles - see OutputSink.
         """
         if incoming_printlevel <= self.verbosity:
-            if self.output_style == "html":
-                # If self.output_style == "html", html-ize the line
-                # - add digest links for digests
-                # - add line breaks per line
-                # - convert an array to a table with css class=imprimir
-                # ZZZ
-                #                import pdb; pdb.set_trace()
-                if handle_hyperlinks:
-                    a_line = Operation._sha1_regex.sub(
-                        r'<a href="foo/\1" target="_blank">\1</a>', a_line
-                    )
-                match incoming_printlevel:
-                    case 1:
-                        a_line = '<span class="error">[ERROR] </span>' + a_line
-                    case 2:
-                        a_line = '<span class="warning">[WARNING] </span>' + a_line
-            else:
-                match incoming_printlevel:
-                    case 1:
-                        a_line = "[ERROR] " + a_line
-                    case 2:
-                        a_line = "[WARNING] " + a_line
-            if self.stdout_printing:
-                print(a_line)
-            else:
-                self.stdout_output.append(a_line)
+            self.output_sink.emit(
+                (
+                    incoming_printlevel,
+                    "hyperlinks" if handle_hyperlinks else "line",
+                    a_line,
+                    args,
+                )
+            )
 
     def get_imprimir(self) -> list:
         """Return the stored output string"""
-        return self.stdout_output
+        return self.output_sink.render()
+
+    def get_imprimir_records(self) -> list:
+        """
+        Return the stored output as a list of {"level", "message"} (or
+        {"level", "formatting"}) dictionaries
+        """
+        return self.output_sink.render_json()
 
     # The below were oringally in the Shellout package
 
@@ -255,7 +297,11 @@ class Operation:
         # here, but they need to be individually converted to strings
         # regardless since _everything_ below wants to see strings.
         argv_string = [str(arg) for arg in argv]
-        self.imprimir(f'Running ({" ".join(argv_string)})', incoming_printlevel)
+        # Do not even join argv if the line is filtered out
+        if incoming_printlevel <= self.verbosity:
+            self.imprimir(
+                "Running (%s)", incoming_printlevel, args=(" ".join(argv_string),)
+            )
         if self.printonly and not printonly_override:
             return subprocess.CompletedProcess(argv_string, 0, stdout="", stderr="")
         # the caller decides on whether check is set or not
@@ -269,19 +315,129 @@ class Operation:
         if "timeout" not in kwargs:
             kwargs["timeout"] = Globals.get("SHELL_TIMEOUT")
         #        import pdb; pdb.set_trace()
-        return subprocess.run(argv_string, **kwargs)
+        if self.instrumentation is None:
+            return subprocess.run(argv_string, **kwargs)
+        return self.instrumented_subprocess_run(argv_string, **kwargs)
+
+    @staticmethod
+    def count_bytes(data) -> int:
+        """The size of a (str or bytes) stdin/stdout/stderr payload"""
+        if data is None:
+            return 0
+        if isinstance(data, str):
+            return len(data.encode("utf8"))
+        return len(data)
+
+    def instrumented_subprocess_run(self, argv_string: list, **kwargs):
+        """
+        subprocess.run that records the wall time, exit code, and
+        bytes in and out of the command under its argv[0:2]
+        """
+        start = time.perf_counter()
+        exit_code = None
+        bytes_out = 0
+        try:
+            # pylint: disable=subprocess-run-check
+            result = subprocess.run(argv_string, **kwargs)
+            exit_code = result.returncode
+            bytes_out = Operation.count_bytes(result.stdout) + Operation.count_bytes(
+                result.stderr
+            )
+            return result
+        except subprocess.CalledProcessError as error:
+            exit_code = error.returncode
+            bytes_out = Operation.count_bytes(error.stdout) + Operation.count_bytes(
+                error.stderr
+            )
+            raise
+        except subprocess.TimeoutExpired:
+            exit_code = "timeout"
+            raise
+        finally:
+            self.instrumentation.record(
+                "shell_out",
+                " ".join(argv_string[0:2]),
+                time.perf_counter() - start,
+                exit_code=exit_code,
+                bytes_in=Operation.count_bytes(kwargs.get("input")),
+                bytes_out=bytes_out,
+            )
+
+    def git_query(self, argv: list) -> str:
+        """
+        Run a read-only git command in the CWD workspace, even when
+        printonly, and return its (text) stdout
+        """
+        return self.shell_out(
+            argv,
+            printonly_override=True,
+            check=True,
+            capture_output=True,
+            text=True,
+            incoming_printlevel=5,
+        ).stdout
+
+    def get_git_idents(self) -> tuple:
+        """
+        Return the (author, committer) idents as bytes that 'git
+        commit' would use in the CWD workspace (see 'git var'), which
+        honors the GIT_AUTHOR_DATE and GIT_COMMITTER_DATE election
+        date-time.  For use in 'git fast-import' streams.
+        """
+        git_vars = dict(
+            line.split("=", 1)
+            for line in self.git_query(["git", "var", "-l"]).splitlines()
+            if "=" in line
+        )
+        return (
+            git_vars["GIT_AUTHOR_IDENT"].encode("utf8"),
+            git_vars["GIT_COMMITTER_IDENT"].encode("utf8"),
+        )
+
+    def git_cat_file(
+        self,
+        names: list,
+        git_dir: str,
+        contents: bool = False,
+        incoming_printlevel: int = Globals.get("DEFAULT_VERBOSITY"),
+    ) -> list:
+        """Query the supplied git object names (digests, refs,
+        <rev>:<path>, etc) via the long lived 'git cat-file' coprocess
+        pool of the git_dir workspace as opposed to forking a new git
+        process.  If contents is True, the batch coprocesses are used
+        and the object contents are also returned.  Returns a list of
+        dictionaries - see GitCatFile.query_one.
+
+        Honors self.printonly like shell_out does (returns an empty
+        list).
+        """
+        style = "batch" if contents else "batch-check"
+        self.imprimir(
+            f"Querying (git cat-file --{style}) for {len(names)} object(s)",
+            incoming_printlevel,
+        )
+        if self.printonly:
+            return []
+        return GitCatFilePool.get_pool(git_dir, style).query(
+            [str(name) for name in names]
+        )
 
     @contextmanager
     def changed_cwd(self, path: str):
         """Context manager for temporarily changing the CWD"""
+        start = time.perf_counter()
         oldpwd = os.getcwd()
         try:
             os.chdir(path)
-            self.imprimir(f"Entering dir ({path})", 5)
+            self.imprimir("Entering dir (%s)", 5, args=(path,))
             yield
         finally:
             os.chdir(oldpwd)
-            self.imprimir(f"Leaving dir ({path})", 5)
+            self.imprimir("Leaving dir (%s)", 5, args=(path,))
+            if self.instrumentation is not None:
+                self.instrumentation.record(
+                    "changed_cwd", os.path.normpath(path), time.perf_counter() - start
+                )
 
     @contextmanager
     def changed_branch(self, branch: str):
@@ -290,8 +446,9 @@ class Operation:
         branch change.  Will explicitly switch to the specified branch
         before yielding.
         """
+        start = time.perf_counter()
         self.shell_out(["git", "checkout", branch], check=True, incoming_printlevel=5)
-        self.imprimir(f"Entering branch ({branch})", 5)
+        self.imprimir("Entering branch (%s)", 5, args=(branch,))
         try:
             yield
         finally:
@@ -299,7 +456,72 @@ class Operation:
             self.shell_out(
                 ["git", "checkout", branch], check=True, incoming_printlevel=5
             )
-            self.imprimir(f"Leaving branch ({branch})", 5)
+            self.imprimir("Leaving branch (%s)", 5, args=(branch,))
+            if self.instrumentation is not None:
+                # One key for all the (random) CVR branches of a contest
+                key = branch.rsplit("/", 1)[0] if branch.startswith("CVRs/") else branch
+                self.instrumentation.record(
+                    "changed_branch", key, time.perf_counter() - start
+                )
+
+    def cvr_stream_git_log(
+        self,
+        git_log_command: list,
+        election_config: dict,
+        incoming_printlevel: int = -1,
+    ):
+        """A generator that will execute the supplied git log command
+        and yield a (digest, CVR) tuple for each commit that is a
+        CVR, in git log order.  Any --pretty/--format option in the
+        supplied command is replaced - the commits are requested as
+        NUL (-z) delimited '<digest>LF<commit message>' records which
+        are read in large chunks and each CVR payload is handed to
+        json.loads once.  Commits whose message is not a json object
+        (merge commits, receipts, etc) are skipped.
+
+        Note - the git log process runs in the election_config
+        git_rootdir without changing the CWD of this process since the
+        caller consumes the generator at its own pace.
+        """
+        log_index = git_log_command.index("log") + 1
+        command = (
+            git_log_command[:log_index]
+            + ["-z", "--pretty=format:%H%n%B"]
+            + [
+                arg
+                for arg in git_log_command[log_index:]
+                if not arg.startswith(("--pretty", "--format"))
+            ]
+        )
+        if incoming_printlevel <= self.verbosity:
+            self.imprimir(
+                "Running (%s)", incoming_printlevel, args=(" ".join(command),)
+            )
+        chunk_size = Globals.get("GIT_LOG_READ_CHUNK_SIZE")
+        with subprocess.Popen(
+            command,
+            cwd=election_config.get("git_rootdir"),
+            stdout=subprocess.PIPE,
+        ) as git_output:
+            try:
+                remainder = b""
+                while True:
+                    chunk = git_output.stdout.read(chunk_size)
+                    if not chunk:
+                        break
+                    records = (remainder + chunk).split(b"\0")
+                    # the last record is (most likely) incomplete
+                    remainder = records.pop()
+                    for record in records:
+                        # a 40 char digest, a LF, and the message
+                        if record[41:42] == b"{":
+                            yield record[:40].decode("ascii"), json.loads(record[41:])
+                if remainder[41:42] == b"{":
+                    yield remainder[:40].decode("ascii"), json.loads(remainder[41:])
+            finally:
+                # the consumer may have stopped early
+                if git_output.poll() is None:
+                    git_output.kill()
 
     # ZZZ - could use an optional filter_by_uid argument which is a set object
     def cvr_parse_git_log_output(
@@ -313,52 +535,48 @@ class Operation:
         output of those commits that are CVRs.  Will return a
         dictionary keyed on the contest UID that is a list of CVRs.
         The CVR is just the CVR from the git log with a 'digest' key
-        added.
+        added.  If grouped_by_uid is False, the dictionary is keyed
+        on the digest instead (without the 'digest' key added).
 
         Note the the order of the list is git log order and not
-        randomized FWIIW.
+        randomized FWIIW.  See cvr_stream_git_log for the streaming
+        (generator) version of this.
         """
-        # Will process all the CVR commits on the main branch and tally
-        # all the contests found.
         git_log_cvrs = {}
-        with self.changed_cwd(election_config.get("git_rootdir")):
-            self.imprimir(f'Running ({" ".join(git_log_command)})', incoming_printlevel)
-            with subprocess.Popen(
-                git_log_command, stdout=subprocess.PIPE, text=True, encoding="utf8"
-            ) as git_output:
-                # read lines until there is a complete json object, then
-                # add the object for that contest.
-                block = ""
-                digest = ""
-                recording = False
-                # question - how to get "for line in
-                # git_output.stdout.readline():" not to effectively return
-                # the characters in line as opposed to the entire line
-                # itself?
-                while True:
-                    line = git_output.stdout.readline()
-                    if not line:
-                        break
-                    if match := re.match("^([a-f0-9]{40}){", line):
-                        digest = match.group(1)
-                        recording = True
-                        block = "{"
-                        continue
-                    if recording:
-                        block += line.strip()
-                        if re.match("^}", line):
-                            # this loads the contest under the CVR key
-                            cvr = json.loads(block)
-                            if grouped_by_uid:
-                                #                                import pdb; pdb.set_trace()
-                                cvr["digest"] = digest
-                                if cvr["contestCVR"]["uid"] in git_log_cvrs:
-                                    git_log_cvrs[cvr["contestCVR"]["uid"]].append(cvr)
-                                else:
-                                    git_log_cvrs[cvr["contestCVR"]["uid"]] = [cvr]
-                            else:
-                                git_log_cvrs[digest] = cvr
-                            block = ""
-                            digest = ""
-                            recording = False
+        for digest, cvr in self.cvr_stream_git_log(
+            git_log_command, election_config, incoming_printlevel
+        ):
+            if grouped_by_uid:
+                cvr["digest"] = digest
+                git_log_cvrs.setdefault(cvr["contestCVR"]["uid"], []).append(cvr)
+            else:
+                git_log_cvrs[digest] = cvr
         return git_log_cvrs
+
+    def cvr_read_commits(
+        self,
+        digests: list,
+        election_config: dict,
+        incoming_printlevel: int = -1,
+    ) -> dict:
+        """Will read the supplied commit digests via the 'git cat-file
+        --batch' coprocess pool and return a dictionary keyed on the
+        (full) commit digest of those commits that are CVRs.  This is
+        the cat-file equivalent of calling cvr_parse_git_log_output
+        with 'git log --no-walk' and grouped_by_uid set to False.
+        """
+        cvrs = {}
+        for result in self.git_cat_file(
+            digests,
+            election_config.get("git_rootdir"),
+            contents=True,
+            incoming_printlevel=incoming_printlevel,
+        ):
+            if result["objecttype"] != "commit":
+                continue
+            # The commit message follows the first empty line of the
+            # raw commit object
+            message = result["contents"].split(b"\n\n", 1)[-1].decode("utf8")
+            if message.startswith("{"):
+                cvrs[result["objectname"]] = json.loads(message)
+        return cvrs
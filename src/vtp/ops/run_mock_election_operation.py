@@ -23,22 +23,97 @@ or the README.md file in the src/vtp directory for details.
 """
 
 # Standard imports
+import multiprocessing
 import os
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, wait
 
 # Project imports
 from vtp.core.address import Address
 from vtp.core.ballot import Ballot
+from vtp.core.common import Globals
 from vtp.core.election_config import ElectionConfig
 from vtp.ops.accept_ballot_operation import AcceptBallotOperation
 from vtp.ops.cast_ballot_operation import CastBallotOperation
 from vtp.ops.merge_contests_operation import MergeContestsOperation
+from vtp.ops.merge_daemon_operation import MergeDaemonOperation
 from vtp.ops.tally_contests_operation import TallyContestsOperation
 
 # Local imports
 from .operation import Operation
 
 
+def mock_scanner_job(workspace: str, options: dict, barrier) -> dict:
+    """
+    The (spawned) process of one parallel scanner - see
+    RunMockElectionOperation.parallel_mockup.  Each process parses
+    its own workspace's ElectionData before waiting on the start
+    barrier.  Returns the scanner's stats.
+    """
+    operation = RunMockElectionOperation(
+        election_data_dir=workspace,
+        verbosity=options["verbosity"],
+        printonly=options["printonly"],
+    )
+    try:
+        the_election_config = ElectionConfig.configure_election(operation, workspace)
+    except BaseException:
+        # Release the other processes waiting on the start barrier
+        barrier.abort()
+        raise
+    barrier.wait()
+    start_time = time.time()
+    ballots = operation.scanner_mockup(
+        the_election_config=the_election_config,
+        ballot=options["blank_ballot"],
+        iterations=options["iterations"],
+        device="scanner",
+        flush_mode=options["flush_mode"],
+        minimum_cast_cache=options["minimum_cast_cache"],
+        duration=options["duration"],
+    )
+    return {
+        "workspace": workspace,
+        "ballots": ballots,
+        "seconds": time.time() - start_time,
+    }
+
+
+def mock_server_job(workspace: str, options: dict, barrier, scanners_done) -> dict:
+    """
+    The (spawned) process of the parallel server - merges until the
+    scanners_done event is set.  Returns the server's stats.
+    """
+    operation = RunMockElectionOperation(
+        election_data_dir=workspace,
+        verbosity=options["verbosity"],
+        printonly=options["printonly"],
+    )
+    try:
+        the_election_config = ElectionConfig.configure_election(operation, workspace)
+    except BaseException:
+        # Release the other processes waiting on the start barrier
+        barrier.abort()
+        raise
+    barrier.wait()
+    start_time = time.time()
+    passes, merged = operation.server_mockup(
+        the_election_config=the_election_config,
+        flush_mode=options["flush_mode"],
+        duration=options["duration"],
+        minimum_cast_cache=options["minimum_cast_cache"],
+        iterations=0,
+        scanners_done=scanners_done,
+    )
+    return {
+        "workspace": workspace,
+        "passes": passes,
+        "merged": merged,
+        "seconds": time.time() - start_time,
+    }
+
+
 class RunMockElectionOperation(Operation):
     """
     A class to implememt the run-mock-election operation.  See the
@@ -60,7 +135,7 @@ class RunMockElectionOperation(Operation):
         minimum_cast_cache: int,
         duration: int,
     ):
-        """Simulate a VTP scanner"""
+        """Simulate a VTP scanner - returns the number of ballots accepted"""
 
         # Get list of available blank ballots
         blank_ballots = []
@@ -83,6 +158,7 @@ class RunMockElectionOperation(Operation):
         start_time = time.time()
         seconds = 60 * duration
         count = 0
+        ballots = 0
         while True:
             count += 1
             for blank_ballot in blank_ballots:
@@ -123,6 +199,7 @@ class RunMockElectionOperation(Operation):
                 accept_ballot.run(
                     cast_ballot=Ballot.get_cast_from_blank(blank_ballot),
                 )
+                ballots += 1
                 if device == "both":
                     # - merge the ballot's contests
                     if flush_mode == 2:
@@ -150,12 +227,13 @@ class RunMockElectionOperation(Operation):
                         )
                     # don't let too much garbage build up
                     if count % 10 == 9:
-                        self.shell_out(
-                            ["git", "gc"],
-                            timeout=None,
-                            check=True,
-                            incoming_printlevel=4,
-                        )
+                        with self.changed_cwd(the_election_config.get("git_rootdir")):
+                            self.shell_out(
+                                ["git", "gc"],
+                                timeout=None,
+                                check=True,
+                                incoming_printlevel=4,
+                            )
             if iterations and count >= iterations:
                 break
             if seconds:
@@ -180,20 +258,24 @@ class RunMockElectionOperation(Operation):
                 printonly=self.printonly,
             )
             tally_contests.run()
-        # clean up git just in case
-        self.shell_out(
-            ["git", "remote", "prune", "origin"],
-            timeout=None,
-            check=True,
-            incoming_printlevel=4,
-        )
-        self.shell_out(
-            ["git", "gc"],
-            timeout=None,
-            check=True,
-            incoming_printlevel=4,
-        )
+        # clean up git just in case (in this workspace, which need not
+        # be the CWD when running parallel scanners)
+        with self.changed_cwd(the_election_config.get("git_rootdir")):
+            self.shell_out(
+                ["git", "remote", "prune", "origin"],
+                timeout=None,
+                check=True,
+                incoming_printlevel=4,
+            )
+            self.shell_out(
+                ["git", "gc"],
+                timeout=None,
+                check=True,
+                incoming_printlevel=4,
+            )
+        return ballots
 
+    # pylint: disable=too-many-arguments
     def server_mockup(
         self,
         the_election_config: ElectionConfig,
@@ -201,69 +283,66 @@ class RunMockElectionOperation(Operation):
         duration: int,
         minimum_cast_cache: int,
         iterations: int,
-    ):
-        """Simulate a VTP server"""
+        scanners_done=None,
+    ) -> tuple:
+        """
+        Simulate a VTP server.  The merge daemon runs for iterations
+        wake-ups (see MergeDaemonOperation.run - it wakes up on each
+        push and otherwise every poll interval) or for duration
+        minutes.  If a scanners_done (multiprocessing) Event is
+        supplied, the server merges until the event is set rather
+        than for the iterations or duration.  Returns the number of
+        merge passes and of merged contest branches.
+        """
         # This is the VTP server simulation code.  In this case, the VTP
         # scanners are pushing to an ElectionData remote and this (server)
         # needs to pull from the ElectionData remote.  And, in this case
         # the branches to be merged are remote and not local.
-        start_time = time.time()
-        # Loop for a day and sleep for 10 seconds
-        seconds = 60 * duration
         count = 0
-
-        while True:
-            count += 1
-            with self.changed_cwd(the_election_config.get("git_rootdir")):
-                self.shell_out(
-                    ["git", "pull"],
-                    timeout=None,
-                    check=True,
-                    incoming_printlevel=4,
-                )
-            if flush_mode == 2:
+        merged = 0
+        if flush_mode == 2:
+            # Merge everything each pass until the scanners are done
+            while True:
+                count += 1
+                with self.changed_cwd(the_election_config.get("git_rootdir")):
+                    self.shell_out(
+                        ["git", "pull"],
+                        timeout=None,
+                        check=True,
+                        incoming_printlevel=4,
+                    )
                 merge_contests = MergeContestsOperation(
                     election_data_dir=self.election_data_dir,
                     verbosity=self.verbosity,
                     printonly=self.printonly,
                 )
-                merge_contests.run(
+                # Note - the scanners need to be done before (not
+                # during) the final flush
+                scanners_running = (
+                    scanners_done is not None and not scanners_done.is_set()
+                )
+                merged += merge_contests.run(
                     remote=True,
                     flush=True,
                 )
-                tally_contests = TallyContestsOperation(
-                    election_data_dir=self.election_data_dir,
-                    verbosity=self.verbosity,
-                    printonly=self.printonly,
-                )
-                tally_contests.run()
-                return
-            merge_contests = MergeContestsOperation(
+                if not scanners_running:
+                    break
+                self.imprimir(f"Sleeping for 10 (iteration={count})", 3)
+                scanners_done.wait(10)
+        else:
+            # Merge as the scanners push (until they are done or for
+            # the iterations or duration) - see MergeDaemonOperation
+            merge_daemon = MergeDaemonOperation(
                 election_data_dir=self.election_data_dir,
                 verbosity=self.verbosity,
                 printonly=self.printonly,
             )
-            merge_contests.run(
-                remote=True,
+            count, merged = merge_daemon.run(
                 minimum_cast_cache=minimum_cast_cache,
-            )
-            if iterations and count >= iterations:
-                break
-            self.imprimir(f"Sleeping for 10 (iteration={count})", 3)
-            time.sleep(10)
-            elapsed_time = time.time() - start_time
-            if not iterations and elapsed_time > seconds:
-                break
-        if flush_mode in [1, 2]:
-            print("Cleaning up remaining unmerged ballots")
-            merge_contests = MergeContestsOperation(
-                election_data_dir=self.election_data_dir,
-                verbosity=self.verbosity,
-                printonly=self.printonly,
-            )
-            merge_contests.run(
-                remote=True,
-                flush=True,
+                iterations=0 if scanners_done is not None else iterations,
+                duration=0 if scanners_done is not None or iterations else duration,
+                flush_on_exit=flush_mode == 1,
+                stop_event=scanners_done,
             )
         # tally the contests
         tally_contests = TallyContestsOperation(
@@ -272,6 +351,144 @@ class RunMockElectionOperation(Operation):
             printonly=self.printonly,
         )
         tally_contests.run()
+        return count, merged
+
+    @staticmethod
+    def raise_job_error(futures: list):
+        """
+        Will re-raise the first error of the (parallel mockup) job
+        futures other than a broken start barrier.  The jobs are given
+        the SHELL_TIMEOUT to finish after the barrier was aborted.
+        """
+        wait(futures, timeout=Globals.get("SHELL_TIMEOUT"))
+        for future in futures:
+            if not future.done():
+                continue
+            error = future.exception()
+            if error is not None and not isinstance(
+                error, threading.BrokenBarrierError
+            ):
+                raise error
+
+    def get_mock_client_workspaces(
+        self, the_election_config: ElectionConfig, scanners: int
+    ) -> tuple:
+        """
+        Return the (scanner workspaces, server workspace) of the
+        setup-vtp-demo mock clients.  The mock clients are the ones
+        next to this workspace if it is one, otherwise the ones in
+        the DEFAULT_RUNTIME_LOCATION.
+        """
+        git_rootdir = the_election_config.get("git_rootdir")
+        workspace_name = os.path.basename(git_rootdir)
+        mock_clients = os.path.dirname(os.path.dirname(git_rootdir))
+        if os.path.basename(mock_clients) != Globals.get("MOCK_CLIENT_DIRNAME"):
+            mock_clients = os.path.join(
+                Globals.get("DEFAULT_RUNTIME_LOCATION"),
+                Globals.get("MOCK_CLIENT_DIRNAME"),
+            )
+        scanner_workspaces = [
+            os.path.join(mock_clients, f"scanner.{count:02d}", workspace_name)
+            for count in range(scanners)
+        ]
+        server_workspace = os.path.join(mock_clients, "server", workspace_name)
+        for workspace in scanner_workspaces + [server_workspace]:
+            if not os.path.isdir(workspace):
+                raise ValueError(
+                    f"the mock client workspace ({workspace}) does not exist - "
+                    "see setup-vtp-demo --scanners"
+                )
+        return scanner_workspaces, server_workspace
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def parallel_mockup(
+        self,
+        the_election_config: ElectionConfig,
+        ballot: str,
+        scanners: int,
+        flush_mode: int,
+        minimum_cast_cache: int,
+        iterations: int,
+        duration: int,
+    ):
+        """
+        Simulate N VTP scanners plus a VTP server in parallel.  Each
+        scanner (see scanner_mockup) runs in its own process bound to
+        its own setup-vtp-demo mock-clients/scanner.NN workspace and
+        the server (see server_mockup) runs in the mock-clients/server
+        workspace, merging until all the scanners are done.  All the
+        processes start together once each has parsed its
+        ElectionData, and the aggregate stats are printed at the end.
+
+        Note - the processes are spawned (not forked) as the CWD and
+        the git environment variables are process wide.
+        """
+        scanner_workspaces, server_workspace = self.get_mock_client_workspaces(
+            the_election_config, scanners
+        )
+        # The blank ballot needs to be relative to each workspace
+        if ballot and os.path.isabs(ballot):
+            ballot = os.path.relpath(ballot, the_election_config.get("git_rootdir"))
+        options = {
+            "verbosity": self.verbosity,
+            "printonly": self.printonly,
+            "blank_ballot": ballot,
+            "iterations": iterations,
+            "flush_mode": flush_mode,
+            "minimum_cast_cache": minimum_cast_cache,
+            "duration": duration,
+        }
+        mp_context = multiprocessing.get_context("spawn")
+        with mp_context.Manager() as manager:
+            barrier = manager.Barrier(scanners + 2)
+            scanners_done = manager.Event()
+            with ProcessPoolExecutor(
+                max_workers=scanners + 1, mp_context=mp_context
+            ) as executor:
+                server_future = executor.submit(
+                    mock_server_job, server_workspace, options, barrier, scanners_done
+                )
+                scanner_futures = [
+                    executor.submit(mock_scanner_job, workspace, options, barrier)
+                    for workspace in scanner_workspaces
+                ]
+                try:
+                    barrier.wait(Globals.get("MOCK_ELECTION_START_TIMEOUT"))
+                except threading.BrokenBarrierError:
+                    # A process failed (or hung) before the start - surface
+                    # its error rather than the broken barrier
+                    barrier.abort()
+                    scanners_done.set()
+                    RunMockElectionOperation.raise_job_error(
+                        [server_future] + scanner_futures
+                    )
+                    raise
+                start_time = time.time()
+                try:
+                    scanner_stats = [future.result() for future in scanner_futures]
+                finally:
+                    scanners_done.set()
+                server_stats = server_future.result()
+        # Print the aggregate stats
+        elapsed_time = time.time() - start_time
+        self.imprimir_formatting("horizontal_line", 0)
+        for stats in scanner_stats:
+            self.imprimir(
+                f"Scanner {stats['workspace']}: {stats['ballots']} ballots "
+                f"in {stats['seconds']:.1f} seconds",
+                0,
+            )
+        ballots = sum(stats["ballots"] for stats in scanner_stats)
+        self.imprimir(
+            f"Server {server_stats['workspace']}: merged {server_stats['merged']} "
+            f"contests in {server_stats['passes']} passes",
+            0,
+        )
+        self.imprimir(
+            f"Total: {ballots} ballots from {scanners} scanners in "
+            f"{elapsed_time:.1f} seconds ({ballots / elapsed_time:.2f} ballots/second)",
+            0,
+        )
 
     # pylint: disable=duplicate-code
     # pylint: disable=too-many-arguments
@@ -284,15 +501,19 @@ class RunMockElectionOperation(Operation):
         flush_mode: int = 0,
         iterations: int = 10,
         duration: int = 0,
+        scanners: int = 0,
     ):
         """Main function - see -h for more info
 
-        Note - this is a serial synchronous mock election loop.  A
-        parallel loop would have one VTP server git workspace somewhere
-        and N VTP scanner workspaces someplace else.  Depending on the
-        network topology, it is also possible to start up VTP scanner
-        workspaces on other machines as long as the git remotes and clones
-        are properly configured (with access etc).
+        Note - by default this is a serial synchronous mock election
+        loop.  A parallel loop has one VTP server git workspace
+        somewhere and N VTP scanner workspaces someplace else - with
+        the device set to both, supplying scanners runs such a loop
+        over the setup-vtp-demo mock client workspaces (see
+        parallel_mockup).  Depending on the network topology, it is
+        also possible to start up VTP scanner workspaces on other
+        machines as long as the git remotes and clones are properly
+        configured (with access etc).
 
         While a mock election is running, it is also possible to use yet
         another VTP scanner workspace to personally cast/insert individual
@@ -316,7 +537,17 @@ class RunMockElectionOperation(Operation):
             )
 
         # the VTP scanner mock simulation
-        if device in ["scanner", "both"]:
+        if scanners and device == "both":
+            self.parallel_mockup(
+                the_election_config=the_election_config,
+                ballot=blank_ballot,
+                scanners=scanners,
+                flush_mode=flush_mode,
+                minimum_cast_cache=minimum_cast_cache,
+                iterations=iterations,
+                duration=duration,
+            )
+        elif device in ["scanner", "both"]:
             self.scanner_mockup(
                 the_election_config=the_election_config,
                 ballot=blank_ballot,
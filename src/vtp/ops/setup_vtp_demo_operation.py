@@ -24,12 +24,14 @@ or the README.md file in the src/vtp directory for details.
 
 # Standard imports
 import os
-import re
 import secrets
+import shutil
+import threading
 
 # Project imports
 from vtp.core.common import Globals
 from vtp.core.election_config import ElectionConfig
+from vtp.core.guid_workspace_manager import GuidWorkspaceManager
 
 # Local imports
 from .operation import Operation
@@ -42,27 +44,42 @@ class SetupVtpDemoOperation(Operation):
     description (immediately below this) in the source file.
     """
 
+    # The in process background refills of the guid workspace pools
+    # keyed on the pool directory - see start_guid_pool_refill
+    _pool_refills = {}
+    _pool_refills_lock = threading.Lock()
+
     @staticmethod
     def get_all_guid_workspaces() -> list:
         """
-        Will return a list of all the existing guid workspaces
+        Will return a list of all the existing guid workspaces (via
+        the in memory GuidWorkspaceManager inventory)
+        """
+        return GuidWorkspaceManager.get_manager().get_guids()
+
+    @staticmethod
+    def get_guid_pool_dir(location: str) -> str:
+        """
+        Return the directory holding the pre-provisioned (not yet
+        handed out) guid workspaces
         """
-        guid_dir = os.path.join(
-            Globals.get("DEFAULT_RUNTIME_LOCATION"),
+        return os.path.join(
+            location,
             Globals.get("GUID_CLIENT_DIRNAME"),
+            Globals.get("GUID_POOL_DIRNAME"),
         )
-        file_list = os.listdir(guid_dir)
-        guids = []
-        for thing in file_list:
-            path = os.path.join(guid_dir, thing)
-            if not os.path.isdir(path) or not re.match("^[0-9a-f]{2}$", thing):
-                continue
-            for subdir in os.listdir(path):
-                if os.path.isdir(os.path.join(path, subdir)) and re.match(
-                    "^[0-9a-f]{38}$", subdir
-                ):
-                    guids.append(thing + subdir)
-        return guids
+
+    @staticmethod
+    def get_guid_pool_entries(location: str) -> list:
+        """
+        Will return a list of the complete pre-provisioned guid
+        workspaces.  The ones still being cloned are hidden (dot)
+        directories and are not returned.
+        """
+        pool_dir = SetupVtpDemoOperation.get_guid_pool_dir(location)
+        if not os.path.isdir(pool_dir):
+            return []
+        return [entry for entry in os.listdir(pool_dir) if not entry.startswith(".")]
 
     def __init__(
         self,
@@ -78,6 +95,10 @@ class SetupVtpDemoOperation(Operation):
         # The absolute path to the local bare clone of the upstream
         # GitHub ElectionData remote repo
         self.tabulation_local_upstream_absdir = ""
+        # How the guid workspaces are cloned from the above - either
+        # "full" (a regular clone) or "shared" (a 'git clone --shared'
+        # that borrows the objects of the above)
+        self.guid_clone_mode = "full"
 
     def __repr__(self):
         """Boilerplate"""
@@ -88,29 +109,165 @@ class SetupVtpDemoOperation(Operation):
             + self.tabulation_local_upstream_absdir
         )
 
-    def create_client_repos(self, clone_dirs, upstream_url):
+    def create_client_repos(self, clone_dirs, upstream_url, shared=False):
         """
         Create demo clients workspaces.  The first arg is an list of
         directories in which to create the clone.  The second arg is
-        the remote URL which can be a path
+        the remote URL which can be a path.  If shared is set, the
+        clones borrow the objects of the (local) upstream via 'git
+        clone --shared' rather than copying them.
         """
         # Now locally clone those as needed.  With the python/poetry
         # local install idiom, the demo location no longer needs the
         # submodules to be cloned.
+        clone_cmd = ["git", "clone"] + (["--shared"] if shared else [])
         for clone_dir in clone_dirs:
             if not self.printonly:
                 with self.changed_cwd(clone_dir):
                     self.shell_out(
-                        ["git", "clone", upstream_url],
+                        clone_cmd + [upstream_url],
                         check=True,
                     )
             else:
                 self.imprimir(f"Entering dir ({clone_dir}):", 5)
-                self.imprimir(f"Running git clone {upstream_url}", 3)
+                self.imprimir(f"Running {' '.join(clone_cmd)} {upstream_url}", 3)
                 self.imprimir(f"Leaving dir ({clone_dir}):", 5)
 
-    def create_a_guid_workspace_folder(self, location: str):
-        """creates guid workspace"""
+    def get_clone_name(self) -> str:
+        """
+        Return the directory name of a workspace cloned from the
+        tabulation server bare repo (what 'git clone' names it)
+        """
+        return os.path.basename(self.tabulation_local_upstream_absdir).removesuffix(
+            ".git"
+        )
+
+    def share_tabulation_server_objects(self):
+        """
+        A 'git clone --shared' workspace does not have its own copy of
+        the objects it borrows from the tabulation server bare repo,
+        so the bare repo must never prune an object even when it
+        becomes unreachable there (for example a deleted CVR branch
+        that a workspace still has a remote ref to).
+        """
+        self.shell_out(
+            [
+                "git",
+                "-C",
+                self.tabulation_local_upstream_absdir,
+                "config",
+                "gc.pruneExpire",
+                "never",
+            ],
+            check=True,
+            incoming_printlevel=5,
+        )
+
+    def provision_a_guid_pool_entry(self, location: str):
+        """
+        Pre-provision one guid workspace in the pool.  The workspace
+        is cloned in a hidden directory that is then renamed into the
+        pool so that only complete workspaces are handed out.  Note -
+        this does not change the CWD as the pool is nominally
+        refilled from a background thread.
+        """
+        pool_dir = SetupVtpDemoOperation.get_guid_pool_dir(location)
+        os.makedirs(pool_dir, exist_ok=True)
+        entry = secrets.token_hex(8)
+        hidden_dir = os.path.join(pool_dir, "." + entry)
+        os.mkdir(hidden_dir)
+        clone_cmd = ["git", "clone"]
+        if self.guid_clone_mode == "shared":
+            clone_cmd.append("--shared")
+        try:
+            self.shell_out(
+                clone_cmd
+                + [
+                    "--quiet",
+                    self.tabulation_local_upstream_absdir,
+                    os.path.join(hidden_dir, self.get_clone_name()),
+                ],
+                check=True,
+                incoming_printlevel=5,
+            )
+        except Exception:
+            shutil.rmtree(hidden_dir, ignore_errors=True)
+            raise
+        os.rename(hidden_dir, os.path.join(pool_dir, entry))
+        self.imprimir(f"provisioned guid pool entry ({entry})", 5)
+
+    def refill_guid_pool(self, location: str, guid_pool_size: int):
+        """
+        Pre-provision guid workspaces until the pool holds
+        guid_pool_size of them
+        """
+        while (
+            len(SetupVtpDemoOperation.get_guid_pool_entries(location)) < guid_pool_size
+        ):
+            self.provision_a_guid_pool_entry(location)
+
+    def start_guid_pool_refill(
+        self, location: str, guid_pool_size: int
+    ) -> threading.Thread:
+        """
+        Refill the pool in a background thread and return the thread.
+        At most one refill of a pool runs at a time in a process.  The
+        thread is not a daemon thread so that a command line
+        invocation completes the refill before exiting.
+        """
+        pool_dir = SetupVtpDemoOperation.get_guid_pool_dir(location)
+        with SetupVtpDemoOperation._pool_refills_lock:
+            refill = SetupVtpDemoOperation._pool_refills.get(pool_dir)
+            if refill and refill.is_alive():
+                return refill
+            # A separate operation so that the output of the refill
+            # does not end up in the output of this one
+            refiller = SetupVtpDemoOperation(
+                self.election_data_dir, self.verbosity, self.printonly
+            )
+            refiller.tabulation_local_upstream_absdir = (
+                self.tabulation_local_upstream_absdir
+            )
+            refiller.guid_clone_mode = self.guid_clone_mode
+            refill = threading.Thread(
+                target=refiller.refill_guid_pool,
+                args=(location, guid_pool_size),
+                name="vtp-guid-pool-refill",
+            )
+            refill.start()
+            SetupVtpDemoOperation._pool_refills[pool_dir] = refill
+        return refill
+
+    def take_a_guid_pool_entry(self, location: str, guid_dir: str) -> bool:
+        """
+        Move a pre-provisioned workspace from the pool into the (new
+        and empty) guid_dir.  Returns False if the pool is empty.
+        Since a rename is atomic, concurrent callers (threads or
+        web-api worker processes) never get the same workspace.
+        """
+        pool_dir = SetupVtpDemoOperation.get_guid_pool_dir(location)
+        clone_name = self.get_clone_name()
+        for entry in SetupVtpDemoOperation.get_guid_pool_entries(location):
+            entry_dir = os.path.join(pool_dir, entry)
+            try:
+                os.rename(
+                    os.path.join(entry_dir, clone_name),
+                    os.path.join(guid_dir, clone_name),
+                )
+            except FileNotFoundError:
+                # Another caller got there first
+                continue
+            os.rmdir(entry_dir)
+            self.imprimir(f"using guid pool entry ({entry})", 5)
+            return True
+        return False
+
+    def create_a_guid_workspace_folder(self, location: str, guid_pool_size: int = 0):
+        """
+        creates guid workspace.  If guid_pool_size is set, a
+        pre-provisioned workspace is taken from the pool when there is
+        one and the pool is then refilled in the background.
+        """
         guid = secrets.token_hex(20)
         folder1 = guid[:2]
         folder2 = guid[2:]
@@ -148,7 +305,9 @@ class SetupVtpDemoOperation(Operation):
                             "could not create a GUID directory after 3 tries - giving up"
                         ) from exc
                     # otherwise try again
-                    folder2 = secrets.token_hex(18)
+                    folder2 = secrets.token_hex(19)
+                    guid = folder1 + folder2
+                    path2 = os.path.join(path1, folder2)
                     continue
                 # success
                 break
@@ -156,20 +315,41 @@ class SetupVtpDemoOperation(Operation):
             self.imprimir(f"creating ({path1}) if it does not exist", 5)
             self.imprimir(f"creating ({path2}) if it does not exist", 5)
 
-        # Clone the repo from the local clone, not the GitHub remote clone
-        self.create_client_repos([path2], self.tabulation_local_upstream_absdir)
+        # Clone the repo from the local clone, not the GitHub remote
+        # clone - unless there is a pre-provisioned one
+        if self.printonly or not (
+            guid_pool_size and self.take_a_guid_pool_entry(location, path2)
+        ):
+            self.create_client_repos(
+                [path2],
+                self.tabulation_local_upstream_absdir,
+                shared=self.guid_clone_mode == "shared",
+            )
+        if not self.printonly:
+            if guid_pool_size:
+                self.start_guid_pool_refill(location, guid_pool_size)
+            # Track the new workspace and evict the least recently
+            # used ones beyond the GUID_WORKSPACE limits
+            guid_manager = GuidWorkspaceManager.get_manager(location, self)
+            guid_manager.add_workspace(guid)
+            guid_manager.evict()
         # return the GUID
         self.imprimir(f"returning guid ({guid})", 5)
         return guid
 
-    # pylint: disable=duplicate-code
+    # pylint: disable=duplicate-code, too-many-arguments, too-many-branches
     def run(
         self,
         scanners: int = 4,
         guid_client_store: bool = False,
         location: str = Globals.get("DEFAULT_RUNTIME_LOCATION"),
+        guid_clone_mode: str = "full",
+        guid_pool_size: int = 0,
     ) -> str:
         """Main function - see -h for more info"""
+        if guid_clone_mode not in ["full", "shared"]:
+            raise ValueError(f"Unsupported guid clone mode ({guid_clone_mode})")
+        self.guid_clone_mode = guid_clone_mode
 
         # Create a VTP ElectionData object if one does not already exist
         the_election_config = ElectionConfig.configure_election(
@@ -200,7 +380,9 @@ class SetupVtpDemoOperation(Operation):
         bare_clone_path = os.path.dirname(self.tabulation_local_upstream_absdir)
         # When creating a GUID workspace ...
         if guid_client_store:
-            return self.create_a_guid_workspace_folder(location)
+            if guid_clone_mode == "shared" and not self.printonly:
+                self.share_tabulation_server_objects()
+            return self.create_a_guid_workspace_folder(location, guid_pool_size)
 
         # ... or the initial setup of the non-GUID client and server workspaces
 
@@ -266,6 +448,15 @@ class SetupVtpDemoOperation(Operation):
         # create the client workspaces.
         self.create_client_repos(clone_dirs, self.tabulation_local_upstream_absdir)
 
+        # Sixth, pre-provision the pool of guid workspaces
+        if guid_pool_size:
+            if self.printonly:
+                self.imprimir(f"Pre-provisioning {guid_pool_size} guid workspaces", 3)
+            else:
+                if guid_clone_mode == "shared":
+                    self.share_tabulation_server_objects()
+                self.refill_guid_pool(location, guid_pool_size)
+
         # return something
         return ""
 
@@ -49,27 +49,13 @@ class ShowContestsOperation(Operation):
         """
         errors = 0
         json_errors = []
-        input_data = "\n".join(digests.split(",")) + "\n"
-        with self.changed_cwd(the_election_config.get("git_rootdir")):
-            output_lines = (
-                self.shell_out(
-                    [
-                        "git",
-                        "cat-file",
-                        "--batch-check=%(objectname) %(objecttype)",
-                        "--buffer",
-                    ],
-                    incoming_printlevel=5,
-                    input=input_data,
-                    text=True,
-                    check=True,
-                    capture_output=True,
-                )
-                .stdout.strip()
-                .splitlines()
-            )
-        for count, line in enumerate(output_lines):
-            digest, commit_type = line.split()
+        results = self.git_cat_file(
+            digests.split(","),
+            the_election_config.get("git_rootdir"),
+            incoming_printlevel=5,
+        )
+        for count, result in enumerate(results):
+            digest, commit_type = result["objectname"], result["objecttype"]
             if commit_type == "missing":
                 if webapi:
                     json_errors.append(f"missing digest: n={count} digest={digest}")
@@ -167,14 +153,14 @@ class ShowContestsOperation(Operation):
             else:
                 # get the contents
                 ballot_check = (
-                    self.shell_out(
-                        ["git", "show", receipt_digest + ":" + output_lines[1]],
+                    self.git_cat_file(
+                        [receipt_digest + ":" + output_lines[1]],
+                        the_election_config.get("git_rootdir"),
+                        contents=True,
                         incoming_printlevel=5,
-                        text=True,
-                        check=True,
-                        capture_output=True,
-                    )
-                    .stdout.strip()
+                    )[0]["contents"]
+                    .decode("utf8")
+                    .strip()
                     .splitlines()
                 )
         # convert this to an array of arrays
@@ -20,17 +20,40 @@
 """Logic of operation for tallying contests."""
 
 # Standard imports
+from concurrent.futures import ProcessPoolExecutor
 
 # Project imports
 from vtp.core.ballot import Ballot
+from vtp.core.cvr_index import CvrIndex
 from vtp.core.election_config import ElectionConfig
 from vtp.core.exceptions import TallyException
+from vtp.core.readonly_snapshot_pool import ReadOnlySnapshotPool
 from vtp.core.tally import Tally
 
 # Local imports
 from .operation import Operation
 
 
+def tally_contest_job(
+    operation_args: dict, contest_batch: list, checks: list, rcv_engine: str
+) -> list:
+    """
+    The ProcessPoolExecutor worker of TallyContestsOperation.run when
+    jobs > 1.  Will tally one contest in a TallyContestsOperation that
+    accumulates (rather than prints) its output and returns those
+    (unformatted) output records so that the parent can print them in
+    contest order.
+    """
+    operation = TallyContestsOperation(**operation_args, stdout_printing=False)
+    operation.tally_a_contest(
+        Tally(contest_batch[0], operation, rcv_engine=rcv_engine),
+        len(contest_batch),
+        contest_batch,
+        checks,
+    )
+    return list(operation.output_sink.records)
+
+
 # pylint: disable=too-few-public-methods
 class TallyContestsOperation(Operation):
     """
@@ -39,84 +62,252 @@ class TallyContestsOperation(Operation):
     description (immediately below this) in the source file.
     """
 
-    # pylint: disable=duplicate-code
+    def __init__(
+        self,
+        election_data_dir: str = "",
+        verbosity: int = 3,
+        printonly: bool = False,
+        stdout_printing: bool = True,
+        output_style: str = "text",
+    ):
+        """
+        Primarily to module-ize the scripts and keep things simple,
+        idiomatic, and in different namespaces.
+        """
+        super().__init__(
+            election_data_dir, verbosity, printonly, stdout_printing, output_style
+        )
+        # The streaming tallies (keyed on contest uid) that are kept
+        # alive across run calls along with the CVR index generation
+        # they were counted against.
+        self.live_tallies = {}
+        self.live_generation = ""
+
+    def update_live_tallies(
+        self, cvr_index: CvrIndex, checks: list, rcv_engine: str = "classic"
+    ) -> dict:
+        """
+        Will feed the streaming tallies just the CVRs that have been
+        indexed since the tallies were last updated.  The tallies are
+        either the ones kept alive in this object from a previous run
+        or are loaded from the on disk checkpoints.  If the CVR index
+        was rebuilt the tallies start over.  Saves the checkpoints
+        when anything changed.  The tallies use the rcv_engine for
+        their RCV rounds.
+        """
+        if self.live_generation != cvr_index.index["generation"]:
+            self.live_tallies = {
+                uid: Tally.from_checkpoint(checkpoint, self, rcv_engine)
+                for uid, checkpoint in cvr_index.load_tally_checkpoints().items()
+            }
+            self.live_generation = cvr_index.index["generation"]
+        new_batches = cvr_index.get_contest_batches(
+            {uid: tally.get("cvr_count") for uid, tally in self.live_tallies.items()}
+        )
+        for the_tally in self.live_tallies.values():
+            the_tally.rcv_engine = rcv_engine
+        changed = False
+        for uid, contest_batch in new_batches.items():
+            if not contest_batch:
+                continue
+            changed = True
+            if uid not in self.live_tallies:
+                self.live_tallies[uid] = Tally(
+                    contest_batch[0], self, streaming=True, rcv_engine=rcv_engine
+                )
+            try:
+                self.live_tallies[uid].add_cvrs(contest_batch, checks)
+            except TallyException as tally_error:
+                self.imprimir(f"[ERROR]: {tally_error}")
+                self.imprimir("Continuing with other contests ...")
+        self.imprimir(
+            f"Streamed {sum(len(batch) for batch in new_batches.values())} "
+            "new contests into the live tallies",
+            4,
+        )
+        if changed:
+            cvr_index.save_tally_checkpoints(
+                {
+                    uid: tally.get_checkpoint()
+                    for uid, tally in self.live_tallies.items()
+                }
+            )
+        return self.live_tallies
+
+    def tally_a_contest(
+        self, the_tally: Tally, scanned: int, contest_batch: list, checks: list
+    ):
+        """
+        Will tally and print the results of one contest.  A
+        contest_batch of None means the_tally is a live streaming
+        tally whose results only need to be updated.
+        """
+        contest = the_tally.get("contest")
+        self.imprimir(
+            f"Scanned {scanned} contests "
+            f"for contest ({contest['contest_name']}) "
+            f"uid={contest['uid']}, "
+            f"tally={contest['tally']}, "
+            f"max_selections={the_tally.get('max_selections')}, "
+            f"win_by>{the_tally.get('win_by')}"
+        )
+        # Tally all the contests for this contest
+        #        import pdb; pdb.set_trace()
+        try:
+            if contest_batch is None:
+                with self.timed("tally", "update_results"):
+                    the_tally.update_results(checks)
+            else:
+                the_tally.tallyho(contest_batch, checks)
+            # Print stuff
+            with self.timed("tally", "print_results"):
+                the_tally.print_results()
+        except TallyException as tally_error:
+            self.imprimir(f"[ERROR]: {tally_error}")
+            self.imprimir("Continuing with other contests ...")
+
+    def tally_contests_in_parallel(
+        self,
+        contest_uids: list,
+        contest_batches: dict,
+        checks: list,
+        jobs: int,
+        rcv_engine: str,
+    ):
+        """
+        A generator that fans the contests out to a pool of jobs
+        processes (see tally_contest_job) and yields each contest's
+        output records in contest_uids order.
+        """
+        operation_args = {
+            "election_data_dir": self.election_data_dir,
+            "verbosity": self.verbosity,
+            "printonly": self.printonly,
+            "output_style": self.output_style,
+        }
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(
+                    tally_contest_job,
+                    operation_args,
+                    contest_batches[uid],
+                    checks,
+                    rcv_engine,
+                )
+                for uid in contest_uids
+            ]
+            for future in futures:
+                yield future.result()
+
+    # pylint: disable=duplicate-code,too-many-locals,too-many-arguments,too-many-branches
     def run(
         self,
         contest_uid: str = "",
         track_contests: str = "",
+        rebuild_cvr_index: bool = False,
+        streaming: bool = False,
+        jobs: int = 1,
+        rcv_engine: str = "classic",
     ) -> list:
-        """Main function - see -h for more info"""
+        """
+        Main function - see -h for more info.  If rebuild_cvr_index is
+        True, the on disk CVR index is rebuilt from the entire main
+        history rather than being incrementally updated.
+
+        If streaming is True, the tallies are kept alive (in this
+        object and as on disk checkpoints) and only the CVRs merged
+        since the last run are counted - the results are then
+        recomputed from the live tallies.  This is for a live results
+        display that re-runs the tally after each merge pass.  Note -
+        in streaming mode track_contests only reports on the CVRs
+        counted in this run.
+
+        If jobs is greater than 1 (and not streaming), the contests
+        are tallied in a pool of that many processes.  The output is
+        still printed in contest order and is the same as the serial
+        (default) tally.
+
+        The rcv_engine selects how the RCV rounds are run - see Tally.
+        """
 
         # Create a VTP ElectionData object if one does not already exist
-        the_election_config = ElectionConfig.configure_election(
-            self, self.election_data_dir
-        )
+        with self.timed("tally", "configure_election"):
+            the_election_config = ElectionConfig.configure_election(
+                self, self.election_data_dir
+            )
 
         # git pull the ElectionData repo so to get the latest set of
-        # remote CVRs branches.
+        # remote CVRs branches - unless this is a (detached) read-only
+        # snapshot, which its ReadOnlySnapshotPool keeps up to date.
         a_ballot = Ballot(self)
-        with self.changed_cwd(a_ballot.get_cvr_parent_dir(the_election_config)):
-            self.shell_out(
-                ["git", "pull"],
-                check=True,
-                incoming_printlevel=5,
-            )
+        if not ReadOnlySnapshotPool.is_snapshot(the_election_config.get("git_rootdir")):
+            with self.changed_cwd(a_ballot.get_cvr_parent_dir(the_election_config)):
+                self.shell_out(
+                    ["git", "pull"],
+                    check=True,
+                    incoming_printlevel=5,
+                )
 
         # Will process all the CVR commits on the main branch and tally
         # all the contests found.  Note - even if a contest is specified,
-        # as a first pass it is easier to just perform a git log across
-        # all the contests and then filter later for the contest of
-        # interest than to try to create a git grep query against the CVR
-        # payload.  Note - --reverse is set so to go in parent to child order
-        # (though either order is valid, voters probably will understand
-        # parent to child order better)
-        contest_batches = self.cvr_parse_git_log_output(
-            [
-                "git",
-                "log",
-                "--topo-order",
-                "--no-merges",
-                "--reverse",
-                "--pretty=format:%H%B",
-            ],
-            the_election_config,
-            incoming_printlevel=5,
-        )
+        # as a first pass it is easier to just index all the contests
+        # and then filter later for the contest of interest than to try
+        # to create a git grep query against the CVR payload.  Note -
+        # the index is in git log --reverse order so to go in parent to
+        # child order (though either order is valid, voters probably
+        # will understand parent to child order better).  Also note that
+        # the index only needs to parse the commits merged since the
+        # last tally - see CvrIndex.
+        with self.timed("tally", "cvr_index_update"):
+            cvr_index = CvrIndex(self, the_election_config)
+            cvr_index.update(rebuild=rebuild_cvr_index)
+        if streaming:
+            with self.timed("tally", "update_live_tallies"):
+                live_tallies = self.update_live_tallies(
+                    cvr_index, track_contests, rcv_engine
+                )
+            contest_uids = sorted(live_tallies)
+        else:
+            with self.timed("tally", "get_contest_batches"):
+                contest_batches = cvr_index.get_contest_batches()
+            contest_uids = sorted(contest_batches)
 
         # Note - though plurality voting can be counted within the above
         # loop, tallies such as rcv cannot.  So far now, just count
         # everything in a separate loop.
-        for count, contest_batch in enumerate(sorted(contest_batches)):
-            # Maybe skip
-            if contest_uid != "":
-                if (
-                    contest_batches[contest_batch][0]["contestCVR"]["uid"]
-                    != contest_uid
-                ):
-                    continue
-            # Create a Tally object for this specific contest
-            the_tally = Tally(contest_batches[contest_batch][0], self)
+        contest_uids = [uid for uid in contest_uids if contest_uid in ("", uid)]
+        parallel_outputs = None
+        if jobs > 1 and not streaming:
+            parallel_outputs = self.tally_contests_in_parallel(
+                contest_uids, contest_batches, track_contests, jobs, rcv_engine
+            )
+        for count, uid in enumerate(contest_uids):
             if contest_uid == "":
                 if count > 0:
                     self.imprimir_formatting("empty_line")
                 self.imprimir_formatting("horizontal_line")
-            self.imprimir(
-                f"Scanned {len(contest_batches[contest_batch])} contests "
-                f"for contest ({contest_batches[contest_batch][0]['contestCVR']['contest_name']}) "
-                f"uid={contest_batches[contest_batch][0]['contestCVR']['uid']}, "
-                f"tally={contest_batches[contest_batch][0]['contestCVR']['tally']}, "
-                f"max_selections={the_tally.get('max_selections')}, "
-                f"win_by>{the_tally.get('win_by')}"
-            )
-            # Tally all the contests for this contest
-            #        import pdb; pdb.set_trace()
-            try:
-                the_tally.tallyho(contest_batches[contest_batch], track_contests)
-                # Print stuff
-                the_tally.print_results()
-            except TallyException as tally_error:
-                self.imprimir(f"[ERROR]: {tally_error}")
-                self.imprimir("Continuing with other contests ...")
+            if parallel_outputs is not None:
+                # Already tallied - just print (or accumulate) it
+                with self.timed("tally", "parallel_jobs"):
+                    records = next(parallel_outputs)
+                self.output_sink.extend(records)
+                continue
+            # Create a Tally object for this specific contest (or use
+            # the live one)
+            if streaming:
+                self.tally_a_contest(
+                    live_tallies[uid],
+                    live_tallies[uid].get("cvr_count"),
+                    None,
+                    track_contests,
+                )
+            else:
+                self.tally_a_contest(
+                    Tally(contest_batches[uid][0], self, rcv_engine=rcv_engine),
+                    len(contest_batches[uid]),
+                    contest_batches[uid],
+                    track_contests,
+                )
         # can always return the output
         return self.stdout_output
 
@@ -27,6 +27,7 @@ import re
 from vtp.core.ballot import Ballot
 from vtp.core.contest import Contest
 from vtp.core.election_config import ElectionConfig
+from vtp.core.readonly_snapshot_pool import ReadOnlySnapshotPool
 
 # Local imports
 from .operation import Operation
@@ -46,34 +47,18 @@ class VerifyBallotReceiptOperation(Operation):
         """Will scan the supplied ballot lines for invalid digests.  Will
         print and return the invalid digests.
         """
-        input_data = ""
-        for line in lines:
-            input_data += "\n".join(line) + "\n"
-        with self.changed_cwd(the_election_config.get("git_rootdir")):
-            results = (
-                self.shell_out(
-                    [
-                        "git",
-                        "cat-file",
-                        "--buffer",
-                        "--batch-check=%(objectname) %(objecttype)",
-                    ],
-                    incoming_printlevel=5,
-                    input=input_data,
-                    text=True,
-                    check=True,
-                    capture_output=True,
-                )
-                .stdout.strip()
-                .splitlines()
-            )
+        results = self.git_cat_file(
+            [digest for line in lines for digest in line],
+            the_election_config.get("git_rootdir"),
+            incoming_printlevel=5,
+        )
         # Print any invalid digest info
         row_length = len(uids)
         # Mmm - 1 based?
         row = 1
         column = 1
-        for line in results:
-            digest, commit_type = line.split()
+        for result in results:
+            digest, commit_type = result["objectname"], result["objecttype"]
             if commit_type == "missing":
                 self.imprimir(
                     f"missing digest: row {row} column {column} "
@@ -117,18 +102,16 @@ class VerifyBallotReceiptOperation(Operation):
             legit_row = [dig for dig in row if dig not in error_digests]
             if len(legit_row) == len(row):
                 # all the digests are legit
-                cvrs = self.cvr_parse_git_log_output(
-                    ["git", "log", "--no-walk", "--pretty=format:%H%B"] + row,
+                cvrs = self.cvr_read_commits(
+                    row,
                     the_election_config,
-                    grouped_by_uid=False,
                     incoming_printlevel=5,
                 )
             elif len(legit_row) > 0:
                 # Only some are legitimate
-                cvrs = self.cvr_parse_git_log_output(
-                    ["git", "log", "--no-walk", "--pretty=format:%H%B"] + legit_row,
+                cvrs = self.cvr_read_commits(
+                    legit_row,
                     the_election_config,
-                    grouped_by_uid=False,
                     incoming_printlevel=5,
                 )
             else:
@@ -163,6 +146,28 @@ class VerifyBallotReceiptOperation(Operation):
                     continue
         return (requested_row, requested_digests)
 
+    def get_contest_votes(
+        self, the_election_config: ElectionConfig, requested_row: dict
+    ) -> tuple:
+        """
+        Stream the CVRs counting the contests per uid and noting the
+        git log offset of the requested row's contests rather than
+        holding every CVR in memory.  Returns the (votes per uid,
+        (offset, digest, cvr) per requested uid) dictionaries.
+        """
+        contest_votes = {}
+        found_offsets = {}
+        for digest, cvr in self.cvr_stream_git_log(
+            ["git", "log", "--topo-order", "--no-merges"],
+            the_election_config,
+            incoming_printlevel=5,
+        ):
+            uid = cvr["contestCVR"]["uid"]
+            if digest in requested_row and uid not in found_offsets:
+                found_offsets[uid] = (contest_votes.get(uid, 0), digest, cvr)
+            contest_votes[uid] = contest_votes.get(uid, 0) + 1
+        return contest_votes, found_offsets
+
     # pylint: disable=too-many-locals
     def verify_ballot_receipt(
         self,
@@ -231,30 +236,24 @@ class VerifyBallotReceiptOperation(Operation):
             as well do that for all contests (unless one cat create the
             git grep query syntax to just pull the uids of interest).
             """
-            contest_batches = self.cvr_parse_git_log_output(
-                ["git", "log", "--topo-order", "--no-merges", "--pretty=format:%H%B"],
-                the_election_config,
-                incoming_printlevel=5,
+            contest_votes, found_offsets = self.get_contest_votes(
+                the_election_config, requested_row
             )
             unmerged_uids = {}
             for u_count, uid in enumerate(uids):
-                # For this contest loop over the reverse ordered CVRs (since it
+                # For this contest count from the reverse ordered CVRs (since it
                 # seems TBD that it makes sense to ballot #1 as the first ballot on
                 # main).
-                contest_votes = len(contest_batches[uid])
-                found = False
-                for c_count, contest in enumerate(contest_batches[uid]):
-                    if contest["digest"] in requested_row:
-                        self.imprimir(
-                            f"Contest '{contest['contestCVR']['uid']} - "
-                            f"{contest['contestCVR']['contest_name']}' "
-                            f"({contest['digest']}) is vote {contest_votes - c_count} out "
-                            f"of {contest_votes} votes",
-                            0,
-                        )
-                        found = True
-                        break
-                if found is False:
+                if uid in found_offsets:
+                    c_count, digest, cvr = found_offsets[uid]
+                    self.imprimir(
+                        f"Contest '{cvr['contestCVR']['uid']} - "
+                        f"{cvr['contestCVR']['contest_name']}' "
+                        f"({digest}) is vote {contest_votes[uid] - c_count} out "
+                        f"of {contest_votes[uid]} votes",
+                        0,
+                    )
+                else:
                     unmerged_uids[uid] = u_count
             if unmerged_uids:
                 truly_unmerged_uids = {
@@ -337,17 +336,22 @@ class VerifyBallotReceiptOperation(Operation):
         )
 
         # git pull the ElectionData repo so to get the latest set of
-        # remote CVRs branches
+        # remote CVRs branches - unless this is a (detached) read-only
+        # snapshot, which its ReadOnlySnapshotPool keeps up to date.
         a_ballot = Ballot(self)
-        with self.changed_cwd(a_ballot.get_cvr_parent_dir(the_election_config)):
-            self.shell_out(
-                ["git", "pull"],
-                check=True,
-                incoming_printlevel=5,
-            )
+        if not ReadOnlySnapshotPool.is_snapshot(the_election_config.get("git_rootdir")):
+            with self.changed_cwd(a_ballot.get_cvr_parent_dir(the_election_config)):
+                self.shell_out(
+                    ["git", "pull"],
+                    check=True,
+                    incoming_printlevel=5,
+                )
         # if ure uids, convert to the pretty print contest header values
         if uids:
-            receipt_data[0] = [Contest.get_uid_pp_name(uid) for uid in receipt_data[0]]
+            contest_uids = the_election_config.get("contest_uids")
+            receipt_data[0] = [
+                Contest.get_uid_pp_name(uid, contest_uids) for uid in receipt_data[0]
+            ]
 
         # Can read the receipt file directly without any Ballot info
         # import pdb; pdb.set_trace()